@@ -0,0 +1,35 @@
+"""Standalone benchmarks, run from the project directory with
+``python -m benchmarks.<name>``.
+
+Each benchmark works on a throwaway SQLite database created next to the
+real one, so it never touches ``db.sqlite3``.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lora_monitor.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(path=None, keep=False):
+    from django.db import connection
+
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="lora_bench_", suffix=".sqlite3")
+        os.close(fd)
+    old_name = connection.settings_dict['NAME']
+    connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}), 'NAME': str(path)}
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keep)
+    try:
+        yield connection
+    finally:
+        if keep:
+            connection.close()
+            connection.settings_dict['NAME'] = old_name
+        else:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
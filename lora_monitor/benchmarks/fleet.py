@@ -0,0 +1,261 @@
+"""Seeded synthetic fleet: N devices x M uplinks x K gateways.
+
+``FleetSpec`` describes the fleet; the same spec and seed always produce the
+same data. ``webhooks`` yields TTN v3 webhook bodies matching
+``devices.schemas`` in arrival order, for driving the ingestion paths.
+``seed_fleet`` writes the equivalent history straight into the database
+(raw ``executemany``, far faster than ingesting it) and then builds the
+rollups and device stats the dashboard reads.
+"""
+import base64
+import io
+import math
+import random
+import struct
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+
+@dataclass(frozen=True)
+class FleetSpec:
+    devices: int = 10
+    readings: int = 1000  # uplinks per device
+    gateways: int = 2  # gateways hearing every uplink
+    applications: int = 3
+    interval: timedelta = timedelta(minutes=5)
+    loss_rate: float = 0.02  # share of f_cnt values never received
+    start: datetime = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+    seed: int = 0
+
+    @property
+    def label(self):
+        return f"{self.devices}x{self.readings}x{self.gateways}"
+
+    @classmethod
+    def parse(cls, text, **kwargs):
+        """``"DEVICESxREADINGSxGATEWAYS"``, e.g. ``"100x1000x2"``."""
+        devices, readings, gateways = (int(part) for part in text.lower().split("x"))
+        return cls(devices=devices, readings=readings, gateways=gateways, **kwargs)
+
+    @property
+    def end(self):
+        return self.start + self.interval * self.readings
+
+
+def device_id(i):
+    return f"bench-{i}"
+
+
+def dev_eui(i):
+    return f"70B3D57E{i:08X}"
+
+
+def gateway_id(g):
+    return f"bench-gw-{g}"
+
+
+def gateway_eui(g):
+    return f"B827EBFFFE{g:06X}"
+
+
+def gateway_location(g):
+    return 53.1 + (g % 10) / 100, 18.0 + (g // 10) / 100, 40.0
+
+
+class Uplink:
+    """One synthetic uplink; the fields both generators need."""
+    __slots__ = ("device", "f_cnt", "timestamp", "temperature", "humidity", "pressure", "rx")
+
+    def __init__(self, device, f_cnt, timestamp, temperature, humidity, pressure, rx):
+        self.device = device
+        self.f_cnt = f_cnt
+        self.timestamp = timestamp
+        self.temperature = temperature
+        self.humidity = humidity
+        self.pressure = pressure
+        self.rx = rx  # [(gateway index, rssi, snr)]
+
+    @property
+    def frm_payload(self):
+        raw = struct.pack(">hHH", round(self.temperature * 10), round(self.humidity * 10),
+                          round(self.pressure * 10))
+        return base64.b64encode(raw).decode()
+
+
+def uplinks(spec, first=0, count=None):
+    """Yield ``Uplink`` objects for every device, round robin, in time order.
+
+    ``first``/``count`` select a window of rounds, so fresh uplinks can be
+    generated after an already seeded history.
+    """
+    rng = random.Random(spec.seed)
+    offsets = [rng.uniform(0, spec.interval.total_seconds()) for _ in range(spec.devices)]
+    base_temp = [rng.uniform(15, 25) for _ in range(spec.devices)]
+    base_rssi = [[rng.uniform(-115, -70) for _ in range(spec.gateways)] for _ in range(spec.devices)]
+    count = spec.readings - first if count is None else count
+
+    for n in range(first, first + count):
+        for i in range(spec.devices):
+            point = random.Random(hash((spec.seed, i, n)))
+            # f_cnt runs ahead of n by the uplinks lost so far (about loss_rate of them).
+            f_cnt = n + int(n * spec.loss_rate)
+            timestamp = spec.start + spec.interval * n + timedelta(seconds=offsets[i])
+            day = 2 * math.pi * (timestamp.timestamp() % 86400) / 86400
+            rx = [(g, round(base_rssi[i][g] + point.gauss(0, 3), 1), round(point.uniform(-5, 10), 2))
+                  for g in range(spec.gateways)]
+            yield Uplink(
+                device=i,
+                f_cnt=f_cnt,
+                timestamp=timestamp,
+                temperature=round(base_temp[i] + 5 * math.sin(day) + point.gauss(0, 0.3), 1),
+                humidity=round(min(100.0, max(0.0, 60 - 15 * math.sin(day) + point.gauss(0, 2))), 1),
+                pressure=round(1013 + 5 * math.sin(n / 500) + point.gauss(0, 0.5), 1),
+                rx=rx,
+            )
+
+
+def webhook_body(spec, uplink):
+    """TTN v3 ``as.up.data.forward`` webhook body for ``uplink``."""
+    received_at = uplink.timestamp.isoformat().replace("+00:00", "Z")
+    ids = {
+        "device_id": device_id(uplink.device),
+        "application_ids": {"application_id": f"bench-app-{uplink.device % spec.applications}"},
+        "dev_eui": dev_eui(uplink.device),
+        "dev_addr": f"260B{uplink.device:04X}"[-8:],
+    }
+    correlation_ids = [f"as:up:{uplink.device:08d}{uplink.f_cnt:010d}", f"gs:uplink:{uplink.f_cnt:020d}"]
+    rx_metadata = []
+    for g, rssi, snr in uplink.rx:
+        lat, lon, alt = gateway_location(g)
+        rx_metadata.append({
+            "gateway_ids": {"gateway_id": gateway_id(g), "eui": gateway_eui(g)},
+            "time": received_at,
+            "timestamp": int(uplink.timestamp.timestamp() * 1e6) % 2**32,
+            "rssi": rssi,
+            "channel_rssi": rssi,
+            "snr": snr,
+            "location": {"latitude": lat, "longitude": lon, "altitude": alt, "source": "SOURCE_REGISTRY"},
+            "uplink_token": base64.b64encode(f"{gateway_id(g)}:{uplink.f_cnt}".encode()).decode(),
+            "channel_index": uplink.f_cnt % 8,
+            "received_at": received_at,
+        })
+    return {
+        "name": "as.up.data.forward",
+        "time": received_at,
+        "identifiers": [{"device_ids": ids}],
+        "data": {
+            "@type": "type.googleapis.com/ttn.lorawan.v3.ApplicationUp",
+            "end_device_ids": ids,
+            "correlation_ids": correlation_ids,
+            "received_at": received_at,
+            "uplink_message": {
+                "f_port": 1,
+                "f_cnt": uplink.f_cnt,
+                "frm_payload": uplink.frm_payload,
+                "rx_metadata": rx_metadata,
+                "settings": {
+                    "data_rate": {"lora": {"bandwidth": 125000, "spreading_factor": 7, "coding_rate": "4/5"}},
+                    "frequency": "868100000",
+                    "timestamp": rx_metadata[0]["timestamp"] if rx_metadata else 0,
+                    "time": received_at,
+                },
+                "received_at": received_at,
+                "consumed_airtime": "0.056576s",
+                "network_ids": {"net_id": "000013", "ns_id": "EC656E0000000181", "tenant_id": "ttn",
+                                "cluster_id": "eu1", "cluster_address": "eu1.cloud.thethings.network"},
+            },
+        },
+        "correlation_ids": correlation_ids,
+        "origin": "ip-10-100-5-78.eu-west-1.compute.internal",
+        "context": {"tenant-id": "CgN0dG4="},
+        "visibility": {"rights": ["RIGHT_APPLICATION_TRAFFIC_READ"]},
+        "unique_id": f"01{uplink.device:012d}{uplink.f_cnt:012d}",
+    }
+
+
+def webhooks(spec, first=0, count=None):
+    for uplink in uplinks(spec, first, count):
+        yield webhook_body(spec, uplink)
+
+
+def create_devices(spec):
+    from devices.models import Device
+
+    Device.objects.bulk_create([
+        Device(device_id=device_id(i), dev_eui=dev_eui(i), application_id=f"bench-app-{i % spec.applications}")
+        for i in range(spec.devices)
+    ])
+    return list(Device.objects.order_by("pk").values_list("pk", flat=True))
+
+
+def create_gateways(spec):
+    from devices.models import Gateway
+
+    Gateway.objects.bulk_create([
+        Gateway(gateway_id=gateway_id(g), eui=gateway_eui(g), latitude=gateway_location(g)[0],
+                longitude=gateway_location(g)[1], altitude=gateway_location(g)[2])
+        for g in range(spec.gateways)
+    ])
+    return list(Gateway.objects.order_by("pk").values_list("pk", flat=True))
+
+
+def seed_fleet(connection, spec, aggregates=True, chunk=20000):
+    """Write the spec's history directly; with ``aggregates`` also rollups, stats and ``last_*`` fields."""
+    from django.db import transaction
+    from devices.models import Device, NetworkMetadata, SensorReading
+
+    device_pks = create_devices(spec)
+    gateway_pks = create_gateways(spec)
+    adapt = connection.ops.adapt_datetimefield_value
+    reading_sql = (
+        f'INSERT INTO {SensorReading._meta.db_table} '
+        '(device_id, timestamp, temperature, humidity, pressure, f_cnt, received_at, raw_payload, '
+        'decoded_payload_json) '
+        'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NULL)'
+    )
+    meta_sql = (
+        f'INSERT INTO {NetworkMetadata._meta.db_table} '
+        '(device_id, timestamp, gateway_id, rssi, snr, channel_index, uplink_token, received_at) '
+        'VALUES (%s, %s, %s, %s, %s, %s, NULL, %s)'
+    )
+
+    def flush(batch):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(reading_sql, [
+                (device_pks[u.device], ts, u.temperature, u.humidity, u.pressure, u.f_cnt, ts, u.frm_payload)
+                for u, ts in batch
+            ])
+            cursor.executemany(meta_sql, [
+                (device_pks[u.device], ts, gateway_pks[g], rssi, snr, u.f_cnt % 8, ts)
+                for u, ts in batch for g, rssi, snr in u.rx
+            ])
+
+    last = {}
+    batch = []
+    for uplink in uplinks(spec):
+        batch.append((uplink, adapt(uplink.timestamp)))
+        last[uplink.device] = uplink
+        if len(batch) >= chunk:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    if not aggregates:
+        return
+    from django.core.management import call_command
+    from devices.rollups import GRANULARITIES, compact_rollups
+
+    for granularity, _, _ in GRANULARITIES:
+        compact_rollups(granularity)
+    call_command("rebuild_device_stats", stdout=io.StringIO())
+    devices = Device.objects.in_bulk(device_pks)
+    for i, uplink in last.items():
+        device = devices[device_pks[i]]
+        device.last_seen = uplink.timestamp
+        device.last_fcnt = uplink.f_cnt
+        g, device.last_rssi, device.last_snr = uplink.rx[-1] if uplink.rx else (None, None, None)
+        device.last_gateway_id = gateway_id(g) if g is not None else None
+    Device.objects.bulk_update(devices.values(), ["last_seen", "last_fcnt", "last_rssi", "last_snr",
+                                                  "last_gateway_id"])
+
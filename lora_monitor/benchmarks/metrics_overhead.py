@@ -0,0 +1,75 @@
+"""CPU cost of the per-stage instrumentation on the webhook hot path.
+
+    python -m benchmarks.metrics_overhead --iterations 200000
+
+Times an empty ``devices.metrics.stage`` block against an empty ``with``
+block, counts the stages one webhook request goes through and reports the
+instrumentation cost per uplink.
+"""
+import argparse
+import json
+
+from . import benchmark_database, setup_django
+from .webhook_validation import cpu_per_call, sample_body
+
+
+class _Empty:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def stages_per_webhook():
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from devices.metrics import stage_duration
+    from devices.models import Device
+
+    def observed():
+        return sum(sum(series[:-1]) for items in stage_duration._snapshots() for _, series in items)
+
+    setup_test_environment()
+    with benchmark_database():
+        Device.objects.create(device_id="bench-1", dev_eui=f"{1:016X}", application_id="bench")
+        client = Client()
+        body = json.loads(sample_body())
+        client.post("/api/ttn/webhook/", body, content_type="application/json")  # loads the device
+        body["data"]["uplink_message"]["f_cnt"] += 1
+        body["data"]["uplink_message"]["received_at"] = "2025-11-26T10:05:00Z"
+        before = observed()
+        client.post("/api/ttn/webhook/", body, content_type="application/json")
+        return observed() - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=200000)
+    args = parser.parse_args()
+
+    setup_django()
+    from devices.metrics import stage
+
+    def empty():
+        with _Empty():
+            pass
+
+    def timed():
+        with stage("bench", "empty"):
+            pass
+
+    baseline = cpu_per_call(empty, args.iterations)
+    instrumented = cpu_per_call(timed, args.iterations)
+    per_stage = instrumented - baseline
+    stages = stages_per_webhook()
+    print(f"empty with block:     {baseline * 1e6:6.2f} us")
+    print(f"empty stage() block:  {instrumented * 1e6:6.2f} us (+{per_stage * 1e6:.2f} us)")
+    print(f"stages per webhook:   {stages}")
+    print(f"cost per uplink:      {stages * per_stage * 1e6:6.2f} us")
+
+
+if __name__ == '__main__':
+    main()
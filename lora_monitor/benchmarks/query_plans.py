@@ -0,0 +1,171 @@
+"""Query plans and latency of the device detail queries with and without the
+``(device, timestamp)`` indexes.
+
+    python -m benchmarks.query_plans --devices 20 --readings 100000
+
+seeds ``devices * readings`` sensor readings (and ``gateways`` metadata rows
+per reading) in arrival order, then runs every detail-page query twice: once
+with the time-series indexes dropped and once with them in place.
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from . import benchmark_database, setup_django
+
+
+def seed(connection, devices, readings, gateways, chunk=20000):
+    from devices.models import Device, Gateway, NetworkMetadata, SensorReading
+
+    Device.objects.bulk_create([
+        Device(device_id=f"bench-{i}", dev_eui=f"{i:016X}", application_id="bench")
+        for i in range(devices)
+    ])
+    device_pks = list(Device.objects.order_by('pk').values_list('pk', flat=True))
+    Gateway.objects.bulk_create([
+        Gateway(gateway_id=f"gw-{g}", latitude=53.1 + g / 100, longitude=18.0, altitude=0)
+        for g in range(gateways)
+    ])
+    gateway_pks = list(Gateway.objects.order_by('pk').values_list('pk', flat=True))
+
+    reading_sql = (
+        f'INSERT INTO {SensorReading._meta.db_table} '
+        '(device_id, timestamp, temperature, humidity, pressure, f_cnt, raw_payload, decoded_payload_json) '
+        'VALUES (%s, %s, %s, %s, %s, %s, NULL, NULL)'
+    )
+    meta_sql = (
+        f'INSERT INTO {NetworkMetadata._meta.db_table} '
+        '(device_id, timestamp, gateway_id, rssi, snr, channel_index, uplink_token, received_at) '
+        'VALUES (%s, %s, %s, %s, %s, 0, NULL, %s)'
+    )
+    start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+    def rows():
+        for n in range(readings):
+            ts = connection.ops.adapt_datetimefield_value(start + timedelta(minutes=5 * n))
+            for pk in device_pks:
+                yield pk, ts, n
+
+    with connection.cursor() as cursor:
+        batch = []
+        for pk, ts, n in rows():
+            batch.append((pk, ts, n))
+            if len(batch) >= chunk:
+                _flush(cursor, reading_sql, meta_sql, batch, gateway_pks)
+                batch = []
+        if batch:
+            _flush(cursor, reading_sql, meta_sql, batch, gateway_pks)
+
+
+def _flush(cursor, reading_sql, meta_sql, batch, gateway_pks):
+    from django.db import transaction
+
+    with transaction.atomic():
+        cursor.executemany(reading_sql, [
+            (pk, ts, 20.0 + (n % 50) / 10, 50.0, 1013.0, n % 65536)
+            for pk, ts, n in batch
+        ])
+        cursor.executemany(meta_sql, [
+            (pk, ts, gateway_pk, -90.0 - g, 7.0, ts)
+            for pk, ts, n in batch for g, gateway_pk in enumerate(gateway_pks)
+        ])
+
+
+def detail_queries(device):
+    from django.db.models import Avg
+    from devices.models import NetworkMetadata, SensorReading
+
+    readings = SensorReading.objects.filter(device=device)
+    metadata = NetworkMetadata.objects.filter(device=device)
+    week_ago = readings.order_by('-timestamp').values_list('timestamp', flat=True)[0] - timedelta(days=7)
+    return {
+        "readings ordered by timestamp": (
+            readings.order_by('timestamp').values_list('timestamp', 'f_cnt', 'temperature'),
+            lambda qs: sum(1 for _ in qs.iterator(chunk_size=5000)),
+        ),
+        "latest 50 readings": (
+            readings.order_by('-timestamp').values_list('timestamp', 'temperature')[:50],
+            list,
+        ),
+        "readings in last 7 days": (
+            readings.filter(timestamp__gte=week_ago).order_by('timestamp').values_list('timestamp', 'temperature'),
+            list,
+        ),
+        "metadata avg rssi/snr": (
+            metadata,
+            lambda qs: qs.aggregate(avg_rssi=Avg('rssi'), avg_snr=Avg('snr')),
+        ),
+        "metadata avg rssi/snr in last 7 days": (
+            metadata.filter(timestamp__gte=week_ago),
+            lambda qs: qs.aggregate(avg_rssi=Avg('rssi'), avg_snr=Avg('snr')),
+        ),
+        "metadata count": (metadata, lambda qs: qs.count()),
+    }
+
+
+def measure(device, repeat):
+    results = {}
+    for name, (queryset, run) in detail_queries(device).items():
+        plan = queryset.explain()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run(queryset.all())
+            timings.append(time.perf_counter() - started)
+        results[name] = (plan, statistics.median(timings))
+    return results
+
+
+def time_series_indexes():
+    from devices.models import NetworkMetadata, SensorReading
+
+    return [(model, index) for model in (SensorReading, NetworkMetadata) for index in model._meta.indexes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--readings', type=int, default=50000, help='readings per device')
+    parser.add_argument('--gateways', type=int, default=2, help='gateways hearing each uplink')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--db', help='database file to use (kept between runs)')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from devices.models import Device
+
+    with benchmark_database(args.db, keep=bool(args.db)):
+        if not Device.objects.exists():
+            started = time.perf_counter()
+            seed(connection, args.devices, args.readings, args.gateways)
+            print(f"Seeded {args.devices * args.readings} readings in {time.perf_counter() - started:.1f}s")
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        device = Device.objects.order_by('pk')[Device.objects.count() // 2]
+        indexes = time_series_indexes()
+
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.remove_index(model, index)
+        before = measure(device, args.repeat)
+
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.add_index(model, index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        after = measure(device, args.repeat)
+
+    for name in before:
+        plan_before, t_before = before[name]
+        plan_after, t_after = after[name]
+        print(f"\n== {name}")
+        print(f"   without indexes: {t_before * 1000:9.2f} ms  | {plan_before.replace(chr(10), ' / ')}")
+        print(f"   with indexes:    {t_after * 1000:9.2f} ms  | {plan_after.replace(chr(10), ' / ')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Ingestion and dashboard benchmarks at several fleet sizes.
+
+    python -m benchmarks.suite --sizes 10x1000x2,100x2000x2 --json results.json
+    python -m benchmarks.suite --sizes 10x1000x2 --compare results.json
+
+For every ``DEVICESxREADINGSxGATEWAYS`` size a synthetic fleet
+(``benchmarks.fleet``) is seeded into a throwaway database. The suite then
+measures ``TTNWebhookView`` throughput with fresh uplinks and the latency and
+query counts of the device list, device detail, chart and gateway endpoints.
+``--json`` writes the results; ``--compare`` checks them against an earlier
+file and exits with status 1 when something got slower than ``--tolerance``
+allows or runs more queries.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from . import benchmark_database, setup_django
+from .fleet import FleetSpec, device_id, seed_fleet, webhooks
+
+# result key -> (metric, True when higher is better)
+COMPARED = {
+    "webhook": ("uplinks_per_second", True),
+    "device_list": ("median_ms", False),
+    "device_list_filtered": ("median_ms", False),
+    "device_detail": ("median_ms", False),
+    "chart_data": ("median_ms", False),
+    "gateway_list": ("median_ms", False),
+}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def count_queries(call):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as ctx:
+        call()
+    return len(ctx.captured_queries)
+
+
+def bench_webhook(client, spec, uplinks):
+    counted = 5
+    rounds = -(-(uplinks + counted) // spec.devices)
+    bodies = [json.dumps(body) for body in webhooks(spec, first=spec.readings, count=rounds)]
+
+    def post(body):
+        response = client.post("/api/ttn/webhook/", body, content_type="application/json")
+        assert response.status_code == 200, response.content
+
+    latencies = []
+    started = time.perf_counter()
+    for body in bodies[:uplinks]:
+        t = time.perf_counter()
+        post(body)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    # Counted once the device cache is warm, as in steady state.
+    queries = [count_queries(lambda: post(body)) for body in bodies[uplinks:uplinks + counted]]
+    return {
+        "uplinks": len(latencies),
+        "uplinks_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "queries": max(queries),
+    }
+
+
+def bench_get(client, url, repeat):
+    def get():
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+        if response.streaming:
+            b"".join(response.streaming_content)
+
+    get()  # warm-up
+    queries = count_queries(get)
+    latencies = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        get()
+        latencies.append(time.perf_counter() - t)
+    return {
+        "median_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "queries": queries,
+    }
+
+
+def run_size(spec, args):
+    from django.db import connection
+    from django.test import Client
+    from accounts.models import User
+    from devices.cache import device_cache, gateway_cache
+    from devices.dedup import recent_uplinks
+    from devices.models import Device
+
+    device_cache.clear()
+    gateway_cache.clear()
+    recent_uplinks.clear()
+    with benchmark_database():
+        started = time.perf_counter()
+        seed_fleet(connection, spec)
+        result = {"size": spec.label, "devices": spec.devices, "readings_per_device": spec.readings,
+                  "gateways": spec.gateways, "seed_seconds": round(time.perf_counter() - started, 2)}
+
+        client = Client()
+        client.force_login(User.objects.create_user("bench@example.com", "bench"))
+        device = Device.objects.get(device_id=device_id(spec.devices // 2))
+
+        result["device_list"] = bench_get(client, "/", args.repeat)
+        result["device_list_filtered"] = bench_get(
+            client, "/?application=bench-app-1&status=offline&sort=-last_seen&page=2", args.repeat)
+        result["device_detail"] = bench_get(client, f"/{device.pk}/", args.repeat)
+        result["chart_data"] = bench_get(client, f"/api/chart/?device={device.device_id}", args.repeat)
+        result["gateway_list"] = bench_get(client, "/gateways/?range=30d", args.repeat)
+        result["webhook"] = bench_webhook(client, spec, args.uplinks)
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions of ``results`` against ``baseline``."""
+    previous = {entry["size"]: entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        old = previous.get(entry["size"])
+        if old is None:
+            continue
+        for key, (metric, higher_is_better) in COMPARED.items():
+            if key not in old:
+                continue
+            new_value, old_value = entry[key][metric], old[key][metric]
+            limit = old_value * (1 - tolerance) if higher_is_better else old_value * (1 + tolerance)
+            if (new_value < limit) if higher_is_better else (new_value > limit):
+                regressions.append(f"{entry['size']} {key}.{metric}: {old_value} -> {new_value}")
+            if entry[key]["queries"] > old[key]["queries"]:
+                regressions.append(f"{entry['size']} {key}.queries: {old[key]['queries']} -> {entry[key]['queries']}")
+    return regressions
+
+
+def print_result(result):
+    print(f"== {result['size']} (seeded in {result['seed_seconds']}s)")
+    webhook = result["webhook"]
+    print(f"   webhook              {webhook['uplinks_per_second']:9.1f} uplinks/s  p50 {webhook['p50_ms']:8.2f} ms  "
+          f"p99 {webhook['p99_ms']:8.2f} ms  {webhook['queries']} queries/uplink")
+    for key in ("device_list", "device_list_filtered", "device_detail", "chart_data", "gateway_list"):
+        timing = result[key]
+        print(f"   {key:<20} median {timing['median_ms']:8.2f} ms  p95 {timing['p95_ms']:8.2f} ms  "
+              f"{timing['queries']} queries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='10x1000x2,100x1000x2',
+                        help='comma-separated DEVICESxREADINGSxGATEWAYS fleet sizes')
+    parser.add_argument('--uplinks', type=int, default=500, help='webhooks posted per size')
+    parser.add_argument('--repeat', type=int, default=20, help='timed requests per dashboard view')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='baseline results file to check against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative slowdown before --compare fails')
+    args = parser.parse_args()
+
+    setup_django()
+    import django
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    # End the synthetic history at the current hour so "online" and the
+    # default chart range see recent data, as on a live dashboard.
+    now = datetime.now(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    results = []
+    for size in args.sizes.split(','):
+        spec = FleetSpec.parse(size, seed=args.seed)
+        spec = FleetSpec.parse(size, seed=args.seed, start=now - spec.interval * spec.readings)
+        result = run_size(spec, args)
+        print_result(result)
+        results.append(result)
+
+    report = {
+        "generated_at": datetime.now(dt_timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Requests per second and latency of the sync and async webhook views under
+concurrent load.
+
+    python -m benchmarks.webhook_concurrency --requests 2000 --concurrency 50
+
+Both views are driven through Django's ASGI handler (``AsyncClient``), as
+they are under Daphne: ``concurrency`` workers post uplinks of ``devices``
+devices back to back on one event loop.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from . import benchmark_database, setup_django
+from .webhook_validation import sample_body
+
+VIEWS = [
+    ("sync  TTNWebhookView", "/api/ttn/webhook/"),
+    ("async TTNAsyncWebhookView", "/api/ttn/webhook/async/"),
+]
+
+
+async def run_load(path, bodies, concurrency):
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+    pending = iter(bodies)
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for body in pending:
+            started = time.perf_counter()
+            response = await client.post(path, body, content_type="application/json")
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies, errors
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=2000, help='uplinks per view')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--gateways', type=int, default=2)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import setup_test_environment
+    from devices.cache import device_cache
+    from devices.models import Device
+
+    setup_test_environment()  # lets AsyncClient's 'testserver' host through ALLOWED_HOSTS
+    with benchmark_database():
+        Device.objects.bulk_create([
+            Device(device_id=f"bench-{i}", dev_eui=f"{i:016X}", application_id="bench")
+            for i in range(args.devices)
+        ])
+        f_cnt = 0
+        for name, path in VIEWS:
+            device_cache.clear()
+            bodies = []
+            for _ in range(args.requests):
+                f_cnt += 1
+                bodies.append(sample_body(args.gateways, device=f_cnt % args.devices, f_cnt=f_cnt))
+            elapsed, latencies, errors = asyncio.run(run_load(path, bodies, args.concurrency))
+            print(f"{name}: {len(latencies) / elapsed:8.1f} req/s  "
+                  f"p50 {statistics.median(latencies) * 1000:7.2f} ms  "
+                  f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms  errors {errors}")
+
+
+if __name__ == '__main__':
+    main()
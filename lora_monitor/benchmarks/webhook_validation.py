@@ -0,0 +1,104 @@
+"""Per-request CPU of TTN webhook parsing and validation.
+
+    python -m benchmarks.webhook_validation --iterations 20000
+
+Compares the original path (DRF ``JSONParser`` into dicts, then
+``TTNWebhook.model_validate``) with the ingestion fast path
+(``ingest_webhook_adapter.validate_json`` on the raw body).
+"""
+import argparse
+import io
+import json
+import time
+
+from . import setup_django
+
+
+def sample_body(gateways=3, device=1, f_cnt=1234):
+    """A TTN v3 uplink webhook body as sent to the webhook views."""
+    received_at = "2025-11-26T10:00:00.123456789Z"
+    ids = {"device_id": f"bench-{device}", "application_ids": {"application_id": "bench"},
+           "dev_eui": f"{device:016X}", "dev_addr": "260B1234"}
+    correlation_ids = [f"as:up:01J{i:023d}" for i in range(5)]
+    return json.dumps({
+        "name": "as.up.data.forward",
+        "time": received_at,
+        "identifiers": [{"device_ids": ids}],
+        "data": {
+            "@type": "type.googleapis.com/ttn.lorawan.v3.ApplicationUp",
+            "end_device_ids": ids,
+            "correlation_ids": correlation_ids,
+            "received_at": received_at,
+            "uplink_message": {
+                "f_port": 1,
+                "f_cnt": f_cnt,
+                "frm_payload": "ANcCKyeU",
+                "rx_metadata": [{
+                    "gateway_ids": {"gateway_id": f"gw-{g}", "eui": f"B827EBFFFE{g:06X}"},
+                    "time": received_at,
+                    "timestamp": 123456789,
+                    "rssi": -90.0 - g,
+                    "channel_rssi": -90.0 - g,
+                    "snr": 7.25,
+                    "location": {"latitude": 53.1 + g / 100, "longitude": 18.0, "altitude": 40, "source": "SOURCE_REGISTRY"},
+                    "uplink_token": "CiIKIAoUZXUxLXR0bi1nYXRld2F5LTAwMDESCLgn6//+AAAAEJqN9owHGgwIkNOmugYQgPTS/wIggNvbs/0v" * 2,
+                    "channel_index": 2,
+                    "received_at": received_at,
+                } for g in range(gateways)],
+                "settings": {
+                    "data_rate": {"lora": {"bandwidth": 125000, "spreading_factor": 7, "coding_rate": "4/5"}},
+                    "frequency": "868100000",
+                    "timestamp": 123456789,
+                    "time": received_at,
+                },
+                "received_at": received_at,
+                "consumed_airtime": "0.056576s",
+                "network_ids": {"net_id": "000013", "ns_id": "EC656E0000000181", "tenant_id": "ttn",
+                                "cluster_id": "eu1", "cluster_address": "eu1.cloud.thethings.network"},
+            },
+        },
+        "correlation_ids": correlation_ids,
+        "origin": "ip-10-100-5-78.eu-west-1.compute.internal",
+        "context": {"tenant-id": "CgN0dG4="},
+        "visibility": {"rights": ["RIGHT_APPLICATION_TRAFFIC_READ"]},
+        "unique_id": "01JFXYZ0000000000000000000",
+    }).encode()
+
+
+def cpu_per_call(fn, iterations):
+    fn()
+    started = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--gateways', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.parsers import JSONParser
+    from devices.schemas import TTNWebhook, ingest_webhook_adapter
+
+    body = sample_body(args.gateways)
+    json_parser = JSONParser()
+
+    def original():
+        data = json_parser.parse(io.BytesIO(body))
+        return TTNWebhook.model_validate(data)
+
+    def fast_path():
+        return ingest_webhook_adapter.validate_json(body)
+
+    before = cpu_per_call(original, args.iterations)
+    after = cpu_per_call(fast_path, args.iterations)
+    print(f"body: {len(body)} bytes, {args.gateways} gateway(s), {args.iterations} iterations")
+    print(f"JSONParser + TTNWebhook.model_validate: {before * 1e6:8.1f} us/request")
+    print(f"ingest_webhook_adapter.validate_json:   {after * 1e6:8.1f} us/request ({before / after:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
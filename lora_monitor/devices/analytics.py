@@ -0,0 +1,124 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+from django.db.models import Count, Sum
+
+from .models import DeviceStats, NetworkMetadata, SensorReading
+
+READING_COLUMNS = ('timestamp', 'f_cnt', 'temperature', 'humidity', 'pressure')
+
+
+@dataclass
+class DeviceAnalytics:
+    reading_count: int = 0
+    packet_loss: int = 0
+    last_f_cnt: Optional[int] = None
+    restarts: list = field(default_factory=list)
+    anomalies: list = field(default_factory=list)
+    timestamps: list = field(default_factory=list)
+    temperatures: list = field(default_factory=list)
+    humidities: list = field(default_factory=list)
+    pressures: list = field(default_factory=list)
+
+
+def analyze_readings(rows, anomaly_threshold=5.0, include_series=True):
+    """Compute packet loss, restarts, temperature jumps and chart series in one pass.
+
+    ``rows`` are ``(timestamp, f_cnt, temperature, humidity, pressure)`` tuples
+    in timestamp order, e.g. ``values_list(*READING_COLUMNS)``.
+    """
+    result = DeviceAnalytics()
+    restarts = result.restarts
+    anomalies = result.anomalies
+    prev_fcnt = None
+    prev_temp = None
+    lost = 0
+    count = 0
+
+    for timestamp, f_cnt, temperature, humidity, pressure in rows:
+        count += 1
+
+        if f_cnt is not None:
+            if prev_fcnt is not None:
+                diff = f_cnt - prev_fcnt - 1
+                if diff > 0:
+                    lost += diff
+                elif f_cnt < prev_fcnt:
+                    restarts.append({
+                        'timestamp': timestamp,
+                        'prev_fcnt': prev_fcnt,
+                        'new_fcnt': f_cnt
+                    })
+            prev_fcnt = f_cnt
+
+        if temperature is not None:
+            if prev_temp is not None and abs(temperature - prev_temp) > anomaly_threshold:
+                anomalies.append({
+                    'timestamp': timestamp,
+                    'prev_temp': prev_temp,
+                    'current_temp': temperature
+                })
+            prev_temp = temperature
+
+        if include_series:
+            result.timestamps.append(timestamp.isoformat())
+            result.temperatures.append(temperature)
+            result.humidities.append(humidity)
+            result.pressures.append(pressure)
+
+    result.reading_count = count
+    result.packet_loss = lost
+    result.last_f_cnt = prev_fcnt
+    return result
+
+
+def analyze_device(device, anomaly_threshold=5.0, include_series=True, chunk_size=2000):
+    """Stream all readings of ``device`` (instance or pk) once and analyze them."""
+    rows = (SensorReading.objects
+            .filter(device=device)
+            .order_by('timestamp')
+            .values_list(*READING_COLUMNS)
+            .iterator(chunk_size=chunk_size))
+    return analyze_readings(rows, anomaly_threshold=anomaly_threshold, include_series=include_series)
+
+
+def recent_restarts(device, start):
+    """Restarts (f_cnt drops) of ``device`` from ``start`` on, oldest first.
+
+    Only readings since ``start`` are read, plus the one before it, so a drop
+    right at ``start`` is still seen.
+    """
+    readings = SensorReading.objects.filter(device=device, f_cnt__isnull=False)
+    rows = list(readings.filter(timestamp__lt=start).order_by('-timestamp').values_list(*READING_COLUMNS)[:1])
+    rows += readings.filter(timestamp__gte=start).order_by('timestamp').values_list(*READING_COLUMNS)
+    return analyze_readings(rows, include_series=False).restarts
+
+
+def compute_device_stats(device):
+    """``DeviceStats`` field values of ``device`` (instance or pk) recomputed from its full history."""
+    analytics = analyze_device(device, include_series=False)
+    agg = NetworkMetadata.objects.filter(device=device).aggregate(
+        uplink_count=Count('id'),
+        rssi_sum=Sum('rssi'),
+        rssi_count=Count('rssi'),
+        snr_sum=Sum('snr'),
+        snr_count=Count('snr'),
+    )
+    return {
+        "reading_count": analytics.reading_count,
+        "uplink_count": agg["uplink_count"],
+        "rssi_sum": agg["rssi_sum"] or 0,
+        "rssi_count": agg["rssi_count"],
+        "snr_sum": agg["snr_sum"] or 0,
+        "snr_count": agg["snr_count"],
+        "last_f_cnt": analytics.last_f_cnt,
+        "lost_packets": analytics.packet_loss,
+        "restart_count": len(analytics.restarts),
+    }
+
+
+def rebuild_device_stats(device):
+    """Store ``compute_device_stats(device)`` as the device's ``DeviceStats``."""
+    values = compute_device_stats(device)
+    DeviceStats.objects.update_or_create(device=device, defaults=values)
+    return values
@@ -0,0 +1,273 @@
+"""Vectorized anomaly detectors over a device's sensor history.
+
+A detector configuration is a list of dicts such as
+``{"metric": "temperature", "detector": "hampel", "window": 7}``; the
+``detector`` key picks a class from ``DETECTORS`` and the remaining keys are
+passed to its constructor. ``Device.anomaly_config`` overrides the
+``ANOMALY_DETECTORS`` setting per device.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+
+from .models import Device, SensorReading
+
+METRICS = ("temperature", "humidity", "pressure")
+
+
+@dataclass
+class Series:
+    timestamps: np.ndarray  # epoch seconds
+    values: dict  # metric -> float array, NaN where the reading had no value
+    warmup: int = 0  # leading rows from before the requested range
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+def warmup_start(readings, start, warmup):
+    """Timestamp from which ``readings`` hold ``warmup[metric]`` values of every metric before ``start``.
+
+    Returns None when some metric has fewer values than that before ``start``.
+    """
+    earliest = start
+    for metric, count in warmup.items():
+        if not count:
+            continue
+        timestamps = list(
+            readings.filter(timestamp__lt=start, **{f'{metric}__isnull': False})
+            .order_by('-timestamp').values_list('timestamp', flat=True)[count - 1:count]
+        )
+        if not timestamps:
+            return None
+        earliest = min(earliest, timestamps[0])
+    return earliest
+
+
+def load_series(device, start=None, end=None, warmup=None):
+    """Readings of ``device`` in ``[start, end]`` plus the warm-up before ``start``.
+
+    ``warmup`` maps a metric to the number of its values (not readings, a
+    reading may lack the metric) needed before ``start``; the series reaches
+    back until every metric has that many.
+    """
+    readings = SensorReading.objects.filter(device=device)
+    if end is not None:
+        readings = readings.filter(timestamp__lte=end)
+    if start is not None:
+        earliest = warmup_start(readings, start, warmup or {})
+        if earliest is not None:
+            readings = readings.filter(timestamp__gte=earliest)
+    rows = list(readings.order_by('timestamp', 'pk').values_list('timestamp', *METRICS))
+
+    if not rows:
+        return Series(np.empty(0), {metric: np.empty(0) for metric in METRICS})
+    timestamps, *metric_columns = zip(*rows)
+    timestamps = np.fromiter((timestamp.timestamp() for timestamp in timestamps), dtype=float,
+                             count=len(timestamps))
+    return Series(
+        timestamps,
+        # None becomes NaN
+        {metric: np.array(column, dtype=float) for metric, column in zip(METRICS, metric_columns)},
+        int(np.searchsorted(timestamps, start.timestamp())) if start is not None else 0,
+    )
+
+
+class Detector:
+    name = None
+    warmup = 0  # earlier samples of the metric a verdict depends on
+
+    def flag(self, values, timestamps):
+        """Return a boolean mask over ``values``; inputs contain no NaN."""
+        raise NotImplementedError
+
+    def detect(self, values, timestamps):
+        present = ~np.isnan(values)
+        mask = np.zeros(len(values), dtype=bool)
+        if present.any():
+            mask[present] = self.flag(values[present], timestamps[present])
+        return mask
+
+
+class RollingZScore(Detector):
+    """Deviation from the mean of the previous ``window`` samples in standard deviations."""
+    name = "zscore"
+
+    def __init__(self, window=50, threshold=3.0):
+        self.window = int(window)
+        self.threshold = float(threshold)
+
+    @property
+    def warmup(self):
+        return self.window
+
+    def flag(self, values, timestamps):
+        n, w = len(values), self.window
+        mask = np.zeros(n, dtype=bool)
+        if n <= w:
+            return mask
+        centered = values - values.mean()
+        c1 = np.concatenate(([0.0], np.cumsum(centered)))
+        c2 = np.concatenate(([0.0], np.cumsum(centered * centered)))
+        mean = (c1[w:n] - c1[:n - w]) / w
+        var = (c2[w:n] - c2[:n - w]) / w - mean * mean
+        std = np.sqrt(np.clip(var, 0.0, None))
+        deviation = np.abs(centered[w:] - mean)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mask[w:] = (std > 0) & (deviation > self.threshold * std)
+        return mask
+
+
+class Hampel(Detector):
+    """Hampel filter: distance from the centered rolling median in scaled MADs."""
+    name = "hampel"
+    chunk = 100000
+
+    def __init__(self, window=7, n_sigmas=3.0):
+        self.half = int(window) // 2
+        self.n_sigmas = float(n_sigmas)
+
+    @property
+    def warmup(self):
+        return self.half
+
+    def flag(self, values, timestamps):
+        n, k = len(values), self.half
+        mask = np.zeros(n, dtype=bool)
+        if n < 2 * k + 1:
+            return mask
+        windows = np.lib.stride_tricks.sliding_window_view(values, 2 * k + 1)
+        for lo in range(0, len(windows), self.chunk):
+            block = windows[lo:lo + self.chunk]
+            median = np.median(block, axis=1)
+            mad = 1.4826 * np.median(np.abs(block - median[:, None]), axis=1)
+            center = values[lo + k:lo + k + len(block)]
+            mask[lo + k:lo + k + len(block)] = (mad > 0) & (np.abs(center - median) > self.n_sigmas * mad)
+        return mask
+
+
+class RateOfChange(Detector):
+    """Change against the previous sample above ``max_delta``.
+
+    With ``per_seconds`` the change is normalised to that time unit first,
+    e.g. ``per_seconds=3600`` for a limit in units per hour.
+    """
+    name = "rate_of_change"
+    warmup = 1
+
+    def __init__(self, max_delta=5.0, per_seconds=None):
+        self.max_delta = float(max_delta)
+        self.per_seconds = float(per_seconds) if per_seconds else None
+
+    def flag(self, values, timestamps):
+        mask = np.zeros(len(values), dtype=bool)
+        delta = np.abs(np.diff(values))
+        if self.per_seconds:
+            elapsed = np.diff(timestamps) / self.per_seconds
+            with np.errstate(divide='ignore', invalid='ignore'):
+                delta = np.where(elapsed > 0, delta / elapsed, 0.0)
+        mask[1:] = delta > self.max_delta
+        return mask
+
+
+class Flatline(Detector):
+    """Stuck sensor: ``min_run`` consecutive samples within ``tolerance`` of each other.
+
+    Only the sample completing the run is flagged, so one stuck period yields
+    one anomaly.
+    """
+    name = "flatline"
+
+    def __init__(self, min_run=12, tolerance=0.0):
+        self.min_run = int(min_run)
+        self.tolerance = float(tolerance)
+
+    @property
+    def warmup(self):
+        # One more than the run itself, so a run reaching back past the
+        # warm-up is not taken to start at the first loaded sample.
+        return self.min_run
+
+    def flag(self, values, timestamps):
+        n = len(values)
+        same = np.zeros(n, dtype=bool)
+        same[1:] = np.abs(np.diff(values)) <= self.tolerance
+        index = np.arange(n)
+        run_start = np.maximum.accumulate(np.where(same, 0, index))
+        return index - run_start + 1 == self.min_run
+
+
+DETECTORS = {cls.name: cls for cls in (RollingZScore, Hampel, RateOfChange, Flatline)}
+
+
+def build_detectors(config):
+    """Turn a detector configuration into ``(metric, detector)`` pairs.
+
+    Raises ValueError for unknown metrics, detectors or parameters.
+    """
+    detectors = []
+    for entry in config:
+        if not isinstance(entry, dict):
+            raise ValueError(f"Detector entry must be an object: {entry!r}")
+        options = dict(entry)
+        metric = options.pop("metric", None)
+        name = options.pop("detector", None)
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        if name not in DETECTORS:
+            raise ValueError(f"Unknown detector: {name}")
+        try:
+            detectors.append((metric, DETECTORS[name](**options)))
+        except TypeError as e:
+            raise ValueError(f"Invalid options for {name}: {e}")
+    return detectors
+
+
+def device_detectors(device):
+    config = device.anomaly_config if device.anomaly_config is not None else settings.ANOMALY_DETECTORS
+    return build_detectors(config)
+
+
+def run_detectors(series, detectors):
+    """Run detectors over a loaded series; returns anomalies in time order.
+
+    Warm-up samples are only context and are never reported.
+    """
+    anomalies = []
+    for metric, detector in detectors:
+        values = series.values[metric]
+        mask = detector.detect(values, series.timestamps)
+        for i in np.flatnonzero(mask[series.warmup:]) + series.warmup:
+            anomalies.append({
+                'timestamp': datetime.fromtimestamp(series.timestamps[i], tz=dt_timezone.utc),
+                'metric': metric,
+                'detector': detector.name,
+                'value': float(values[i]),
+            })
+    anomalies.sort(key=lambda a: a['timestamp'])
+    return anomalies
+
+
+def detect_anomalies(device, start=None, end=None, detectors=None):
+    """Anomalies of ``device`` in ``[start, end]``.
+
+    The detectors also see the readings just before ``start`` they need to
+    judge the first readings in range, so a window flags the same readings
+    as a scan over the full history would.
+    """
+    if detectors is None:
+        detectors = device_detectors(device)
+    warmup = {}
+    for metric, detector in detectors:
+        warmup[metric] = max(warmup.get(metric, 0), detector.warmup)
+    return run_detectors(load_series(device, start, end, warmup), detectors)
+
+
+def scan_fleet(devices=None, start=None, end=None):
+    """Yield ``(device, anomalies)`` for every device, one history in memory at a time."""
+    if devices is None:
+        devices = Device.objects.order_by('pk')
+    for device in devices.iterator():
+        yield device, detect_anomalies(device, start, end)
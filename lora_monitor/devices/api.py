@@ -1,127 +1,167 @@
-from typing import Optional
-import base64
+import asyncio
+import queue
+from concurrent import futures
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from pydantic import ValidationError
 from rest_framework.views import APIView
 from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from django.utils import timezone
 
-from .models import Device, SensorReading, NetworkMetadata
-from .schemas import TTNWebhook
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from .ingest import aingest_uplinks, decode_payload, ingest_uplinks, send_reading_to_ws
+from .ingest_queue import get_ingest_queue, get_ingest_writer
+from .metrics import render as render_metrics, stage, uplinks_total, webhook_requests
+from .schemas import IngestWebhook, ingest_webhook_adapter
 import logging
 
 logger = logging.getLogger(__name__)
 
-def send_reading_to_ws(reading):
-    channel_layer = get_channel_layer()
-    group_name = f'device_{reading.device.device_id}'
-
-    async_to_sync(channel_layer.group_send)(
-        group_name,
-        {
-            'type': 'device_update',
-            'data': {
-                'temperature': reading.temperature,
-                'humidity': reading.humidity,
-                'pressure': reading.pressure,
-                'timestamp': reading.timestamp.isoformat(),
-            }
-        }
-    )
-
-
-def decode_payload(base64_payload: str) -> Optional[dict]:
+
+def write_uplinks(webhooks):
+    """Store ``webhooks`` through the ingest writer and wait for the commit.
+
+    Returns the ``IngestResult``, or None when the writer is saturated or
+    did not commit within ``INGEST_WRITER_TIMEOUT``; the uplinks may still
+    be stored later, and TTN's retry is then dropped as a duplicate.
+    """
     try:
-        data = base64.b64decode(base64_payload)
-    except Exception:
+        return get_ingest_writer().submit(webhooks).result(timeout=settings.INGEST_WRITER_TIMEOUT)
+    except (queue.Full, futures.TimeoutError):
+        logger.warning(f"Ingest writer busy, rejecting {len(webhooks)} uplinks")
         return None
 
-    if len(data) < 6:
+
+async def awrite_uplinks(webhooks):
+    """``write_uplinks`` for async views; waits on the event loop without a thread."""
+    try:
+        future = get_ingest_writer().submit(webhooks)
+        return await asyncio.wait_for(asyncio.wrap_future(future), settings.INGEST_WRITER_TIMEOUT)
+    except (queue.Full, asyncio.TimeoutError):
+        logger.warning(f"Ingest writer busy, rejecting {len(webhooks)} uplinks")
         return None
 
-    temperature_raw = int.from_bytes(data[0:2], "big", signed=True)
-    humidity_raw = int.from_bytes(data[2:4], "big")
-    pressure_raw = int.from_bytes(data[4:6], "big")
 
-    return {
-        "temperature": temperature_raw / 10.0,
-        "humidity": humidity_raw / 10.0,
-        "pressure": pressure_raw / 10.0,
-        "raw_hex": data.hex(),
-    }
+def busy_response(response_class=Response):
+    response = response_class({"status": "busy"}, status=503)
+    response["Retry-After"] = "1"
+    return response
+
 
 class TTNWebhookView(APIView):
     parser_classes = [JSONParser]
 
     def post(self, request):
+        # Validate the raw body in one pass instead of letting JSONParser build
+        # dicts that pydantic would then walk again.
         try:
-            validated = TTNWebhook.model_validate(request.data)
-        except Exception as e:
+            with stage("ingest", "validate"):
+                validated = ingest_webhook_adapter.validate_json(request.body)
+        except ValidationError as e:
             logger.error(f"Pydantic validation error: {e}")
-            return Response({"status": "ignored"}, status=200)
-
-        dev = validated.data.end_device_ids
-        device_id = dev.device_id
-        dev_eui = dev.dev_eui
-        dev_addr = dev.dev_addr
-        application_id = dev.application_ids.application_id
-
-        device = Device.objects.filter(device_id=device_id, dev_eui=dev_eui).first()
-        if not device:
-            logger.warning(f"Received TTN uplink for unknown device {device_id}/{dev_eui}")
-            return Response({"status": "ok"}, status=200)
-
-        uplink = validated.data.uplink_message
-
-        for meta in uplink.rx_metadata:
-            NetworkMetadata.objects.create(
-                device=device,
-                gateway_id=meta.gateway_ids.gateway_id,
-                rssi=meta.rssi,
-                snr=meta.snr,
-                channel_index=meta.channel_index,
-                uplink_token=meta.uplink_token,
-                received_at=meta.received_at,
-                gateway_lat=meta.location.latitude if meta.location else None,
-                gateway_lon=meta.location.longitude if meta.location else None,
-                gateway_alt=meta.location.altitude if meta.location else None,
-            )
-
-            device.last_rssi = meta.rssi
-            device.last_snr = meta.snr
-            device.last_gateway_id = meta.gateway_ids.gateway_id
-
-        raw_payload = uplink.frm_payload
-        if uplink.decoded_payload:
-            decoded_payload = uplink.decoded_payload
-            temperature = decoded_payload.temperature_1
-            humidity = decoded_payload.relative_humidity_2
-            pressure = decoded_payload.barometric_pressure_3
+            uplinks_total.inc("ignored")
+            webhook_requests.inc("sync", "error")
+            return Response({"status": "error", "detail": "Invalid TTN webhook"}, status=400)
+
+        if settings.INGEST_MODE == "queue":
+            with stage("ingest", "enqueue"):
+                queued = get_ingest_queue().put(validated)
+            if not queued:
+                webhook_requests.inc("sync", "busy")
+                return busy_response()
+            webhook_requests.inc("sync", "queued")
+            return Response({"status": "queued"}, status=202)
+
+        if settings.INGEST_MODE == "writer":
+            if write_uplinks([validated]) is None:
+                webhook_requests.inc("sync", "busy")
+                return busy_response()
         else:
-            manually_decoded_payload = decode_payload(raw_payload)
-            temperature = manually_decoded_payload.get("temperature")
-            humidity = manually_decoded_payload.get("humidity")
-            pressure = manually_decoded_payload.get("pressure")
-            decoded_payload = manually_decoded_payload
-
-        f_cnt = uplink.f_cnt
-        reading = SensorReading.objects.create(
-            device=device,
-            temperature=temperature,
-            humidity=humidity,
-            pressure=pressure,
-            raw_payload=raw_payload,
-            decoded_payload_json=decoded_payload,
-            f_cnt=f_cnt
-        )
-
-        device.last_seen = timezone.now()
-        device.last_fcnt = uplink.f_cnt
-        device.save(update_fields=["dev_eui", "dev_addr", "application_id",
-                                   "last_seen", "last_fcnt",
-                                   "last_rssi", "last_snr", "last_gateway_id"])
-
-        send_reading_to_ws(reading)
+            ingest_uplinks([validated])
 
+        webhook_requests.inc("sync", "ok")
         return Response({"status": "ok"}, status=200)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class TTNAsyncWebhookView(View):
+    """Same contract as ``TTNWebhookView``, handled natively on the ASGI event loop."""
+
+    async def post(self, request):
+        try:
+            with stage("ingest", "validate"):
+                validated = ingest_webhook_adapter.validate_json(request.body)
+        except ValidationError as e:
+            logger.error(f"Pydantic validation error: {e}")
+            uplinks_total.inc("ignored")
+            webhook_requests.inc("async", "error")
+            return JsonResponse({"status": "error", "detail": "Invalid TTN webhook"}, status=400)
+
+        if settings.INGEST_MODE == "queue":
+            # put() may wait up to INGEST_ENQUEUE_TIMEOUT for room; keep that off the loop.
+            with stage("ingest", "enqueue"):
+                queued = await sync_to_async(get_ingest_queue().put, thread_sensitive=False)(validated)
+            if not queued:
+                webhook_requests.inc("async", "busy")
+                return busy_response(JsonResponse)
+            webhook_requests.inc("async", "queued")
+            return JsonResponse({"status": "queued"}, status=202)
+
+        if settings.INGEST_MODE == "writer":
+            if await awrite_uplinks([validated]) is None:
+                webhook_requests.inc("async", "busy")
+                return busy_response(JsonResponse)
+        else:
+            await aingest_uplinks([validated])
+
+        webhook_requests.inc("async", "ok")
+        return JsonResponse({"status": "ok"}, status=200)
+
+
+class TTNBatchWebhookView(APIView):
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            webhook_requests.inc("batch", "error")
+            return Response({"status": "error", "detail": "Expected a JSON array of TTN webhooks"}, status=400)
+
+        webhooks = []
+        ignored = 0
+        for item in request.data:
+            try:
+                webhooks.append(IngestWebhook.model_validate(item))
+            except Exception as e:
+                logger.error(f"Pydantic validation error: {e}")
+                ignored += 1
+
+        if ignored:
+            uplinks_total.inc("ignored", amount=ignored)
+        if settings.INGEST_MODE == "writer":
+            result = write_uplinks(webhooks)
+            if result is None:
+                webhook_requests.inc("batch", "busy")
+                return busy_response()
+        else:
+            result = ingest_uplinks(webhooks)
+        webhook_requests.inc("batch", "ok")
+
+        return Response({
+            "status": "ok",
+            "stored": result.stored,
+            "unknown": result.unknown,
+            "duplicates": result.duplicates,
+            "ignored": ignored,
+        }, status=200)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; protected by ``METRICS_TOKEN`` when it is set."""
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class DevicesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'devices'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .metrics import install_query_counter
+        from .sqlite import apply_pragmas
+
+        # Pragmas first, so they are not counted as queries of a stage.
+        connection_created.connect(apply_pragmas, dispatch_uid="devices_sqlite_pragmas")
+        connection_created.connect(install_query_counter, dispatch_uid="devices_query_counter")
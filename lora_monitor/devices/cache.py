@@ -0,0 +1,219 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Device, Gateway
+
+
+class DeviceCache:
+    """In-process LRU of ``(device_id, dev_eui) -> Device`` used by ingestion.
+
+    Unknown keys are remembered as negative entries for ``negative_ttl``
+    seconds so a misconfigured application cannot hammer the registry.
+    Entries are dropped by the ``Device`` post_save/post_delete signals; the
+    cache is per process, so edits made in another process only become
+    visible there once the entry expires after ``ttl`` seconds. Ingestion
+    only writes the ``last_*`` fields back, so a stale entry never reverts
+    such an edit.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300.0, negative_ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        device, expires_at = entry
+        if expires_at <= now:
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, device
+
+    def _store(self, key, device, now):
+        expires_at = now + (self.ttl if device is not None else self.negative_ttl)
+        self._entries[key] = (device, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _cached(self, keys):
+        found = {}
+        missing = set()
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                cached, device = self._lookup(key, now)
+                if not cached:
+                    missing.add(key)
+                    continue
+                if device is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                    found[key] = device
+            self.misses += len(missing)
+        return found, missing
+
+    def _fill(self, found, missing, loaded):
+        now = time.monotonic()
+        with self._lock:
+            for key in missing:
+                device = loaded.get(key)
+                self._store(key, device, now)
+                if device is not None:
+                    found[key] = device
+        return found
+
+    def get_many(self, keys):
+        """Resolve ``(device_id, dev_eui)`` keys, querying only the misses."""
+        found, missing = self._cached(keys)
+        if not missing:
+            return found
+
+        devices = Device.objects.filter(device_id__in={device_id for device_id, _ in missing})
+        return self._fill(found, missing, {(d.device_id, d.dev_eui): d for d in devices})
+
+    def get(self, device_id, dev_eui):
+        return self.get_many([(device_id, dev_eui)]).get((device_id, dev_eui))
+
+    async def aget(self, device_id, dev_eui):
+        key = (device_id, dev_eui)
+        found, missing = self._cached([key])
+        if missing:
+            device = await Device.objects.filter(device_id=device_id, dev_eui=dev_eui).afirst()
+            self._fill(found, missing, {key: device} if device else {})
+        return found.get(key)
+
+    def invalidate(self, device):
+        with self._lock:
+            self._entries.pop((device.device_id, device.dev_eui), None)
+            stale = [key for key, (cached, _) in self._entries.items()
+                     if cached is not None and cached.pk == device.pk]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
+
+
+device_cache = DeviceCache(
+    maxsize=settings.DEVICE_CACHE_SIZE,
+    ttl=settings.DEVICE_CACHE_TTL,
+    negative_ttl=settings.DEVICE_CACHE_NEGATIVE_TTL,
+)
+
+
+class GatewayCache:
+    """In-process ``gateway_id -> (pk, eui, latitude, longitude, altitude)`` map used by ingestion.
+
+    There are few gateways and they are never deleted, so entries never
+    expire. ``resolve`` registers gateways on first sight and moves a
+    gateway when an uplink reports a different position; both are rare
+    writes outside the ingestion transaction.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _row(gateway):
+        return gateway.pk, gateway.eui, gateway.latitude, gateway.longitude, gateway.altitude
+
+    def lookup(self, reported):
+        """``{gateway_id: pk}`` from memory only; None when anything has to be written or loaded."""
+        found = {}
+        with self._lock:
+            for gateway_id, details in reported.items():
+                entry = self._entries.get(gateway_id)
+                if entry is None or _changed(entry, details):
+                    return None
+                found[gateway_id] = entry[0]
+            self.hits += len(found)
+        return found
+
+    def resolve(self, reported):
+        """Map ``{gateway_id: (eui, latitude, longitude, altitude)}`` to ``{gateway_id: pk}``.
+
+        Missing positions (None) never overwrite a known one.
+        """
+        found = self.lookup(reported)
+        if found is not None:
+            return found
+
+        with self._lock:
+            missing = [gateway_id for gateway_id in reported if gateway_id not in self._entries]
+            self.misses += len(missing)
+        if missing:
+            loaded = {gateway.gateway_id: gateway for gateway in Gateway.objects.filter(gateway_id__in=missing)}
+            new = [
+                Gateway(gateway_id=gateway_id, eui=reported[gateway_id][0], latitude=reported[gateway_id][1],
+                        longitude=reported[gateway_id][2], altitude=reported[gateway_id][3])
+                for gateway_id in missing if gateway_id not in loaded
+            ]
+            if new:
+                Gateway.objects.bulk_create(new, ignore_conflicts=True)
+                loaded.update((gateway.gateway_id, gateway)
+                              for gateway in Gateway.objects.filter(gateway_id__in=[g.gateway_id for g in new]))
+            with self._lock:
+                for gateway_id, gateway in loaded.items():
+                    self._entries[gateway_id] = self._row(gateway)
+
+        found = {}
+        for gateway_id, details in reported.items():
+            entry = self._entries[gateway_id]
+            if _changed(entry, details):
+                eui, latitude, longitude, altitude = (reported_value if reported_value is not None else known
+                                                      for reported_value, known in zip(details, entry[1:]))
+                Gateway.objects.filter(pk=entry[0]).update(eui=eui, latitude=latitude, longitude=longitude,
+                                                           altitude=altitude, updated_at=timezone.now())
+                entry = self._entries[gateway_id] = (entry[0], eui, latitude, longitude, altitude)
+            found[gateway_id] = entry[0]
+        return found
+
+    def invalidate(self, gateway):
+        with self._lock:
+            self._entries.pop(gateway.gateway_id, None)
+            stale = [gateway_id for gateway_id, entry in self._entries.items() if entry[0] == gateway.pk]
+            for gateway_id in stale:
+                del self._entries[gateway_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def _changed(entry, details):
+    """True when ``details`` reports something ``entry`` does not have yet."""
+    return any(new is not None and new != old for new, old in zip(details, entry[1:]))
+
+
+gateway_cache = GatewayCache()
@@ -0,0 +1,202 @@
+"""Uplink payload codecs.
+
+A codec turns the raw ``frm_payload`` bytes into a dict that always carries
+``temperature``, ``humidity`` and ``pressure`` (None when the payload has no
+such value) plus any codec-specific fields. Codecs are registered by name;
+``resolve_codec`` picks one from the device's ``payload_codec``, then the
+``PAYLOAD_CODECS_BY_FPORT`` setting, then ``DEFAULT_PAYLOAD_CODEC``.
+"""
+import base64
+import binascii
+import logging
+import struct
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MEASUREMENTS = ("temperature", "humidity", "pressure")
+
+# Structured dtype returned by the batch decoders.
+BATCH_DTYPE = np.dtype([(name, "f8") for name in MEASUREMENTS] + [("valid", "?")])
+
+CODECS = {}
+
+
+def register_codec(codec):
+    CODECS[codec.name] = codec
+    return codec
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown payload codec: {name}")
+
+
+def resolve_codec(device=None, f_port=None):
+    """Codec for an uplink of ``device`` on ``f_port``.
+
+    An unknown configured name falls back to ``DEFAULT_PAYLOAD_CODEC`` with a
+    warning, so one misconfigured device does not fail a whole ingest batch.
+    """
+    name = getattr(device, "payload_codec", None)
+    if not name and f_port is not None:
+        name = settings.PAYLOAD_CODECS_BY_FPORT.get(f_port)
+    if name and name not in CODECS:
+        logger.warning(f"Unknown payload codec {name} for {getattr(device, 'device_id', None)}, "
+                       f"using {settings.DEFAULT_PAYLOAD_CODEC}")
+        name = None
+    return get_codec(name or settings.DEFAULT_PAYLOAD_CODEC)
+
+
+def b64decode(payload):
+    try:
+        return base64.b64decode(payload)
+    except (binascii.Error, TypeError, ValueError):
+        return None
+
+
+class StructCodec:
+    """Fixed layout described as ``(field, struct code, divisor)`` triples."""
+
+    def __init__(self, name, fields, byte_order=">"):
+        self.name = name
+        self.fields = [field for field, _, _ in fields]
+        self.divisors = [divisor for _, _, divisor in fields]
+        self.struct = struct.Struct(byte_order + "".join(code for _, code, _ in fields))
+        self.dtype = np.dtype([(field, byte_order + code) for field, code, _ in fields])
+        self.size = self.struct.size
+
+    def decode(self, data):
+        if data is None or len(data) < self.size:
+            return None
+        decoded = dict.fromkeys(MEASUREMENTS)
+        for field, raw, divisor in zip(self.fields, self.struct.unpack_from(data), self.divisors):
+            decoded[field] = raw / divisor
+        decoded["raw_hex"] = data.hex()
+        return decoded
+
+    def decode_batch(self, blobs, with_payloads=False):
+        out = np.zeros(len(blobs), dtype=BATCH_DTYPE)
+        for name in MEASUREMENTS:
+            out[name] = np.nan
+        valid = np.fromiter((blob is not None and len(blob) >= self.size for blob in blobs),
+                            dtype=bool, count=len(blobs))
+        payloads = [None] * len(blobs)
+        if valid.any():
+            packed = b"".join(blob[:self.size] for blob, ok in zip(blobs, valid) if ok)
+            raw = np.frombuffer(packed, dtype=self.dtype)
+            scaled = {field: raw[field] / divisor for field, divisor in zip(self.fields, self.divisors)}
+            for field in MEASUREMENTS:
+                if field in scaled:
+                    out[field][valid] = scaled[field]
+            if with_payloads:
+                columns = [scaled[field].tolist() for field in self.fields]
+                for i, values in zip(np.flatnonzero(valid), zip(*columns)):
+                    decoded = dict.fromkeys(MEASUREMENTS)
+                    decoded.update(zip(self.fields, values))
+                    decoded["raw_hex"] = blobs[i].hex()
+                    payloads[i] = decoded
+        out["valid"] = valid
+        return (out, payloads) if with_payloads else out
+
+
+class CayenneLPPCodec:
+    """Cayenne Low Power Payload: a sequence of ``channel, type, value`` records.
+
+    Keys follow the TTN LPP decoder (``temperature_1``,
+    ``relative_humidity_2``, ...); the first temperature, humidity and
+    barometer channels also fill the common measurement keys.
+    """
+    name = "cayenne_lpp"
+
+    # type -> (key prefix, struct, divisors, measurement)
+    TYPES = {
+        0x00: ("digital_in", struct.Struct(">B"), (1,), None),
+        0x01: ("digital_out", struct.Struct(">B"), (1,), None),
+        0x02: ("analog_in", struct.Struct(">h"), (100,), None),
+        0x03: ("analog_out", struct.Struct(">h"), (100,), None),
+        0x65: ("luminosity", struct.Struct(">H"), (1,), None),
+        0x66: ("presence", struct.Struct(">B"), (1,), None),
+        0x67: ("temperature", struct.Struct(">h"), (10,), "temperature"),
+        0x68: ("relative_humidity", struct.Struct(">B"), (2,), "humidity"),
+        0x71: ("accelerometer", struct.Struct(">hhh"), (1000, 1000, 1000), None),
+        0x73: ("barometric_pressure", struct.Struct(">H"), (10,), "pressure"),
+        0x86: ("gyrometer", struct.Struct(">hhh"), (100, 100, 100), None),
+    }
+    GPS = 0x88
+
+    def decode(self, data):
+        if not data:
+            return None
+        decoded = dict.fromkeys(MEASUREMENTS)
+        offset = 0
+        while offset + 2 <= len(data):
+            channel, kind = data[offset], data[offset + 1]
+            offset += 2
+            if kind == self.GPS:
+                if offset + 9 > len(data):
+                    return None
+                lat, lon, alt = (int.from_bytes(data[offset + i:offset + i + 3], "big", signed=True)
+                                 for i in (0, 3, 6))
+                decoded[f"gps_{channel}"] = {"latitude": lat / 10000, "longitude": lon / 10000,
+                                             "altitude": alt / 100}
+                offset += 9
+                continue
+            if kind not in self.TYPES:
+                return None
+            prefix, layout, divisors, measurement = self.TYPES[kind]
+            if offset + layout.size > len(data):
+                return None
+            values = [raw / divisor for raw, divisor in zip(layout.unpack_from(data, offset), divisors)]
+            offset += layout.size
+            value = values[0] if len(values) == 1 else dict(zip("xyz", values))
+            decoded[f"{prefix}_{channel}"] = value
+            if measurement and decoded[measurement] is None:
+                decoded[measurement] = value
+        if offset != len(data):
+            return None
+        decoded["raw_hex"] = data.hex()
+        return decoded
+
+    def decode_batch(self, blobs, with_payloads=False):
+        out = np.zeros(len(blobs), dtype=BATCH_DTYPE)
+        payloads = [self.decode(blob) for blob in blobs]
+        for i, decoded in enumerate(payloads):
+            out["valid"][i] = decoded is not None
+            for name in MEASUREMENTS:
+                value = decoded.get(name) if decoded else None
+                out[name][i] = np.nan if value is None else value
+        return (out, payloads) if with_payloads else out
+
+
+# The original lora_monitor firmware: int16 temperature, uint16 humidity and
+# uint16 pressure, big-endian, all in tenths.
+register_codec(StructCodec("thp_be16", [
+    ("temperature", "h", 10),
+    ("humidity", "H", 10),
+    ("pressure", "H", 10),
+]))
+# Same sensors with the pressure sent in Pa as uint32 (0.01 hPa resolution).
+register_codec(StructCodec("thp_be32_pa", [
+    ("temperature", "h", 10),
+    ("humidity", "H", 10),
+    ("pressure", "I", 100),
+]))
+register_codec(CayenneLPPCodec())
+
+
+def decode_batch(payloads, codec, with_payloads=False):
+    """Decode many base64 ``frm_payload`` values at once.
+
+    Returns a NumPy structured array with ``temperature``, ``humidity`` and
+    ``pressure`` (NaN where missing) and a ``valid`` flag per payload. With
+    ``with_payloads`` it also returns the dicts ``codec.decode`` would have
+    returned (None for invalid payloads), as ``(array, dicts)``.
+    """
+    if isinstance(codec, str):
+        codec = get_codec(codec)
+    return codec.decode_batch([b64decode(payload) if payload else None for payload in payloads], with_payloads)
@@ -1,9 +1,13 @@
+import asyncio
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from .fanout import get_fanout
+
 
 class DeviceConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        get_fanout().bind(asyncio.get_running_loop())
         self.device_id = self.scope['url_route']['kwargs']['device_id']
         self.room_group_name = f'device_{self.device_id}'
 
@@ -22,3 +26,6 @@ class DeviceConsumer(AsyncWebsocketConsumer):
 
     async def device_update(self, event):
         await self.send(text_data=json.dumps(event['data']))
+
+    async def device_batch(self, event):
+        await self.send(text_data=json.dumps({'readings': event['readings']}))
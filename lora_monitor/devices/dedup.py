@@ -0,0 +1,46 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class RecentKeys:
+    """Bounded, thread-safe set of recently stored uplink keys.
+
+    Keys are ``(device pk, f_cnt, received_at)``. A hit means the uplink is
+    already in the database and can be dropped without a query; a miss says
+    nothing, the caller still checks the database (and the ``unique_uplink``
+    constraint has the final word).
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                self.hits += 1
+                return True
+            return False
+
+    def add_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._keys[key] = None
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+
+recent_uplinks = RecentKeys(maxsize=settings.DEDUP_RECENT_KEYS)
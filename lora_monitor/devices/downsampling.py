@@ -0,0 +1,54 @@
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of a series to ``threshold`` points.
+
+    ``x`` must be sorted. First and last points are always kept; every bucket in
+    between contributes the point that forms the largest triangle with the
+    previously selected point and the mean of the next bucket. Bucket means and
+    triangle areas are computed with NumPy, only the walk over buckets is a
+    Python loop (``threshold`` iterations regardless of the input length).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # threshold - 2 buckets over the points between the first and the last one.
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    starts = edges[:-1]
+    counts = np.diff(edges)
+
+    bucket_x = np.add.reduceat(x[1:n - 1], starts - 1) / counts
+    bucket_y = np.add.reduceat(y[1:n - 1], starts - 1) / counts
+    # For each bucket the third triangle vertex is the mean of the next bucket,
+    # and the last point for the final bucket.
+    next_x = np.append(bucket_x[1:], x[-1])
+    next_y = np.append(bucket_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        areas = np.abs((ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay))
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    return x[selected], y[selected]
+
+
+def downsample_series(timestamps, values, max_points):
+    """LTTB over ``(timestamps, values)`` ignoring missing values.
+
+    Returns a list of ``[timestamp, value]`` pairs ready for JSON.
+    """
+    x = np.asarray(timestamps, dtype=float)
+    y = np.array(values, dtype=float)
+    present = ~np.isnan(y)
+    x, y = lttb(x[present], y[present], max_points)
+    return np.column_stack((x, y)).tolist()
@@ -0,0 +1,104 @@
+"""Streaming CSV / NDJSON export of readings and gateway metadata.
+
+Rows come from ``values_list().iterator(chunk_size=...)`` and are encoded in
+blocks of ``chunk_size`` rows, so memory stays flat however long the export
+is. ``stream_export`` yields those blocks as bytes for files and WSGI;
+``astream_export`` wraps it for ``StreamingHttpResponse`` under ASGI, where a
+sync iterator would be read into memory as a whole first.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+
+from .models import NetworkMetadata, SensorReading
+
+EXPORTS = {
+    "readings": (SensorReading, (
+        "device__device_id", "timestamp", "f_cnt", "temperature", "humidity", "pressure",
+        "received_at", "raw_payload",
+    )),
+    "metadata": (NetworkMetadata, (
+        "device__device_id", "timestamp", "gateway__gateway_id", "rssi", "snr", "channel_index",
+        "gateway__latitude", "gateway__longitude", "gateway__altitude", "received_at",
+    )),
+}
+# Exported column names of related fields, unchanged since metadata rows
+# carried the gateway columns themselves.
+HEADER_NAMES = {
+    "device__device_id": "device_id",
+    "gateway__gateway_id": "gateway_id",
+    "gateway__latitude": "gateway_lat",
+    "gateway__longitude": "gateway_lon",
+    "gateway__altitude": "gateway_alt",
+}
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def header(kind):
+    return [HEADER_NAMES.get(column, column) for column in EXPORTS[kind][1]]
+
+
+def export_rows(kind, devices=None, start=None, end=None, chunk_size=2000):
+    """Stream ``values_list`` tuples of ``kind`` ordered by device and time."""
+    model, columns = EXPORTS[kind]
+    rows = model.objects.all()
+    if devices is not None:
+        rows = rows.filter(device__in=devices)
+    if start is not None:
+        rows = rows.filter(timestamp__gte=start)
+    if end is not None:
+        rows = rows.filter(timestamp__lt=end)
+    return rows.order_by("device", "timestamp", "pk").values_list(*columns).iterator(chunk_size=chunk_size)
+
+
+def _isoformat(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream_export(kind, fmt, devices=None, start=None, end=None, chunk_size=2000):
+    """Yield the export as byte blocks of up to ``chunk_size`` rows each."""
+    names = header(kind)
+    rows = export_rows(kind, devices, start, end, chunk_size)
+    buffer = io.StringIO()
+
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+
+        def encode(row):
+            writer.writerow([_isoformat(value) for value in row])
+    elif fmt == "ndjson":
+        def encode(row):
+            buffer.write(json.dumps(dict(zip(names, map(_isoformat, row)))))
+            buffer.write("\n")
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    count = 0
+    for row in rows:
+        encode(row)
+        count += 1
+        if count == chunk_size:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def astream_export(*args, **kwargs):
+    """``stream_export`` as an async iterator; every block is read on the ORM thread."""
+    blocks = stream_export(*args, **kwargs)
+    read = sync_to_async(next, thread_sensitive=True)
+    while True:
+        block = await read(blocks, None)
+        if block is None:
+            break
+        yield block
@@ -0,0 +1,129 @@
+"""Coalescing, rate-limited WebSocket fan-out of new readings.
+
+``publish`` may be called from any thread and never blocks: it hands the
+reading to an event loop, where updates for the same ``device_<id>`` group
+are collected for ``window`` seconds and sent as one channel-layer message.
+A group gets at most ``max_rate`` messages per second; readings arriving in
+between are merged into the next message. One pending reading goes out as a
+``device_update`` event (the original format), several as ``device_batch``.
+
+The loop is the ASGI server's loop once a consumer has connected (see
+``DeviceConsumer.connect``), so messages are delivered on the loop the
+in-memory channel layer lives on; processes without one (WSGI, management
+commands) get a private loop thread.
+"""
+import asyncio
+import logging
+import threading
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Fanout:
+    def __init__(self, window=0.25, max_rate=2.0, max_batch=50):
+        self.window = window
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.max_batch = max_batch
+        self._loop = None
+        self._private_loop = None
+        self._lock = threading.Lock()
+        # Only touched on the loop thread.
+        self._pending = {}
+        self._scheduled = set()
+        self._last_sent = {}
+        self._sending = set()
+        # Counters, read by devices.metrics.
+        self.published = 0
+        self.messages_sent = 0
+        self.dropped = 0
+
+    def bind(self, loop):
+        """Deliver on ``loop`` (the ASGI server loop) from now on."""
+        with self._lock:
+            if self._loop is loop:
+                return
+            if self._loop is None or self._loop.is_closed() or self._loop is self._private_loop:
+                self._loop = loop
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                if self._private_loop is None:
+                    self._private_loop = asyncio.new_event_loop()
+                    threading.Thread(target=self._private_loop.run_forever, name="ws-fanout", daemon=True).start()
+                self._loop = self._private_loop
+            return self._loop
+
+    def publish(self, group, data):
+        self.published += 1
+        loop = self._get_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._enqueue(group, data)
+        else:
+            loop.call_soon_threadsafe(self._enqueue, group, data)
+
+    def _enqueue(self, group, data):
+        pending = self._pending.setdefault(group, [])
+        pending.append(data)
+        if len(pending) > self.max_batch:
+            del pending[0]
+            self.dropped += 1
+        if group in self._scheduled:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        delay = max(self.window, self._last_sent.get(group, float("-inf")) + self.min_interval - now)
+        self._scheduled.add(group)
+        loop.call_later(delay, self._flush, group)
+
+    def _flush(self, group):
+        self._scheduled.discard(group)
+        readings = self._pending.pop(group, None)
+        if not readings:
+            return
+        self._last_sent[group] = asyncio.get_running_loop().time()
+        if len(readings) == 1:
+            message = {"type": "device_update", "data": readings[0]}
+        else:
+            message = {"type": "device_batch", "readings": readings}
+        self.messages_sent += 1
+        task = asyncio.ensure_future(self._send(group, message))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, group, message):
+        try:
+            await get_channel_layer().group_send(group, message)
+        except Exception:
+            logger.exception(f"WebSocket fan-out to {group} failed")
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "messages_sent": self.messages_sent,
+            "dropped": self.dropped,
+            "pending_groups": len(self._pending),
+        }
+
+
+_fanout = None
+_fanout_lock = threading.Lock()
+
+
+def get_fanout():
+    global _fanout
+    with _fanout_lock:
+        if _fanout is None:
+            _fanout = Fanout(
+                window=settings.WS_FANOUT_WINDOW,
+                max_rate=settings.WS_FANOUT_MAX_RATE,
+                max_batch=settings.WS_FANOUT_MAX_BATCH,
+            )
+        return _fanout
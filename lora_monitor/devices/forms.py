@@ -1,4 +1,8 @@
 from django import forms
+from django.core.exceptions import ValidationError
+
+from .anomaly import build_detectors
+from .codecs import CODECS
 from .models import Device
 
 
@@ -11,4 +15,24 @@ class DeviceForm(forms.ModelForm):
             'dev_addr',
             'application_id',
             'address',
-        ]
\ No newline at end of file
+            'anomaly_config',
+            'payload_codec',
+        ]
+
+    def clean_payload_codec(self):
+        codec = self.cleaned_data.get('payload_codec')
+        if codec and codec not in CODECS:
+            raise ValidationError(f'Nieznany kodek: {codec}. Dostępne: {", ".join(sorted(CODECS))}.')
+        return codec or None
+
+    def clean_anomaly_config(self):
+        config = self.cleaned_data.get('anomaly_config')
+        if config is None:
+            return config
+        if not isinstance(config, list):
+            raise ValidationError('Konfiguracja detektorów musi być listą.')
+        try:
+            build_detectors(config)
+        except ValueError as e:
+            raise ValidationError(str(e))
+        return config
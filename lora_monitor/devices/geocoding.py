@@ -0,0 +1,207 @@
+"""Address geocoding for devices.
+
+Lookups go through the ``GeocodeCache`` table first, so an address is sent to
+the geocoder once; negative answers are cached as well. The geocoder itself
+is pluggable: ``GEOCODER_BACKEND`` names a class whose ``geocode(address)``
+returns ``(lat, lon)``, None when the address is unknown, and raises when the
+service could not be asked (such failures are not cached).
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection
+from django.utils.module_loading import import_string
+
+from .models import Device, GeocodeCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_address(address):
+    return " ".join(address.split()).casefold()
+
+
+class NominatimGeocoder:
+    """OpenStreetMap Nominatim; ``min_delay`` keeps to its one request per second policy."""
+
+    def __init__(self, user_agent="lora_monitor", timeout=10, min_delay=1.0):
+        from geopy.geocoders import Nominatim
+
+        self.client = Nominatim(user_agent=user_agent, timeout=timeout)
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        self._last_call = 0.0
+
+    def geocode(self, address):
+        with self._lock:
+            wait = self._last_call + self.min_delay - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                location = self.client.geocode(address)
+            finally:
+                self._last_call = time.monotonic()
+        if location:
+            return location.latitude, location.longitude
+        return None
+
+
+class GazetteerGeocoder:
+    """Offline lookup in a ``{address: (lat, lon)}`` table, for tests and air-gapped installs."""
+
+    def __init__(self, places=None):
+        self.places = {normalize_address(address): tuple(coords) for address, coords in (places or {}).items()}
+
+    def geocode(self, address):
+        return self.places.get(normalize_address(address))
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = import_string(settings.GEOCODER_BACKEND)(**settings.GEOCODER_OPTIONS)
+        return _geocoder
+
+
+def cached_geocode(address):
+    return GeocodeCache.objects.filter(address=normalize_address(address)).first()
+
+
+def geocode_address(address):
+    """Return ``(lat, lon)`` for ``address``, ``(None, None)`` when it cannot be located."""
+    entry = cached_geocode(address)
+    if entry is not None:
+        return entry.latitude, entry.longitude
+
+    try:
+        coords = get_geocoder().geocode(address)
+    except Exception as e:
+        logger.warning(f"Geocoding error for {address!r}: {e}")
+        return None, None
+
+    lat, lon = coords if coords else (None, None)
+    try:
+        GeocodeCache.objects.create(address=normalize_address(address), latitude=lat, longitude=lon,
+                                    backend=settings.GEOCODER_BACKEND)
+    except IntegrityError:
+        pass  # cached concurrently
+    return lat, lon
+
+
+def locate_device(device):
+    """Set ``device.location_lat/lon`` for its current address before saving.
+
+    Uses the cache, or the geocoder directly when ``GEOCODE_IN_BACKGROUND`` is
+    off. Returns False when the location is still unknown and the device
+    should be handed to the geocode worker once saved.
+    """
+    if not device.address:
+        device.location_lat = device.location_lon = None
+        return True
+    entry = cached_geocode(device.address)
+    if entry is not None:
+        device.location_lat, device.location_lon = entry.latitude, entry.longitude
+        return True
+    if not settings.GEOCODE_IN_BACKGROUND:
+        device.location_lat, device.location_lon = geocode_address(device.address)
+        return True
+    device.location_lat = device.location_lon = None
+    return False
+
+
+def geocode_device(device_pk, address):
+    """Geocode ``address`` and store it on the device unless its address changed meanwhile."""
+    lat, lon = geocode_address(address)
+    if lat is None or lon is None:
+        return False
+    return Device.objects.filter(pk=device_pk, address=address).update(location_lat=lat, location_lon=lon) > 0
+
+
+class GeocodeWorker:
+    """Background thread that geocodes devices off the request path."""
+
+    def __init__(self, maxsize=1000):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="geocode-worker", daemon=True)
+            self._thread.start()
+
+    def submit(self, device_pk, address):
+        """Queue a lookup; returns False when the queue is full or stopping."""
+        if self._stopping.is_set():
+            return False
+        key = (device_pk, address)
+        with self._lock:
+            if key in self._pending:
+                return True
+            self._pending.add(key)
+        self.start()
+        try:
+            self._queue.put_nowait(key)
+        except queue.Full:
+            logger.warning(f"Geocode queue full, skipping device {device_pk}")
+            with self._lock:
+                self._pending.discard(key)
+            return False
+        return True
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def join(self):
+        """Block until every queued lookup has been processed."""
+        self._queue.join()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                key = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                geocode_device(*key)
+            except Exception:
+                logger.exception(f"Failed to geocode device {key[0]}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._queue.task_done()
+                close_old_connections()
+        connection.close()
+
+
+_geocode_worker = None
+_geocode_worker_lock = threading.Lock()
+
+
+def get_geocode_worker():
+    global _geocode_worker
+    with _geocode_worker_lock:
+        if _geocode_worker is None:
+            _geocode_worker = GeocodeWorker(maxsize=settings.GEOCODE_QUEUE_SIZE)
+            atexit.register(_geocode_worker.stop)
+        return _geocode_worker
@@ -0,0 +1,69 @@
+"""RSSI heatmap of a device's gateways, binned in the database.
+
+Gateway metadata rows are grouped by their gateway's position rounded to a
+number of decimals picked from the map zoom, so the result has one cell per
+distinct (rounded) gateway position however many uplinks were heard: the
+payload grows with the gateway count, not the uplink count. Every cell
+carries the count and the mean and maximum RSSI and SNR. Results are cached
+per device and precision for ``HEATMAP_CACHE_TIMEOUT`` seconds; keying on
+anything that changes with every uplink would make the cache useless for
+devices reporting every few minutes, and a few minutes of lag do not show
+on a heatmap of the whole history.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max
+from django.db.models.functions import Round
+
+from .models import NetworkMetadata
+
+DEFAULT_ZOOM = 12
+
+# (lowest zoom, decimals): 0 decimals is ~111 km, 4 decimals ~11 m.
+ZOOM_PRECISION = [
+    (15, 4),
+    (12, 3),
+    (9, 2),
+    (6, 1),
+    (0, 0),
+]
+
+
+def precision_for_zoom(zoom):
+    """Decimals to round gateway coordinates to at Leaflet zoom ``zoom``."""
+    for min_zoom, decimals in ZOOM_PRECISION:
+        if zoom >= min_zoom:
+            return decimals
+    return 0
+
+
+def heatmap_cells(device, precision):
+    """Aggregated cells of ``device``'s gateway metadata at ``precision`` decimals."""
+    rows = (NetworkMetadata.objects
+            .filter(device=device, gateway__latitude__isnull=False, gateway__longitude__isnull=False)
+            .annotate(lat=Round('gateway__latitude', precision), lon=Round('gateway__longitude', precision))
+            .values('lat', 'lon')
+            .annotate(count=Count('id'),
+                      rssi_mean=Avg('rssi'), rssi_max=Max('rssi'),
+                      snr_mean=Avg('snr'), snr_max=Max('snr'))
+            .order_by('lat', 'lon'))
+    return [
+        {**row,
+         'rssi_mean': round(row['rssi_mean'], 2) if row['rssi_mean'] is not None else None,
+         'snr_mean': round(row['snr_mean'], 2) if row['snr_mean'] is not None else None}
+        for row in rows
+    ]
+
+
+def cached_heatmap_cells(device, precision):
+    key = f"heatmap:{device.pk}:{precision}"
+    cells = cache.get(key)
+    if cells is None:
+        cells = heatmap_cells(device, precision)
+        cache.set(key, cells, settings.HEATMAP_CACHE_TIMEOUT)
+    return cells
+
+
+def heat_points(cells):
+    """``[lat, lon, |mean RSSI|]`` triples for Leaflet.heat."""
+    return [[cell['lat'], cell['lon'], abs(cell['rssi_mean'] or 0)] for cell in cells]
@@ -0,0 +1,421 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .analytics import compute_device_stats
+from .cache import device_cache, gateway_cache
+from .codecs import b64decode, resolve_codec
+from .dedup import recent_uplinks
+from .fanout import get_fanout
+from .metrics import stage, uplinks_total
+from .models import Device, DeviceStats, SensorReading, NetworkMetadata
+from .rollups import update_rollups
+
+logger = logging.getLogger(__name__)
+
+# Only the fields uplinks own: the device comes from DeviceCache and may be
+# stale, so writing its registry fields back could revert an edit.
+DEVICE_UPDATE_FIELDS = ["last_seen", "last_fcnt", "last_rssi", "last_snr", "last_gateway_id"]
+STATS_UPDATE_FIELDS = ["reading_count", "uplink_count", "rssi_sum", "rssi_count",
+                       "snr_sum", "snr_count", "last_f_cnt", "lost_packets",
+                       "restart_count", "updated_at"]
+
+
+def send_reading_to_ws(reading):
+    get_fanout().publish(f'device_{reading.device.device_id}', {
+        'temperature': reading.temperature,
+        'humidity': reading.humidity,
+        'pressure': reading.pressure,
+        'f_cnt': reading.f_cnt,
+        'timestamp': reading.timestamp.isoformat(),
+    })
+
+
+def decode_payload(base64_payload: str, codec=None) -> Optional[dict]:
+    if codec is None:
+        codec = resolve_codec()
+    return codec.decode(b64decode(base64_payload))
+
+
+@dataclass
+class IngestResult:
+    stored: int = 0
+    unknown: int = 0
+    duplicates: int = 0
+
+
+def extract_measurements(uplink, device=None):
+    if uplink.decoded_payload:
+        decoded_payload = uplink.decoded_payload
+        return (decoded_payload.temperature_1,
+                decoded_payload.relative_humidity_2,
+                decoded_payload.barometric_pressure_3,
+                decoded_payload)
+
+    codec = resolve_codec(device, uplink.f_port)
+    decoded_payload = decode_payload(uplink.frm_payload, codec)
+    if decoded_payload is None:
+        logger.warning(f"Could not decode payload with codec {codec.name}: {uplink.frm_payload}")
+        return None, None, None, None
+    return (decoded_payload.get("temperature"),
+            decoded_payload.get("humidity"),
+            decoded_payload.get("pressure"),
+            decoded_payload)
+
+
+def resolve_devices(webhooks):
+    keys = {(w.data.end_device_ids.device_id, w.data.end_device_ids.dev_eui) for w in webhooks}
+    return device_cache.get_many(keys)
+
+
+def gateway_positions(webhooks):
+    """``{gateway_id: (eui, latitude, longitude, altitude)}`` as last reported by ``webhooks``."""
+    reported = {}
+    for validated in webhooks:
+        for meta in validated.data.uplink_message.rx_metadata:
+            location = meta.location
+            reported[meta.gateway_ids.gateway_id] = (
+                meta.gateway_ids.eui,
+                location.latitude if location else None,
+                location.longitude if location else None,
+                location.altitude if location else None,
+            )
+    return reported
+
+
+def update_devices(devices):
+    """Write the ingestion fields of ``devices`` with one ``executemany`` UPDATE.
+
+    Same effect as ``bulk_update(devices, DEVICE_UPDATE_FIELDS)`` without
+    compiling a CASE per device and field, which dominated group commits.
+    """
+    fields = [Device._meta.get_field(name) for name in DEVICE_UPDATE_FIELDS]
+    qn = connection.ops.quote_name
+    sql = (f"UPDATE {qn(Device._meta.db_table)} SET "
+           + ", ".join(f"{qn(field.column)} = %s" for field in fields)
+           + f" WHERE {qn(Device._meta.pk.column)} = %s")
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(getattr(device, field.attname), connection) for field in fields] + [device.pk]
+            for device in devices
+        ])
+
+
+def update_device_stats(readings, metadata):
+    """Fold a batch of new rows into the devices' running ``DeviceStats``.
+
+    A device without a stats row yet gets one computed from its history,
+    which already holds this batch, so devices with uplinks from before
+    ``DeviceStats`` existed are not counted from zero.
+    """
+    device_pks = {reading.device_id for reading in readings}
+    stats = DeviceStats.objects.in_bulk(device_pks, field_name="device_id")
+    seeded = device_pks - stats.keys()
+    for pk in seeded:
+        stats[pk] = DeviceStats(device_id=pk, **compute_device_stats(pk))
+
+    for reading in readings:
+        if reading.device_id not in seeded:
+            stats[reading.device_id].add_reading(reading.f_cnt)
+    for meta in metadata:
+        if meta.device_id not in seeded:
+            stats[meta.device_id].add_metadata(meta.rssi, meta.snr)
+
+    now = timezone.now()
+    for device_stats in stats.values():
+        device_stats.updated_at = now
+        device_stats.pk = None
+    DeviceStats.objects.bulk_create(
+        stats.values(),
+        update_conflicts=True,
+        unique_fields=["device"],
+        update_fields=STATS_UPDATE_FIELDS,
+    )
+
+
+def count_result(result):
+    for outcome in ("stored", "unknown", "duplicates"):
+        if getattr(result, outcome):
+            uplinks_total.inc(outcome, amount=getattr(result, outcome))
+
+
+def uplink_key(reading):
+    """Idempotency key of a reading, None when the uplink carries no ``received_at``."""
+    if reading.received_at is None:
+        return None
+    return reading.device_id, reading.f_cnt, reading.received_at
+
+
+def build_rows(webhooks, devices, gateways, result, backfill=False):
+    """Turn validated webhooks into unsaved rows and update the devices' ``last_*`` fields.
+
+    ``gateways`` maps gateway ids to ``Gateway`` primary keys (see
+    ``GatewayCache.resolve``).
+
+    Returns ``(readings, metadata, touched devices)`` where ``metadata[i]``
+    holds the gateway rows of ``readings[i]``. Unknown devices, repeats
+    within the batch and uplinks in ``recent_uplinks`` are counted on
+    ``result`` and skipped.
+
+    Rows are timestamped with the arrival time unless ``backfill`` is set,
+    in which case the uplink's ``received_at`` is used and a device's
+    ``last_*`` fields only move forward in time.
+    """
+    readings = []
+    metadata = []
+    touched = {}
+    keys = set()
+
+    for validated in webhooks:
+        dev = validated.data.end_device_ids
+        device = devices.get((dev.device_id, dev.dev_eui))
+        if not device:
+            logger.warning(f"Received TTN uplink for unknown device {dev.device_id}/{dev.dev_eui}")
+            result.unknown += 1
+            continue
+
+        uplink = validated.data.uplink_message
+        received_at = parse_datetime(uplink.received_at)
+        timestamp = received_at if backfill and received_at else timezone.now()
+        latest = device.last_seen is None or timestamp >= device.last_seen
+        key = (device.pk, uplink.f_cnt, received_at)
+        if received_at is not None:
+            if key in keys or key in recent_uplinks:
+                result.duplicates += 1
+                continue
+            keys.add(key)
+
+        rows = []
+        for meta in uplink.rx_metadata:
+            rows.append(NetworkMetadata(
+                device=device,
+                timestamp=timestamp,
+                gateway_id=gateways[meta.gateway_ids.gateway_id],
+                rssi=meta.rssi,
+                snr=meta.snr,
+                channel_index=meta.channel_index,
+                uplink_token=meta.uplink_token if settings.STORE_UPLINK_TOKENS else None,
+                received_at=meta.received_at,
+            ))
+
+            if latest:
+                device.last_rssi = meta.rssi
+                device.last_snr = meta.snr
+                device.last_gateway_id = meta.gateway_ids.gateway_id
+
+        temperature, humidity, pressure, decoded_payload = extract_measurements(uplink, device)
+        readings.append(SensorReading(
+            device=device,
+            timestamp=timestamp,
+            temperature=temperature,
+            humidity=humidity,
+            pressure=pressure,
+            raw_payload=uplink.frm_payload,
+            decoded_payload_json=decoded_payload,
+            f_cnt=uplink.f_cnt,
+            received_at=received_at,
+        ))
+        metadata.append(rows)
+
+        if latest:
+            device.last_seen = timestamp
+            device.last_fcnt = uplink.f_cnt
+        touched[device.pk] = device
+
+    return readings, metadata, touched
+
+
+def stored_keys(readings):
+    """Keys of ``readings`` that already exist in the database, in one query."""
+    keys = {key for key in map(uplink_key, readings) if key is not None}
+    if not keys:
+        return set()
+    existing = SensorReading.objects.filter(
+        device_id__in={device_pk for device_pk, _, _ in keys},
+        f_cnt__in={f_cnt for _, f_cnt, _ in keys},
+        received_at__in={received_at for _, _, received_at in keys},
+    ).values_list("device_id", "f_cnt", "received_at")
+    return keys.intersection(existing)
+
+
+def is_duplicate_uplink(error):
+    """Whether ``error`` comes from the ``unique_uplink`` constraint."""
+    # PostgreSQL names the constraint, SQLite lists its columns.
+    diag = getattr(error.__cause__, "diag", None)
+    if diag is not None:
+        return diag.constraint_name == "unique_uplink"
+    table = SensorReading._meta.db_table
+    columns = ", ".join(f"{table}.{SensorReading._meta.get_field(name).column}"
+                        for name in ("device", "f_cnt", "received_at"))
+    return "unique_uplink" in str(error) or str(error) == f"UNIQUE constraint failed: {columns}"
+
+
+def store_rows(readings, metadata, touched, result, backfill=False):
+    """Write new uplinks, the device updates and the aggregates in a single transaction.
+
+    Uplinks already in the database are dropped first and counted on
+    ``result``. If a concurrent writer stores one of them in between, the
+    ``unique_uplink`` constraint aborts the transaction and the batch is
+    filtered and written again; any other integrity error is raised.
+    Returns the readings actually stored.
+
+    ``DeviceStats`` follow f_cnt in arrival order, which backfilled history
+    does not have, so ``backfill`` leaves them alone; rebuild them with
+    ``rebuild_device_stats`` once the backfill is done.
+    """
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                with stage("ingest", "dedup_check"):
+                    existing = stored_keys(readings)
+                kept = [i for i, reading in enumerate(readings) if uplink_key(reading) not in existing]
+                new_readings = [readings[i] for i in kept]
+                new_metadata = [meta for i in kept for meta in metadata[i]]
+                devices = {reading.device_id: touched[reading.device_id] for reading in new_readings}
+
+                if new_readings:
+                    with stage("ingest", "insert_metadata"):
+                        NetworkMetadata.objects.bulk_create(new_metadata)
+                    with stage("ingest", "insert_readings"):
+                        SensorReading.objects.bulk_create(new_readings)
+                    with stage("ingest", "update_devices"):
+                        update_devices(devices.values())
+                    if not backfill:
+                        with stage("ingest", "device_stats"):
+                            update_device_stats(new_readings, new_metadata)
+                    with stage("ingest", "rollups"):
+                        update_rollups(new_readings)
+            break
+        except IntegrityError as e:
+            if attempt or not is_duplicate_uplink(e):
+                raise
+            logger.info("Uplink stored concurrently, retrying batch without duplicates")
+            for reading in readings:
+                reading.pk = None
+            for reading_metadata in metadata:
+                for meta in reading_metadata:
+                    meta.pk = None
+
+    result.duplicates += len(readings) - len(new_readings)
+    keys = [key for key in map(uplink_key, readings) if key is not None]
+    # Only remembered once committed: a rolled back group must not turn
+    # its retries into "duplicates".
+    transaction.on_commit(lambda: recent_uplinks.add_many(keys))
+    return new_readings
+
+
+def notify_readings(readings):
+    with stage("ingest", "notify"):
+        for reading in readings:
+            send_reading_to_ws(reading)
+
+
+def ingest_uplinks(webhooks, notify=True, backfill=False):
+    """Persist validated TTN webhooks with one bulk write per table.
+
+    Readings, gateway metadata and the devices' ``last_*`` fields are written
+    inside a single transaction; WebSocket updates go out after the commit.
+    See ``build_rows`` for ``backfill``.
+    """
+    return ingest_groups([webhooks], notify=notify, backfill=backfill)[0]
+
+
+def ingest_groups(groups, notify=True, backfill=False):
+    """``ingest_uplinks`` for several lists of webhooks at once, with one ``IngestResult`` each.
+
+    Every group is written by the same ``store_rows`` call, so the device,
+    stats and rollup updates run once however many groups there are. An
+    uplink repeated in a later group counts as that group's duplicate.
+    """
+    results = [IngestResult() for _ in groups]
+    webhooks = [webhook for group in groups for webhook in group]
+    if not webhooks:
+        return results
+
+    with stage("ingest", "resolve_devices"):
+        devices = resolve_devices(webhooks)
+    with stage("ingest", "resolve_gateways"):
+        gateways = gateway_cache.resolve(gateway_positions(webhooks))
+    readings, metadata, touched, owners = [], [], {}, []
+    with stage("ingest", "build_rows"):
+        keys = set()
+        for owner, (group, result) in enumerate(zip(groups, results)):
+            group_readings, group_metadata, group_touched = build_rows(group, devices, gateways, result,
+                                                                    backfill=backfill)
+            for reading, reading_metadata in zip(group_readings, group_metadata):
+                key = uplink_key(reading)
+                if key is not None:
+                    if key in keys:
+                        result.duplicates += 1
+                        continue
+                    keys.add(key)
+                readings.append(reading)
+                metadata.append(reading_metadata)
+                owners.append(owner)
+            touched.update(group_touched)
+
+    stored = []
+    if readings:
+        stored = store_rows(readings, metadata, touched, IngestResult(), backfill=backfill)
+        kept = set(map(id, stored))
+        for reading, owner in zip(readings, owners):
+            if id(reading) in kept:
+                results[owner].stored += 1
+            else:
+                results[owner].duplicates += 1
+
+    if notify and stored:
+        # Immediate in autocommit; after the commit inside a transaction.
+        transaction.on_commit(lambda: notify_readings(stored))
+
+    for result in results:
+        count_result(result)
+    return results
+
+
+async def aingest_uplinks(webhooks, notify=True):
+    """``ingest_uplinks`` for async views.
+
+    Devices and known gateways are resolved on the event loop
+    (``DeviceCache.aget``, ``GatewayCache.lookup``) and
+    WebSocket updates are queued on the running loop; the transactional
+    write is a single ``sync_to_async`` call because Django transactions do
+    not work in async code yet.
+    """
+    result = IngestResult()
+    if not webhooks:
+        return result
+
+    devices = {}
+    with stage("ingest", "resolve_devices"):
+        for key in {(w.data.end_device_ids.device_id, w.data.end_device_ids.dev_eui) for w in webhooks}:
+            device = await device_cache.aget(*key)
+            if device is not None:
+                devices[key] = device
+    with stage("ingest", "resolve_gateways"):
+        reported = gateway_positions(webhooks)
+        gateways = gateway_cache.lookup(reported)
+        if gateways is None:  # a new or moved gateway
+            gateways = await sync_to_async(gateway_cache.resolve)(reported)
+
+    with stage("ingest", "build_rows"):
+        readings, metadata, touched = build_rows(webhooks, devices, gateways, result)
+    if readings:
+        readings = await sync_to_async(store_rows)(readings, metadata, touched, result)
+        result.stored = len(readings)
+
+    if notify and readings:
+        with stage("ingest", "notify"):
+            get_fanout().bind(asyncio.get_running_loop())
+            for reading in readings:
+                send_reading_to_ws(reading)
+
+    count_result(result)
+    return result
@@ -0,0 +1,248 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .ingest import ingest_groups, ingest_uplinks
+from .metrics import uplinks_total
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """Bounded write-behind buffer between the webhook view and the database.
+
+    Producers call ``put`` and return immediately; one background thread
+    drains the buffer and hands it to ``ingest_uplinks`` whenever
+    ``batch_size`` items are waiting or ``flush_interval`` seconds have
+    passed since the first item of the batch arrived. A batch that fails is
+    retried item by item, so one bad uplink does not take the rest with it.
+    """
+
+    def __init__(self, maxsize=10000, batch_size=500, flush_interval=1.0, enqueue_timeout=0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+            self._thread.start()
+
+    def put(self, webhook):
+        """Enqueue a validated webhook; returns False when the queue stays full."""
+        if self._stopping.is_set():
+            return False
+        self.start()
+        try:
+            self._queue.put(webhook, timeout=self.enqueue_timeout)
+        except queue.Full:
+            logger.warning("Ingest queue full, rejecting uplink")
+            return False
+        return True
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def stop(self, timeout=30.0):
+        """Stop accepting uplinks and flush everything that is still queued."""
+        self._stopping.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout)
+
+    def _next_batch(self):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        # These uplinks were already answered 202: if the batch fails, retry
+        # them one by one and only drop the ones that fail again.
+        try:
+            ingest_uplinks(batch)
+        except Exception:
+            logger.exception(f"Failed to flush {len(batch)} queued uplinks, storing them one by one")
+            for webhook in batch:
+                try:
+                    ingest_uplinks([webhook])
+                except Exception:
+                    device_id = webhook.data.end_device_ids.device_id
+                    logger.exception(f"Dropping queued uplink f_cnt {webhook.data.uplink_message.f_cnt} of {device_id}")
+                    uplinks_total.inc("failed")
+        finally:
+            close_old_connections()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._flush(batch)
+        connection.close()
+
+
+_ingest_queue = None
+_ingest_queue_lock = threading.Lock()
+
+
+def get_ingest_queue():
+    global _ingest_queue
+    with _ingest_queue_lock:
+        if _ingest_queue is None:
+            _ingest_queue = IngestQueue(
+                maxsize=settings.INGEST_QUEUE_SIZE,
+                batch_size=settings.INGEST_BATCH_SIZE,
+                flush_interval=settings.INGEST_FLUSH_INTERVAL,
+                enqueue_timeout=settings.INGEST_ENQUEUE_TIMEOUT,
+            )
+            atexit.register(_ingest_queue.stop)
+        return _ingest_queue
+
+
+class IngestWriter:
+    """The one thread that writes uplinks, committing them in groups.
+
+    ``submit`` hands validated webhooks to the writer and returns a
+    ``Future`` of their ``IngestResult``. The writer takes everything that
+    is waiting, up to ``batch_size`` uplinks, and stores it with one
+    ``ingest_groups`` call: one transaction and one set of device, stats
+    and rollup updates for the whole group. Concurrent webhooks therefore
+    share a commit instead of queueing for SQLite's write lock, and writes
+    per second grow with the group size rather than the request count. If
+    a group fails, its submissions are retried one by one so only the
+    failing one gets the error.
+
+    There is one writer per process; with several worker processes the
+    writers still take turns on the database lock, which WAL and the busy
+    timeout of the high_write profile keep short.
+    """
+
+    def __init__(self, batch_size=1000, maxsize=10000):
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, webhooks):
+        """Queue ``webhooks`` for the next group; raises ``queue.Full`` when the writer is saturated."""
+        if self._stopping.is_set():
+            raise queue.Full("Ingest writer is stopping")
+        self.start()
+        future = Future()
+        self._queue.put_nowait((list(webhooks), future))
+        return future
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def stop(self, timeout=30.0):
+        """Stop accepting uplinks and commit everything that is still queued."""
+        self._stopping.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout)
+
+    def _next_group(self):
+        try:
+            group = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        size = len(group[0][0])
+        while size < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            group.append(item)
+            size += len(item[0])
+        return group
+
+    def _commit(self, group):
+        group = [(webhooks, future) for webhooks, future in group if future.set_running_or_notify_cancel()]
+        try:
+            results = ingest_groups([webhooks for webhooks, _ in group])
+        except Exception:
+            logger.exception(f"Failed to store a group of {len(group)} submissions, storing them one by one")
+            results = None
+        if results is not None:
+            for (_, future), result in zip(group, results):
+                future.set_result(result)
+        else:
+            for webhooks, future in group:
+                try:
+                    future.set_result(ingest_uplinks(webhooks))
+                except Exception as e:
+                    future.set_exception(e)
+        close_old_connections()
+
+    def _run(self):
+        while not self._stopping.is_set() or not self._queue.empty():
+            group = self._next_group()
+            if group:
+                self._commit(group)
+        connection.close()
+
+
+_ingest_writer = None
+_ingest_writer_lock = threading.Lock()
+
+
+def get_ingest_writer():
+    global _ingest_writer
+    with _ingest_writer_lock:
+        if _ingest_writer is None:
+            _ingest_writer = IngestWriter(
+                batch_size=settings.INGEST_WRITER_BATCH_SIZE,
+                maxsize=settings.INGEST_QUEUE_SIZE,
+            )
+            atexit.register(_ingest_writer.stop)
+        return _ingest_writer
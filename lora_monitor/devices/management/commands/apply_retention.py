@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from devices.retention import TABLES, archive_expired, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = ("Move rows older than RETENTION_POLICIES into gzip NDJSON archives under ARCHIVE_DIR, "
+            "deleting them in small batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", choices=sorted(TABLES), action="append",
+                            help="table to process (repeatable, default: every table with a policy)")
+        parser.add_argument("--batch-size", type=int, default=5000,
+                            help="rows archived and deleted per transaction")
+        parser.add_argument("--pause", type=float, default=0.0,
+                            help="seconds to sleep between batches to give ingestion the writer")
+        parser.add_argument("--rows-per-file", type=int, default=1000000)
+        parser.add_argument("--dry-run", action="store_true", help="only count expired rows")
+
+    def handle(self, *args, **options):
+        tables = options["table"] or [table for table in TABLES if table in settings.RETENTION_POLICIES]
+        for table in tables:
+            cutoff = retention_cutoff(table)
+            if cutoff is None:
+                raise CommandError(f"No retention policy for {table} in RETENTION_POLICIES")
+            moved = archive_expired(table, batch_size=options["batch_size"], pause=options["pause"],
+                                    dry_run=options["dry_run"], rows_per_file=options["rows_per_file"])
+            verb = "would be archived" if options["dry_run"] else "archived"
+            self.stdout.write(f"{table}: {moved} row(s) older than {cutoff.isoformat()} {verb}")
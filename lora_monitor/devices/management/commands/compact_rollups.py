@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from devices.models import Device, SensorRollup
+from devices.rollups import GRANULARITIES, compact_rollups
+
+
+class Command(BaseCommand):
+    help = ("Recompute minute/hour/day SensorRollup rows from raw readings. By default only "
+            "buckets from the latest existing one onwards are recomputed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("device_ids", nargs="*", help="device_id values (default: all devices)")
+        parser.add_argument("--granularity", choices=[g for g, _, _ in GRANULARITIES], action="append",
+                            help="granularity to compact (repeatable, default: all)")
+        parser.add_argument("--since", help="recompute buckets from this ISO timestamp")
+        parser.add_argument("--full", action="store_true", help="recompute the whole history")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError(f"Invalid --since timestamp: {options['since']}")
+
+        devices = None
+        if options["device_ids"]:
+            devices = Device.objects.filter(device_id__in=options["device_ids"])
+
+        for granularity in options["granularity"] or [g for g, _, _ in GRANULARITIES]:
+            start = since
+            if start is None and not options["full"]:
+                latest = SensorRollup.objects.filter(granularity=granularity)
+                if devices is not None:
+                    latest = latest.filter(device__in=devices)
+                start = latest.aggregate(latest=Max("bucket"))["latest"]
+
+            written = compact_rollups(granularity, since=start, devices=devices,
+                                      batch_size=options["batch_size"])
+            origin = start.isoformat() if start else "the beginning"
+            self.stdout.write(f"{granularity}: {written} bucket(s) written since {origin}")
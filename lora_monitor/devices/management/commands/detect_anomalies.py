@@ -0,0 +1,39 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from devices.anomaly import scan_fleet
+from devices.models import Device
+
+
+class Command(BaseCommand):
+    help = "Run the configured anomaly detectors over the whole fleet (or selected devices)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("device_ids", nargs="*", help="device_id values (default: all devices)")
+        parser.add_argument("--days", type=int, help="only scan the last N days of history")
+        parser.add_argument("--verbose-anomalies", action="store_true", help="print every anomaly")
+
+    def handle(self, *args, **options):
+        devices = Device.objects.order_by("pk")
+        if options["device_ids"]:
+            devices = devices.filter(device_id__in=options["device_ids"])
+        start = timezone.now() - timedelta(days=options["days"]) if options["days"] else None
+
+        total = 0
+        started = time.perf_counter()
+        for device, anomalies in scan_fleet(devices, start=start):
+            total += len(anomalies)
+            if not anomalies:
+                continue
+            counts = Counter(f"{a['metric']}/{a['detector']}" for a in anomalies)
+            summary = ", ".join(f"{key}: {count}" for key, count in sorted(counts.items()))
+            self.stdout.write(f"{device.device_id}: {summary}")
+            if options["verbose_anomalies"]:
+                for a in anomalies:
+                    self.stdout.write(f"  {a['timestamp'].isoformat()} {a['metric']}={a['value']} ({a['detector']})")
+
+        self.stdout.write(f"{total} anomalies found in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,51 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from devices.export import EXPORTS, FORMATS, stream_export
+from devices.models import Device
+
+
+class Command(BaseCommand):
+    help = "Stream readings or gateway metadata to a CSV or NDJSON file (or stdout)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(EXPORTS))
+        parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+        parser.add_argument("--device", action="append", help="device_id (repeatable, default: all devices)")
+        parser.add_argument("--from", dest="start", help="ISO timestamp (inclusive)")
+        parser.add_argument("--to", dest="end", help="ISO timestamp (exclusive)")
+        parser.add_argument("--output", "-o", help="file to write (default: stdout)")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def parse(self, value, name):
+        if value is None:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f"Invalid {name} timestamp: {value}")
+        return parsed
+
+    def handle(self, *args, **options):
+        devices = None
+        if options["device"]:
+            devices = list(Device.objects.filter(device_id__in=options["device"]).values_list("pk", flat=True))
+            if not devices:
+                raise CommandError(f"Unknown device(s): {', '.join(options['device'])}")
+
+        blocks = stream_export(options["kind"], options["format"], devices=devices,
+                               start=self.parse(options["start"], "--from"),
+                               end=self.parse(options["end"], "--to"),
+                               chunk_size=options["chunk_size"])
+        output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        written = 0
+        try:
+            for block in blocks:
+                output.write(block)
+                written += len(block)
+        finally:
+            if options["output"]:
+                output.close()
+        if options["output"]:
+            self.stderr.write(f"Wrote {written} bytes to {options['output']}")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from devices.geocoding import geocode_device
+from devices.models import Device, GeocodeCache
+
+
+class Command(BaseCommand):
+    help = "Geocode devices that have an address but no location, through the geocode cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument("device_ids", nargs="*", help="device_id values (default: all devices)")
+        parser.add_argument("--all", action="store_true",
+                            help="also re-geocode devices that already have a location")
+        parser.add_argument("--retry-misses", action="store_true",
+                            help="drop cached 'not found' answers before geocoding")
+
+    def handle(self, *args, **options):
+        devices = Device.objects.exclude(address__isnull=True).exclude(address="").order_by("pk")
+        if options["device_ids"]:
+            devices = devices.filter(device_id__in=options["device_ids"])
+        if not options["all"]:
+            devices = devices.filter(location_lat__isnull=True)
+        if options["retry_misses"]:
+            deleted, _ = GeocodeCache.objects.filter(latitude__isnull=True).delete()
+            self.stdout.write(f"Dropped {deleted} cached miss(es)")
+
+        located = missing = 0
+        for pk, device_id, address in devices.values_list("pk", "device_id", "address").iterator():
+            if geocode_device(pk, address):
+                located += 1
+            else:
+                missing += 1
+                self.stdout.write(f"{device_id}: could not locate {address!r}")
+        self.stdout.write(self.style.SUCCESS(f"Located {located} device(s), {missing} without a location"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from devices.models import Device
+from devices.retention import TABLES, encode_row, read_archive
+
+
+class Command(BaseCommand):
+    help = "Print archived rows of a table as NDJSON, optionally limited to a device and time range."
+
+    def add_arguments(self, parser):
+        parser.add_argument("table", choices=sorted(TABLES))
+        parser.add_argument("--device", help="device_id")
+        parser.add_argument("--from", dest="start", help="ISO timestamp (inclusive), local time without an offset")
+        parser.add_argument("--to", dest="end", help="ISO timestamp (exclusive), local time without an offset")
+
+    def parse(self, value, name):
+        if value is None:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f"Invalid {name} timestamp: {value}")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def handle(self, *args, **options):
+        device = None
+        if options["device"]:
+            device = Device.objects.filter(device_id=options["device"]).first()
+            if device is None:
+                raise CommandError(f"Unknown device: {options['device']}")
+        rows = read_archive(options["table"], start=self.parse(options["start"], "--from"),
+                            end=self.parse(options["end"], "--to"), device=device)
+        for row in rows:
+            self.stdout.write(encode_row(row))
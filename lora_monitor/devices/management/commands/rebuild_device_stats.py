@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from devices.analytics import compute_device_stats
+from devices.models import Device, DeviceStats
+
+STAT_FIELDS = ["reading_count", "uplink_count", "rssi_sum", "rssi_count", "snr_sum", "snr_count",
+               "last_f_cnt", "lost_packets", "restart_count"]
+
+
+def differs(field, stored, expected):
+    if field in ("rssi_sum", "snr_sum"):
+        return abs(stored - expected) > 1e-6 * max(1.0, abs(expected))
+    return stored != expected
+
+
+class Command(BaseCommand):
+    help = "Recompute DeviceStats from the full reading and metadata history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("device_ids", nargs="*", help="device_id values (default: all devices)")
+        parser.add_argument("--check", action="store_true",
+                            help="only report devices whose stored stats differ from history")
+
+    def handle(self, *args, **options):
+        devices = Device.objects.order_by("pk")
+        if options["device_ids"]:
+            devices = devices.filter(device_id__in=options["device_ids"])
+
+        mismatched = 0
+        for device in devices.iterator():
+            expected = compute_device_stats(device)
+            stored = DeviceStats.objects.filter(device=device).first()
+            if stored is None:
+                mismatched += 1
+                self.stdout.write(f"{device.device_id}: no stats row")
+            else:
+                diffs = [
+                    f"{field}: {getattr(stored, field)} != {expected[field]}"
+                    for field in STAT_FIELDS
+                    if differs(field, getattr(stored, field), expected[field])
+                ]
+                if diffs:
+                    mismatched += 1
+                    self.stdout.write(f"{device.device_id}: " + ", ".join(diffs))
+
+            if not options["check"]:
+                with transaction.atomic():
+                    DeviceStats.objects.update_or_create(device=device, defaults=expected)
+
+        if options["check"]:
+            self.stdout.write(f"{mismatched} device(s) with stats out of sync")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt stats ({mismatched} device(s) were out of sync)"))
@@ -0,0 +1,71 @@
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from devices.codecs import CODECS, MEASUREMENTS, decode_batch, resolve_codec
+from devices.models import Device, SensorReading
+
+
+def as_value(value):
+    return None if math.isnan(value) else float(value)
+
+
+class Command(BaseCommand):
+    help = ("Re-decode stored raw payloads, e.g. after a firmware change. Afterwards run "
+            "compact_rollups --full for the affected devices to refresh chart rollups.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("device_ids", nargs="+", help="device_id values to re-decode")
+        parser.add_argument("--codec", choices=sorted(CODECS),
+                            help="codec to apply (default: the device's current codec)")
+        parser.add_argument("--since", help="only readings received at or after this ISO timestamp")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--dry-run", action="store_true", help="decode and report without writing")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError(f"Invalid --since timestamp: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        for device in Device.objects.filter(device_id__in=options["device_ids"]):
+            codec = CODECS[options["codec"]] if options["codec"] else resolve_codec(device)
+            readings = SensorReading.objects.filter(device=device, raw_payload__isnull=False)
+            if since is not None:
+                readings = readings.filter(timestamp__gte=since)
+
+            rows = readings.order_by("pk").values_list("pk", "raw_payload").iterator(chunk_size=options["batch_size"])
+            updated = invalid = 0
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= options["batch_size"]:
+                    u, i = self.redecode(batch, codec, options["dry_run"])
+                    updated, invalid = updated + u, invalid + i
+                    batch = []
+            if batch:
+                u, i = self.redecode(batch, codec, options["dry_run"])
+                updated, invalid = updated + u, invalid + i
+
+            self.stdout.write(f"{device.device_id}: {updated} reading(s) re-decoded with {codec.name}, "
+                              f"{invalid} payload(s) not decodable")
+
+    def redecode(self, batch, codec, dry_run):
+        decoded, payloads = decode_batch([raw for _, raw in batch], codec, with_payloads=True)
+        readings = [
+            # The stored JSON is what ingestion would have stored with this codec.
+            SensorReading(pk=pk, decoded_payload_json=payload,
+                          **{name: as_value(row[name]) for name in MEASUREMENTS})
+            for (pk, _), row, payload in zip(batch, decoded, payloads)
+            if row["valid"]
+        ]
+        if not dry_run:
+            with transaction.atomic():
+                SensorReading.objects.bulk_update(readings, list(MEASUREMENTS) + ["decoded_payload_json"])
+        return len(readings), len(batch) - len(readings)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from devices.replay import replay
+
+
+class Command(BaseCommand):
+    help = ("Re-ingest NDJSON (optionally .gz) archives of raw TTN webhook bodies in large batches, "
+            "without WebSocket notifications. Already stored uplinks are skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="archive files, one webhook body per line")
+        parser.add_argument("--batch-size", type=int, default=2000, help="uplinks per transaction")
+        parser.add_argument("--workers", type=int, default=0,
+                            help="processes parsing ahead of the writer (0: parse in this process)")
+        parser.add_argument("--checkpoint", help="JSON file recording progress; rerun with it to resume")
+        parser.add_argument("--report-every", type=float, default=5.0, help="seconds between progress lines")
+
+    def report(self, stats):
+        self.stdout.write(
+            f"{stats.lines} lines ({stats.rate:.0f}/s): {stats.stored} stored, {stats.duplicates} duplicate, "
+            f"{stats.unknown} unknown device, {stats.invalid} invalid"
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1 or options["workers"] < 0:
+            raise CommandError("--batch-size must be positive and --workers non-negative")
+        stats = replay(options["paths"], batch_size=options["batch_size"], workers=options["workers"],
+                       checkpoint=options["checkpoint"], report=self.report,
+                       report_every=options["report_every"])
+        self.stdout.write(self.style.SUCCESS(f"Replayed {stats.lines} lines, stored {stats.stored} uplinks"))
@@ -0,0 +1,269 @@
+"""In-process metrics rendered in the Prometheus text format.
+
+Hot paths wrap their stages in ``stage(path, name)``, which records the
+stage's wall time in ``lora_stage_duration_seconds`` and the SQL queries it
+ran in ``lora_stage_queries_total``. Queries are counted per thread by an
+execute wrapper that every new database connection gets (see
+``count_queries``), so counting does not depend on ``DEBUG``.
+
+Every thread records into its own shard and the shards are only merged
+when the endpoint is scraped (or folded into a shared total when their
+thread exits), so recording takes no lock: a stage costs two
+``perf_counter`` calls, a bisect and a few dict and list updates, a few
+times an empty ``with`` block (``python -m benchmarks.metrics_overhead``).
+Values live in the process that records them; under several workers each
+worker exposes its own, like the device cache and fan-out statistics
+rendered with them.
+"""
+import threading
+import weakref
+from bisect import bisect_left
+from time import perf_counter
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+def _value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Shard:
+    """Holder of a thread's values; its finalizer runs when the thread exits."""
+    __slots__ = ("values", "__weakref__")
+
+    def __init__(self):
+        self.values = {}
+
+
+class _Sharded:
+    """One ``{labels: value}`` dict per live recording thread.
+
+    When a thread exits its values are folded into ``_retired``, so
+    short-lived executor threads do not leave a shard behind each.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        # Guards ``_shards`` and ``_retired``; reentrant because a finalizer
+        # may run on a thread that already holds it.
+        self._lock = threading.RLock()
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard.values)
+            weakref.finalize(shard, self._retire, shard.values)
+            self._local.values = shard.values
+            return shard.values
+
+    def _retire(self, values):
+        with self._lock:
+            for i, shard in enumerate(self._shards):
+                if shard is values:
+                    del self._shards[i]
+                    break
+            for labels, value in values.items():
+                self._merge(self._retired, labels, value)
+
+    def _merge(self, total, labels, value):
+        raise NotImplementedError
+
+    def _snapshots(self):
+        with self._lock:
+            shards = list(self._shards)
+            retired = {}
+            for labels, value in self._retired.items():
+                self._merge(retired, labels, value)
+        return [list(retired.items())] + [list(shard.items()) for shard in shards]
+
+
+class Counter(_Sharded):
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _merge(self, total, labels, value):
+        total[labels] = total.get(labels, 0) + value
+
+    def values(self):
+        merged = {}
+        for items in self._snapshots():
+            for labels, value in items:
+                self._merge(merged, labels, value)
+        return merged
+
+    def value(self, *labels):
+        return self.values().get(labels, 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self.values().items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_value(value)}"
+
+
+class Histogram(_Sharded):
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        self._observe(labels, value)
+
+    def _observe(self, labels, value):
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            # count per bucket (+Inf last), then the sum
+            series = shard[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def _merge(self, total, labels, series):
+        merged = total.setdefault(labels, [0] * len(series))
+        for i, value in enumerate(series):
+            merged[i] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        merged = {}
+        for items in self._snapshots():
+            for labels, series in items:
+                self._merge(merged, labels, series)
+        names = self.labelnames + ("le",)
+        for labels, series in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_value(series[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+stage_duration = register(Histogram(
+    "lora_stage_duration_seconds", "Wall time of hot-path stages.", ("path", "stage")))
+stage_queries = register(Counter(
+    "lora_stage_queries_total", "SQL queries run by hot-path stages.", ("path", "stage")))
+uplinks_total = register(Counter(
+    "lora_ingest_uplinks_total", "Uplinks handled by ingestion, by outcome.", ("result",)))
+webhook_requests = register(Counter(
+    "lora_webhook_requests_total", "TTN webhook requests, by view and response status.", ("view", "status")))
+
+
+class _QueryCount(threading.local):
+    # Reading ``django.db.connection`` costs several microseconds per
+    # access; a plain thread-local is what keeps ``stage`` cheap.
+    value = 0
+
+
+_query_count = _QueryCount()
+
+
+def count_queries(execute, sql, params, many, context):
+    """Execute wrapper counting the queries run by the current thread."""
+    _query_count.value += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """``connection_created`` receiver."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+class stage:
+    """Context manager timing one stage of ``path`` and counting its queries."""
+    __slots__ = ("labels", "_started", "_queries")
+
+    def __init__(self, path, name):
+        self.labels = (path, name)
+
+    def __enter__(self):
+        self._queries = _query_count.value
+        self._started = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = perf_counter() - self._started
+        stage_duration._observe(self.labels, elapsed)
+        queries = _query_count.value - self._queries
+        if queries:
+            stage_queries.inc(*self.labels, amount=queries)
+        return False
+
+
+def runtime_samples():
+    """``(name, type, help, value)`` of the ingestion and fan-out state, read at scrape time."""
+    from django.conf import settings
+    from .cache import device_cache, gateway_cache
+    from .dedup import recent_uplinks
+    from .fanout import get_fanout
+    from .geocoding import get_geocode_worker
+    from .ingest_queue import get_ingest_queue, get_ingest_writer
+
+    cache = device_cache.stats()
+    fanout = get_fanout().stats()
+    queue_depth = 0
+    if settings.INGEST_MODE == "queue":
+        queue_depth = get_ingest_queue().qsize()
+    elif settings.INGEST_MODE == "writer":
+        queue_depth = get_ingest_writer().qsize()  # submissions, not uplinks
+    return [
+        ("lora_ingest_queue_depth", "gauge", "Uplinks (submissions in writer mode) waiting to be written.", queue_depth),
+        ("lora_device_cache_hits_total", "counter", "Device cache hits.", cache["hits"]),
+        ("lora_device_cache_negative_hits_total", "counter", "Device cache hits on unknown devices.",
+         cache["negative_hits"]),
+        ("lora_device_cache_misses_total", "counter", "Device cache misses.", cache["misses"]),
+        ("lora_device_cache_size", "gauge", "Entries in the device cache.", cache["size"]),
+        ("lora_gateway_cache_size", "gauge", "Entries in the gateway cache.", gateway_cache.stats()["size"]),
+        ("lora_dedup_hits_total", "counter", "Duplicate uplinks dropped from memory.", recent_uplinks.hits),
+        ("lora_dedup_keys", "gauge", "Uplink keys remembered for deduplication.", len(recent_uplinks)),
+        ("lora_ws_published_total", "counter", "Readings published to WebSocket groups.", fanout["published"]),
+        ("lora_ws_messages_sent_total", "counter", "WebSocket group messages sent.", fanout["messages_sent"]),
+        ("lora_ws_dropped_total", "counter", "Readings dropped by the WebSocket fan-out.", fanout["dropped"]),
+        ("lora_ws_pending_groups", "gauge", "WebSocket groups with readings waiting to be sent.",
+         fanout["pending_groups"]),
+        ("lora_geocode_queue_depth", "gauge", "Addresses waiting for background geocoding.",
+         get_geocode_worker().qsize()),
+    ]
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for name, kind, documentation, value in runtime_samples():
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {_value(value)}")
+    return "\n".join(lines) + "\n"
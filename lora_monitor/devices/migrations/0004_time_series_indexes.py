@@ -0,0 +1,21 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0003_alter_sensorreading_decoded_payload_json'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='networkmetadata',
+            index=models.Index(fields=['device', 'timestamp'], name='devices_net_device__e6f675_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sensorreading',
+            index=models.Index(fields=['device', 'timestamp'], name='devices_sen_device__4f1203_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0004_time_series_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reading_count', models.IntegerField(default=0)),
+                ('uplink_count', models.IntegerField(default=0)),
+                ('rssi_sum', models.FloatField(default=0)),
+                ('rssi_count', models.IntegerField(default=0)),
+                ('snr_sum', models.FloatField(default=0)),
+                ('snr_count', models.IntegerField(default=0)),
+                ('last_f_cnt', models.IntegerField(blank=True, null=True)),
+                ('lost_packets', models.IntegerField(default=0)),
+                ('restart_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='devices.device')),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0005_devicestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=8)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('temperature_sum', models.FloatField(default=0)),
+                ('temperature_count', models.IntegerField(default=0)),
+                ('humidity_min', models.FloatField(blank=True, null=True)),
+                ('humidity_max', models.FloatField(blank=True, null=True)),
+                ('humidity_sum', models.FloatField(default=0)),
+                ('humidity_count', models.IntegerField(default=0)),
+                ('pressure_min', models.FloatField(blank=True, null=True)),
+                ('pressure_max', models.FloatField(blank=True, null=True)),
+                ('pressure_sum', models.FloatField(default=0)),
+                ('pressure_count', models.IntegerField(default=0)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='devices.device')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sensorrollup',
+            constraint=models.UniqueConstraint(fields=('device', 'granularity', 'bucket'), name='unique_rollup_bucket'),
+        ),
+    ]
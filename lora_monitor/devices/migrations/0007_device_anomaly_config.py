@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0006_sensorrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='anomaly_config',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0007_device_anomaly_config'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='payload_codec',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.26 on 2026-10-18 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0009_geocodecache'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['last_seen'], name='devices_dev_last_se_66ef2a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['application_id', 'last_seen'], name='devices_dev_applica_d433d0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['last_gateway_id', 'last_seen'], name='devices_dev_last_ga_cb9677_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0012_sensorreading_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Gateway',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gateway_id', models.CharField(max_length=128, unique=True)),
+                ('eui', models.CharField(blank=True, max_length=32, null=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('altitude', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        # Nullable until 0015 drops it, so that migrating back can re-add
+        # the column before 0014 fills it again.
+        migrations.AlterField(
+            model_name='networkmetadata',
+            name='gateway_id',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='networkmetadata',
+            name='gateway_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='devices.gateway'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+from django.db.models import Max, OuterRef, Subquery
+
+
+def register_gateways(apps, schema_editor):
+    Gateway = apps.get_model("devices", "Gateway")
+    NetworkMetadata = apps.get_model("devices", "NetworkMetadata")
+
+    # One gateway per distinct gateway_id, placed at its last reported position.
+    gateways = []
+    for row in NetworkMetadata.objects.values("gateway_id").annotate(last=Max("timestamp")):
+        position = (NetworkMetadata.objects
+                    .filter(gateway_id=row["gateway_id"], gateway_lat__isnull=False)
+                    .order_by("-timestamp")
+                    .values_list("gateway_lat", "gateway_lon", "gateway_alt")
+                    .first()) or (None, None, None)
+        gateways.append(Gateway(gateway_id=row["gateway_id"], latitude=position[0],
+                                longitude=position[1], altitude=position[2]))
+    Gateway.objects.bulk_create(gateways, ignore_conflicts=True)
+
+    NetworkMetadata.objects.update(gateway_ref=Subquery(
+        Gateway.objects.filter(gateway_id=OuterRef("gateway_id")).values("pk")[:1]
+    ))
+
+
+def restore_gateway_columns(apps, schema_editor):
+    Gateway = apps.get_model("devices", "Gateway")
+    NetworkMetadata = apps.get_model("devices", "NetworkMetadata")
+
+    gateway = Gateway.objects.filter(pk=OuterRef("gateway_ref"))
+    NetworkMetadata.objects.update(
+        gateway_id=Subquery(gateway.values("gateway_id")[:1]),
+        gateway_lat=Subquery(gateway.values("latitude")[:1]),
+        gateway_lon=Subquery(gateway.values("longitude")[:1]),
+        gateway_alt=Subquery(gateway.values("altitude")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0013_gateway'),
+    ]
+
+    operations = [
+        migrations.RunPython(register_gateways, restore_gateway_columns),
+    ]
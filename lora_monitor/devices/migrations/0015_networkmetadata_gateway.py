@@ -0,0 +1,44 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0014_gateway_data'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='networkmetadata',
+            name='gateway_id',
+        ),
+        migrations.RemoveField(
+            model_name='networkmetadata',
+            name='gateway_lat',
+        ),
+        migrations.RemoveField(
+            model_name='networkmetadata',
+            name='gateway_lon',
+        ),
+        migrations.RemoveField(
+            model_name='networkmetadata',
+            name='gateway_alt',
+        ),
+        migrations.RenameField(
+            model_name='networkmetadata',
+            old_name='gateway_ref',
+            new_name='gateway',
+        ),
+        migrations.AlterField(
+            model_name='networkmetadata',
+            name='gateway',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='metadata', to='devices.gateway'),
+        ),
+        migrations.AddIndex(
+            model_name='networkmetadata',
+            index=models.Index(fields=['gateway', 'timestamp'], name='devices_net_gateway_904d10_idx'),
+        ),
+    ]
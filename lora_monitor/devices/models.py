@@ -1,6 +1,30 @@
+from datetime import timedelta
+
 from django.db import models
+from django.db.models import BooleanField, Case, Q, Value, When
 from django.utils import timezone
 
+# A device that sent nothing for this long is shown as offline.
+ONLINE_TIMEOUT = timedelta(minutes=30)
+
+
+class DeviceQuerySet(models.QuerySet):
+    def online_cutoff(self, now=None):
+        return (now or timezone.now()) - ONLINE_TIMEOUT
+
+    def with_online_status(self, now=None):
+        return self.annotate(online=Case(
+            When(last_seen__gte=self.online_cutoff(now), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ))
+
+    def online(self, now=None):
+        return self.filter(last_seen__gte=self.online_cutoff(now))
+
+    def offline(self, now=None):
+        return self.filter(Q(last_seen__lt=self.online_cutoff(now)) | Q(last_seen__isnull=True))
+
 
 class Device(models.Model):
     device_id = models.CharField(max_length=128, unique=True)
@@ -20,13 +44,25 @@ class Device(models.Model):
 
     last_fcnt = models.IntegerField(blank=True, null=True)
 
+    anomaly_config = models.JSONField(blank=True, null=True)
+    payload_codec = models.CharField(max_length=64, blank=True, null=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def is_online(self, timeout_minutes=30):
+    objects = DeviceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["last_seen"]),
+            models.Index(fields=["application_id", "last_seen"]),
+            models.Index(fields=["last_gateway_id", "last_seen"]),
+        ]
+
+    def is_online(self, timeout=ONLINE_TIMEOUT):
         if not self.last_seen:
             return False
-        return (timezone.now() - self.last_seen).total_seconds() < timeout_minutes * 60
+        return self.last_seen >= timezone.now() - timeout
 
     def __str__(self):
         return f"{self.device_id} ({self.dev_eui})"
@@ -34,34 +70,168 @@ class Device(models.Model):
 
 class SensorReading(models.Model):
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="readings")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
 
     temperature = models.FloatField(null=True, blank=True)
     humidity = models.FloatField(null=True, blank=True)
     pressure = models.FloatField(null=True, blank=True)
     f_cnt = models.IntegerField(blank=True, null=True)
+    # uplink_message.received_at from the network server; identical on retries.
+    received_at = models.DateTimeField(blank=True, null=True)
     raw_payload = models.TextField(blank=True, null=True)
     decoded_payload_json = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["device", "timestamp"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["device", "f_cnt", "received_at"], name="unique_uplink"),
+        ]
+
     def __str__(self):
         return f"Reading {self.id} @ {self.timestamp} for {self.device.device_id}"
 
 
+class Gateway(models.Model):
+    """A TTN gateway as reported in uplink ``rx_metadata``; registered on first sight."""
+    gateway_id = models.CharField(max_length=128, unique=True)
+    eui = models.CharField(max_length=32, blank=True, null=True)
+
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    altitude = models.FloatField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.gateway_id
+
+
 class NetworkMetadata(models.Model):
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="network_meta")
+    gateway = models.ForeignKey(Gateway, on_delete=models.PROTECT, related_name="metadata")
     timestamp = models.DateTimeField(default=timezone.now)
 
-    gateway_id = models.CharField(max_length=128)
     rssi = models.FloatField()
     snr = models.FloatField()
     channel_index = models.IntegerField(blank=True, null=True)
 
-    gateway_lat = models.FloatField(blank=True, null=True)
-    gateway_lon = models.FloatField(blank=True, null=True)
-    gateway_alt = models.FloatField(blank=True, null=True)
-
+    # Only stored with STORE_UPLINK_TOKENS; nothing here reads it.
     uplink_token = models.TextField(blank=True, null=True)
     received_at = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["device", "timestamp"]),
+            models.Index(fields=["gateway", "timestamp"]),
+        ]
+
+    def __str__(self):
+        return f"Meta {self.gateway} ({self.rssi} dBm)"
+
+class DeviceStats(models.Model):
+    device = models.OneToOneField(Device, on_delete=models.CASCADE, related_name="stats")
+
+    reading_count = models.IntegerField(default=0)
+    uplink_count = models.IntegerField(default=0)
+    rssi_sum = models.FloatField(default=0)
+    rssi_count = models.IntegerField(default=0)
+    snr_sum = models.FloatField(default=0)
+    snr_count = models.IntegerField(default=0)
+
+    last_f_cnt = models.IntegerField(blank=True, null=True)
+    lost_packets = models.IntegerField(default=0)
+    restart_count = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def avg_rssi(self):
+        return self.rssi_sum / self.rssi_count if self.rssi_count else None
+
+    @property
+    def avg_snr(self):
+        return self.snr_sum / self.snr_count if self.snr_count else None
+
+    def add_reading(self, f_cnt):
+        self.reading_count += 1
+        if f_cnt is None:
+            return
+        if self.last_f_cnt is not None:
+            diff = f_cnt - self.last_f_cnt - 1
+            if diff > 0:
+                self.lost_packets += diff
+            elif f_cnt < self.last_f_cnt:
+                self.restart_count += 1
+        self.last_f_cnt = f_cnt
+
+    def add_metadata(self, rssi, snr):
+        self.uplink_count += 1
+        if rssi is not None:
+            self.rssi_sum += rssi
+            self.rssi_count += 1
+        if snr is not None:
+            self.snr_sum += snr
+            self.snr_count += 1
+
+    def __str__(self):
+        return f"Stats for {self.device.device_id}"
+
+
+class SensorRollup(models.Model):
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+    GRANULARITY_CHOICES = [
+        (MINUTE, "Minute"),
+        (HOUR, "Hour"),
+        (DAY, "Day"),
+    ]
+
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="rollups")
+    granularity = models.CharField(max_length=8, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    temperature_min = models.FloatField(blank=True, null=True)
+    temperature_max = models.FloatField(blank=True, null=True)
+    temperature_sum = models.FloatField(default=0)
+    temperature_count = models.IntegerField(default=0)
+    humidity_min = models.FloatField(blank=True, null=True)
+    humidity_max = models.FloatField(blank=True, null=True)
+    humidity_sum = models.FloatField(default=0)
+    humidity_count = models.IntegerField(default=0)
+    pressure_min = models.FloatField(blank=True, null=True)
+    pressure_max = models.FloatField(blank=True, null=True)
+    pressure_sum = models.FloatField(default=0)
+    pressure_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["device", "granularity", "bucket"], name="unique_rollup_bucket"),
+        ]
+
+    def mean(self, metric):
+        count = getattr(self, f"{metric}_count")
+        return getattr(self, f"{metric}_sum") / count if count else None
+
+    def __str__(self):
+        return f"{self.granularity} rollup {self.bucket} for {self.device.device_id}"
+
+
+class GeocodeCache(models.Model):
+    """Geocoder answers keyed by normalized address; a miss is stored with null coordinates."""
+    address = models.CharField(max_length=255, unique=True)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    backend = models.CharField(max_length=128, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def found(self):
+        return self.latitude is not None and self.longitude is not None
+
     def __str__(self):
-        return f"Meta {self.gateway_id} ({self.rssi} dBm)"
\ No newline at end of file
+        return f"{self.address} -> {self.latitude}, {self.longitude}"
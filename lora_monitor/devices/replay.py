@@ -0,0 +1,147 @@
+"""Re-ingestion of archived TTN webhook bodies (one JSON body per line).
+
+Lines are read lazily in batches and validated with the same slim schema
+as the webhook views, optionally in worker processes, while the calling
+process stays the only writer and stores every batch with
+``ingest_uplinks`` in backfill mode: one transaction per batch, rows dated
+by the uplink's ``received_at`` and duplicates skipped by the uplink
+idempotency key. ``DeviceStats`` of the devices that got uplinks are
+rebuilt from their history at the end. This module imports nothing from Django at load
+time so worker processes can be spawned without setting it up.
+"""
+import gzip
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from .schemas import ingest_webhook_adapter
+
+
+@dataclass
+class ReplayStats:
+    lines: int = 0
+    invalid: int = 0
+    stored: int = 0
+    duplicates: int = 0
+    unknown: int = 0
+    devices: set = field(default_factory=set)  # device_id values with stored uplinks
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.lines / elapsed if elapsed > 0 else 0.0
+
+
+def parse_lines(lines):
+    """Validate raw webhook lines; returns ``(webhooks, invalid count)``."""
+    webhooks = []
+    invalid = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            webhooks.append(ingest_webhook_adapter.validate_json(line))
+        except ValueError:
+            invalid += 1
+    return webhooks, invalid
+
+
+def open_archive(path):
+    return gzip.open(path, "rb") if str(path).endswith(".gz") else open(path, "rb")
+
+
+def read_batches(path, batch_size, skip=0):
+    """Yield ``(line number after the batch, lines)`` from ``path``, skipping ``skip`` lines."""
+    with open_archive(path) as f:
+        for _ in itertools.islice(f, skip):
+            pass
+        position = skip
+        while True:
+            lines = list(itertools.islice(f, batch_size))
+            if not lines:
+                break
+            position += len(lines)
+            yield position, lines
+
+
+class Checkpoint:
+    """``{path: lines done}`` in a JSON file, rewritten atomically after every batch."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = json.load(f)
+
+    def get(self, source):
+        return self.done.get(os.path.abspath(source), 0)
+
+    def set(self, source, lines):
+        self.done[os.path.abspath(source)] = lines
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.done, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+def replay(paths, batch_size=2000, workers=0, checkpoint=None, report=None, report_every=5.0):
+    """Ingest archived webhooks from ``paths``; returns the ``ReplayStats``.
+
+    With ``workers`` > 0 parsing runs in that many processes, at most two
+    batches per worker ahead of the writer. ``report`` is called with the
+    stats at most every ``report_every`` seconds and once at the end.
+    """
+    from .analytics import rebuild_device_stats
+    from .ingest import ingest_uplinks
+    from .models import Device
+
+    checkpoint = Checkpoint(checkpoint)
+    stats = ReplayStats()
+    last_report = time.monotonic()
+    pool = ProcessPoolExecutor(max_workers=workers) if workers else None
+
+    def store(source, position, parsed):
+        nonlocal last_report
+        webhooks, invalid = parsed
+        result = ingest_uplinks(webhooks, notify=False, backfill=True)
+        stats.invalid += invalid
+        stats.stored += result.stored
+        stats.duplicates += result.duplicates
+        stats.unknown += result.unknown
+        if result.stored:
+            stats.devices.update(webhook.data.end_device_ids.device_id for webhook in webhooks)
+        checkpoint.set(source, position)
+        if report and time.monotonic() - last_report >= report_every:
+            report(stats)
+            last_report = time.monotonic()
+
+    try:
+        for source in paths:
+            in_flight = []
+            for position, lines in read_batches(source, batch_size, skip=checkpoint.get(source)):
+                stats.lines += len(lines)
+                if pool is None:
+                    store(source, position, parse_lines(lines))
+                    continue
+                in_flight.append((position, pool.submit(parse_lines, lines)))
+                if len(in_flight) >= 2 * workers:
+                    position, future = in_flight.pop(0)
+                    store(source, position, future.result())
+            for position, future in in_flight:
+                store(source, position, future.result())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        # Also after an interruption: the batches stored so far skipped them.
+        for device in Device.objects.filter(device_id__in=stats.devices).iterator():
+            rebuild_device_stats(device)
+    if report:
+        report(stats)
+    return stats
@@ -0,0 +1,225 @@
+"""Retention of raw readings and gateway metadata.
+
+``RETENTION_POLICIES`` maps a table name from ``TABLES`` to the number of
+days its rows are kept. ``archive_expired`` moves older rows, oldest first,
+into gzip-compressed NDJSON files under ``ARCHIVE_DIR/<table>/``. Each batch
+is written and synced to disk before its rows are deleted in a short
+transaction of its own, so the ingestion writer is never blocked for long
+and a crash never loses rows; at worst a batch is archived twice, which
+``read_archive`` hides by skipping repeated ids.
+
+Every archive file is listed in ``ARCHIVE_DIR/<table>/manifest.json`` with
+its row count and id/timestamp range, so readers only open the files that
+overlap the requested range. Rollups and ``DeviceStats`` are not touched:
+charts and fleet statistics keep covering archived periods. Metadata rows
+are archived with their ``gateway_id`` foreign key; gateways are never
+deleted (``PROTECT``), so the ids stay resolvable.
+"""
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import NetworkMetadata, SensorReading
+
+TABLES = {
+    "sensor_readings": SensorReading,
+    "network_metadata": NetworkMetadata,
+}
+
+MANIFEST = "manifest.json"
+
+
+def _encode(value):
+    # Full precision, unlike DjangoJSONEncoder which cuts to milliseconds.
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_row(row):
+    return json.dumps(row, default=_encode)
+
+
+def columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def retention_cutoff(table, now=None):
+    """Timestamp before which rows of ``table`` expire, None when it has no policy."""
+    days = settings.RETENTION_POLICIES.get(table)
+    if days is None:
+        return None
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archive_path(table):
+    return Path(settings.ARCHIVE_DIR) / table
+
+
+def load_manifest(table):
+    path = archive_path(table) / MANIFEST
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(table, entries):
+    path = archive_path(table) / MANIFEST
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class ArchiveWriter:
+    """Appends rows to gzip NDJSON files of at most ``rows_per_file`` rows.
+
+    The manifest is rewritten after every batch, so rows are listed there
+    before they are deleted from the database.
+    """
+
+    def __init__(self, table, rows_per_file=1000000):
+        self.table = table
+        self.rows_per_file = rows_per_file
+        self.directory = archive_path(table)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.entries = load_manifest(table)
+        self._file = None
+        self._entry = None
+
+    def _open(self):
+        name = f"{self.table}-{timezone.now():%Y%m%dT%H%M%S%f}.ndjson.gz"
+        self._raw = open(self.directory / name, "wb")
+        self._file = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        self._entry = {"file": name, "rows": 0, "min_id": None, "max_id": None,
+                       "min_timestamp": None, "max_timestamp": None}
+        self.entries.append(self._entry)
+
+    def write(self, rows):
+        """Write one batch of row dicts and make it durable."""
+        if self._file is None:
+            self._open()
+        entry = self._entry
+        for row in rows:
+            self._file.write(encode_row(row).encode() + b"\n")
+            timestamp = row["timestamp"].isoformat()
+            entry["min_id"] = row["id"] if entry["min_id"] is None else min(entry["min_id"], row["id"])
+            entry["max_id"] = row["id"] if entry["max_id"] is None else max(entry["max_id"], row["id"])
+            entry["min_timestamp"] = min(filter(None, (entry["min_timestamp"], timestamp)))
+            entry["max_timestamp"] = max(filter(None, (entry["max_timestamp"], timestamp)))
+        entry["rows"] += len(rows)
+        self._file.flush()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        _save_manifest(self.table, self.entries)
+        if entry["rows"] >= self.rows_per_file:
+            self.close()
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._raw.close()
+        self._file = None
+
+
+def archive_expired(table, now=None, batch_size=5000, pause=0.0, dry_run=False, rows_per_file=1000000):
+    """Archive and delete rows of ``table`` older than its retention period.
+
+    Returns the number of rows moved (or that would be moved with ``dry_run``).
+    """
+    model = TABLES[table]
+    cutoff = retention_cutoff(table, now)
+    if cutoff is None:
+        return 0
+    expired = model.objects.filter(timestamp__lt=cutoff)
+    if dry_run:
+        return expired.count()
+
+    names = columns(model)
+    writer = ArchiveWriter(table, rows_per_file=rows_per_file)
+    moved = 0
+    last_pk = 0
+    try:
+        while True:
+            rows = [dict(zip(names, values)) for values in
+                    expired.filter(pk__gt=last_pk).order_by("pk").values_list(*names)[:batch_size]]
+            if not rows:
+                break
+            writer.write(rows)
+            pks = [row["id"] for row in rows]
+            with transaction.atomic():
+                model.objects.filter(pk__in=pks).delete()
+            moved += len(rows)
+            last_pk = pks[-1]
+            if pause:
+                time.sleep(pause)
+    finally:
+        writer.close()
+    return moved
+
+
+def read_archive(table, start=None, end=None, device=None):
+    """Yield archived rows of ``table`` with ``start <= timestamp < end``.
+
+    ``device`` is a Device or its pk; naive ``start``/``end`` are taken in
+    the current time zone. Rows are dicts of the model's columns with
+    timestamps parsed back to datetimes, in archive order.
+    """
+    device_pk = getattr(device, "pk", device)
+    if start is not None and timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    if end is not None and timezone.is_naive(end):
+        end = timezone.make_aware(end)
+    datetime_fields = [field.attname for field in TABLES[table]._meta.concrete_fields
+                       if field.get_internal_type() == "DateTimeField"]
+    entries = load_manifest(table)
+    # A batch archived just before a crash is archived again by the next
+    # run; only files whose id ranges overlap another file need checking.
+    overlapping = {
+        i for i, a in enumerate(entries) for j, b in enumerate(entries)
+        if i != j and a["min_id"] <= b["max_id"] and b["min_id"] <= a["max_id"]
+    }
+    seen = set()
+    for i, entry in enumerate(entries):
+        if start is not None and parse_datetime(entry["max_timestamp"]) < start:
+            continue
+        if end is not None and parse_datetime(entry["min_timestamp"]) >= end:
+            continue
+        for row in _read_file(archive_path(table) / entry["file"]):
+            if device_pk is not None and row["device_id"] != device_pk:
+                continue
+            for name in datetime_fields:
+                if row[name] is not None:
+                    row[name] = parse_datetime(row[name])
+            if start is not None and row["timestamp"] < start:
+                continue
+            if end is not None and row["timestamp"] >= end:
+                continue
+            if i in overlapping:
+                if row["id"] in seen:
+                    continue
+                seen.add(row["id"])
+            yield row
+
+
+def _read_file(path):
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+    except EOFError:
+        # File of an interrupted run: every synced batch is readable, only
+        # the gzip trailer is missing.
+        pass
@@ -0,0 +1,184 @@
+from datetime import timedelta, timezone as dt_timezone
+from functools import reduce
+from operator import or_
+
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+
+from .models import SensorReading, SensorRollup
+
+METRICS = ("temperature", "humidity", "pressure")
+
+# Finest first. Buckets are aligned in UTC.
+GRANULARITIES = [
+    (SensorRollup.MINUTE, timedelta(minutes=1), TruncMinute),
+    (SensorRollup.HOUR, timedelta(hours=1), TruncHour),
+    (SensorRollup.DAY, timedelta(days=1), TruncDay),
+]
+
+# Keys looked up per query; keeps the OR chain under SQLite's expression
+# depth limit (1000) for large writer batches.
+ROLLUP_LOOKUP_CHUNK = 300
+
+ROLLUP_UPDATE_FIELDS = ["count"] + [
+    f"{metric}_{part}" for metric in METRICS for part in ("min", "max", "sum", "count")
+]
+
+
+def bucket_start(timestamp, granularity):
+    timestamp = timestamp.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if granularity == SensorRollup.MINUTE:
+        return timestamp
+    timestamp = timestamp.replace(minute=0)
+    if granularity == SensorRollup.HOUR:
+        return timestamp
+    return timestamp.replace(hour=0)
+
+
+def _add_value(rollup, metric, value):
+    if value is None:
+        return
+    current_min = getattr(rollup, f"{metric}_min")
+    current_max = getattr(rollup, f"{metric}_max")
+    setattr(rollup, f"{metric}_min", value if current_min is None else min(current_min, value))
+    setattr(rollup, f"{metric}_max", value if current_max is None else max(current_max, value))
+    setattr(rollup, f"{metric}_sum", getattr(rollup, f"{metric}_sum") + value)
+    setattr(rollup, f"{metric}_count", getattr(rollup, f"{metric}_count") + 1)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def update_rollups(readings):
+    """Merge freshly inserted readings into their minute/hour/day rollups."""
+    keys = {
+        (reading.device_id, granularity, bucket_start(reading.timestamp, granularity))
+        for reading in readings
+        for granularity, _, _ in GRANULARITIES
+    }
+    rollups = {}
+    for chunk in _chunks(list(keys), ROLLUP_LOOKUP_CHUNK):
+        # An OR of exact keys is one unique_rollup_bucket probe per key;
+        # device_id__in/bucket__in would read every rollup of the devices.
+        lookup = reduce(or_, (Q(device_id=device_pk, granularity=granularity, bucket=bucket)
+                              for device_pk, granularity, bucket in chunk))
+        for r in SensorRollup.objects.filter(lookup):
+            rollups[(r.device_id, r.granularity, r.bucket)] = r
+
+    touched = {}
+    for reading in readings:
+        for granularity, _, _ in GRANULARITIES:
+            key = (reading.device_id, granularity, bucket_start(reading.timestamp, granularity))
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = rollups[key] = SensorRollup(device_id=key[0], granularity=granularity, bucket=key[2])
+            touched[key] = rollup
+            rollup.count += 1
+            for metric in METRICS:
+                _add_value(rollup, metric, getattr(reading, metric))
+
+    # One upsert for new and changed buckets; far cheaper to build than
+    # bulk_update's CASE per row and field.
+    for rollup in touched.values():
+        rollup.pk = None
+    _upsert(list(touched.values()))
+
+
+def compact_rollups(granularity, since=None, devices=None, batch_size=1000):
+    """Recompute ``granularity`` rollups from raw readings at or after ``since``.
+
+    Buckets are aggregated in the database and upserted, so the command can be
+    rerun over any range. Returns the number of buckets written.
+    """
+    trunc = next(t for g, _, t in GRANULARITIES if g == granularity)
+    readings = SensorReading.objects.all()
+    if since is not None:
+        readings = readings.filter(timestamp__gte=bucket_start(since, granularity))
+    if devices is not None:
+        readings = readings.filter(device__in=devices)
+
+    aggregates = {"count": Count("id")}
+    for metric in METRICS:
+        aggregates[f"{metric}_min"] = Min(metric)
+        aggregates[f"{metric}_max"] = Max(metric)
+        aggregates[f"{metric}_sum"] = Sum(metric)
+        aggregates[f"{metric}_count"] = Count(metric)
+
+    rows = (readings
+            .annotate(bucket=trunc("timestamp", tzinfo=dt_timezone.utc))
+            .values("device_id", "bucket")
+            .annotate(**aggregates)
+            .order_by("device_id", "bucket"))
+
+    written = 0
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        for metric in METRICS:
+            row[f"{metric}_sum"] = row[f"{metric}_sum"] or 0
+        batch.append(SensorRollup(granularity=granularity, **row))
+        if len(batch) >= batch_size:
+            written += _upsert(batch)
+            batch = []
+    if batch:
+        written += _upsert(batch)
+    return written
+
+
+def _upsert(rollups):
+    SensorRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=["device", "granularity", "bucket"],
+        update_fields=ROLLUP_UPDATE_FIELDS,
+    )
+    return len(rollups)
+
+
+def pick_granularity(start, end, max_points):
+    """Finest rollup whose bucket count over ``[start, end]`` fits in ``max_points``."""
+    span = end - start
+    for granularity, size, _ in GRANULARITIES:
+        if span / size <= max_points:
+            return granularity
+    return SensorRollup.DAY
+
+
+def chart_series(device, start=None, end=None, max_points=1000):
+    """Chart series for ``device`` over ``[start, end]``.
+
+    Raw readings are returned while they fit in ``max_points``; longer ranges
+    are served from the finest rollup that keeps the series within budget.
+    Returns ``(granularity, series)`` where granularity is None for raw data
+    and ``series`` maps ``timestamp`` (epoch milliseconds) and each metric to
+    a list of values.
+    """
+    readings = SensorReading.objects.filter(device=device)
+    if start is not None:
+        readings = readings.filter(timestamp__gte=start)
+    if end is not None:
+        readings = readings.filter(timestamp__lte=end)
+
+    series = {"timestamp": [], **{metric: [] for metric in METRICS}}
+
+    if not readings[max_points:max_points + 1].exists():
+        rows = readings.order_by("timestamp").values_list("timestamp", *METRICS)
+        granularity = None
+    else:
+        first = readings.order_by("timestamp").values_list("timestamp", flat=True).first()
+        last = readings.order_by("-timestamp").values_list("timestamp", flat=True).first()
+        granularity = pick_granularity(first, last, max_points)
+        rollups = SensorRollup.objects.filter(device=device, granularity=granularity,
+                                              bucket__gte=bucket_start(first, granularity), bucket__lte=last)
+        columns = [column for metric in METRICS for column in (f"{metric}_sum", f"{metric}_count")]
+        rows = (
+            (bucket, *(total / count if count else None for total, count in zip(sums[::2], sums[1::2])))
+            for bucket, *sums in rollups.order_by("bucket").values_list("bucket", *columns).iterator()
+        )
+
+    for timestamp, *values in rows:
+        series["timestamp"].append(timestamp.timestamp() * 1000)
+        for metric, value in zip(METRICS, values):
+            series[metric].append(value)
+    return granularity, series
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import List, Optional
 
 
@@ -111,3 +111,48 @@ class TTNWebhook(BaseModel):
     context: Context
     visibility: Visibility
     unique_id: str
+
+
+# Slim ingestion schema: only the fields ingestion reads. Everything else in
+# the TTN body (visibility, network_ids, settings, identifiers, ...) is
+# skipped by the JSON validator instead of being built into models.
+
+class IngestRxMetadata(BaseModel):
+    gateway_ids: GatewayIDs
+    rssi: Optional[float] = None
+    snr: Optional[float] = None
+    location: Optional[Location] = None
+    uplink_token: Optional[str] = None
+    channel_index: Optional[int] = None
+    received_at: Optional[str] = None
+
+
+class IngestUplinkMessage(BaseModel):
+    f_port: int
+    f_cnt: int
+    frm_payload: str
+    decoded_payload: Optional[DecodedPayload] = None
+    rx_metadata: List[IngestRxMetadata]
+    received_at: str
+
+
+class IngestEndDeviceIDs(BaseModel):
+    device_id: str
+    application_ids: ApplicationIDs
+    dev_eui: str
+    dev_addr: Optional[str] = None
+
+
+class IngestDataField(BaseModel):
+    end_device_ids: IngestEndDeviceIDs
+    correlation_ids: List[str] = []
+    received_at: str
+    uplink_message: IngestUplinkMessage
+
+
+class IngestWebhook(BaseModel):
+    data: IngestDataField
+    correlation_ids: List[str] = []
+
+
+ingest_webhook_adapter = TypeAdapter(IngestWebhook)
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import device_cache, gateway_cache
+from .models import Device, Gateway
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_device_cache(sender, instance, **kwargs):
+    device_cache.invalidate(instance)
+
+
+@receiver(post_save, sender=Gateway)
+@receiver(post_delete, sender=Gateway)
+def invalidate_gateway_cache(sender, instance, **kwargs):
+    gateway_cache.invalidate(instance)
@@ -0,0 +1,15 @@
+import logging
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """``connection_created`` receiver running ``SQLITE_PRAGMAS`` on new SQLite connections."""
+    if connection.vendor != "sqlite" or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    logger.debug(f"Applied SQLite pragmas to connection {connection.alias}")
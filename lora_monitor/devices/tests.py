@@ -1,3 +1,966 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import importlib.util
+import io
+import json
+import os
+import runpy
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections
+from django.core.cache import cache
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .analytics import analyze_device, compute_device_stats
+from .anomaly import build_detectors, detect_anomalies, load_series
+from .cache import DeviceCache, device_cache, gateway_cache
+from .codecs import b64decode, decode_batch, get_codec
+from .dedup import RecentKeys, recent_uplinks
+from .downsampling import downsample_series, lttb
+from .export import stream_export
+from .fanout import Fanout
+from .geocoding import GazetteerGeocoder, geocode_address
+from .heatmap import cached_heatmap_cells
+from .ingest import ingest_groups, ingest_uplinks, stored_keys
+from .ingest_queue import IngestQueue
+from .metrics import Counter, Histogram
+from .models import Device, DeviceStats, Gateway, GeocodeCache, NetworkMetadata, SensorReading, SensorRollup
+from .replay import replay
+from .retention import archive_expired, read_archive
+from .rollups import compact_rollups, update_rollups
+from .schemas import IngestWebhook, ingest_webhook_adapter
+from .views import (decode_reading_cursor, detect_device_restarts, detect_temperature_anomalies,
+                    encode_reading_cursor, get_packet_loss)
+
+
+def webhook_body(device, f_cnt, received_at="2025-11-26T10:00:00Z", gateways=("gw-1",), temperature=21.5):
+    """The TTN webhook body of an uplink of ``device`` heard by ``gateways``."""
+    payload = base64.b64encode(struct.pack(">hHH", int(temperature * 10), 555, 10132)).decode()
+    return {"data": {
+        "end_device_ids": {"device_id": device.device_id, "dev_eui": device.dev_eui,
+                           "application_ids": {"application_id": device.application_id}},
+        "received_at": received_at,
+        "uplink_message": {
+            "f_port": 1, "f_cnt": f_cnt, "frm_payload": payload, "received_at": received_at,
+            "rx_metadata": [{"gateway_ids": {"gateway_id": gateway_id}, "rssi": -80.0, "snr": 7.5,
+                             "location": {"latitude": 54.35, "longitude": 18.6, "altitude": 10,
+                                          "source": "SOURCE_REGISTRY"}}
+                            for gateway_id in gateways],
+        },
+    }}
+
+
+def webhook(device, f_cnt, **kwargs):
+    """``webhook_body`` validated as ingestion receives it."""
+    return IngestWebhook.model_validate(webhook_body(device, f_cnt, **kwargs))
+
+
+class IngestTestCase(TestCase):
+    def setUp(self):
+        # The in-process caches outlive the rolled back test transactions.
+        device_cache.clear()
+        gateway_cache.clear()
+        recent_uplinks.clear()
+        self.device = Device.objects.create(device_id="dev-1", dev_eui="70B3D57ED0000001", application_id="app")
+
+
+class WebhookValidationTests(IngestTestCase):
+    def post(self, body):
+        return self.client.post(reverse("devices:ttn_webhook"), data=body, content_type="application/json")
+
+    def test_valid_body_is_stored(self):
+        with mock.patch("devices.api.ingest_webhook_adapter", wraps=ingest_webhook_adapter) as adapter:
+            response = self.post(json.dumps(webhook_body(self.device, 1)))
+
+        self.assertEqual((response.status_code, response.json()), (200, {"status": "ok"}))
+        adapter.validate_json.assert_called_once()
+        self.assertEqual(SensorReading.objects.get(device=self.device).temperature, 21.5)
+
+    def test_invalid_bodies_are_rejected(self):
+        missing_f_port = webhook_body(self.device, 1)
+        del missing_f_port["data"]["uplink_message"]["f_port"]
+        wrong_type = webhook_body(self.device, 1)
+        wrong_type["data"]["uplink_message"]["f_cnt"] = "first"
+
+        for body in ["{not json", "[]", json.dumps(missing_f_port), json.dumps(wrong_type)]:
+            with self.subTest(body=body[:20]), self.assertLogs("devices.api", "ERROR"):
+                response = self.post(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["status"], "error")
+        self.assertFalse(SensorReading.objects.exists())
+
+class AsyncWebhookTests(IngestTestCase):
+    def bodies(self, device):
+        ghost = Device(device_id="ghost", dev_eui="70B3D57ED00000FF", application_id="app")
+        return [json.dumps(webhook_body(device, 1)), json.dumps(webhook_body(device, 1)),
+                json.dumps(webhook_body(device, 2, received_at="2025-11-26T10:05:00Z")),
+                json.dumps(webhook_body(ghost, 1)), "{not json"]
+
+    def test_async_view_answers_like_the_sync_view(self):
+        other = Device.objects.create(device_id="dev-2", dev_eui="70B3D57ED0000002", application_id="app")
+        responses = {}
+
+        async def apost(*args, **kwargs):
+            return await self.async_client.post(*args, **kwargs)
+
+        with self.assertLogs("devices", "WARNING"):
+            for name, post, device in [("ttn_webhook", self.client.post, self.device),
+                                       ("ttn_webhook_async", async_to_sync(apost), other)]:
+                responses[name] = [
+                    (response.status_code, response.json())
+                    for response in (post(reverse(f"devices:{name}"), data=body, content_type="application/json")
+                                     for body in self.bodies(device))
+                ]
+
+        self.assertEqual(responses["ttn_webhook_async"], responses["ttn_webhook"])
+        self.assertEqual([status for status, _ in responses["ttn_webhook"]], [200, 200, 200, 200, 400])
+        self.assertEqual(SensorReading.objects.filter(device=self.device).count(), 2)
+        self.assertEqual(SensorReading.objects.filter(device=other).count(), 2)
+
+class IngestGroupsTests(IngestTestCase):
+    def test_groups_are_stored_in_one_call(self):
+        other = Device.objects.create(device_id="dev-2", dev_eui="70B3D57ED0000002", application_id="app")
+        groups = [
+            [webhook(self.device, 1, gateways=("gw-1", "gw-2"))],
+            [webhook(other, 1, gateways=("gw-2",))],
+            [webhook(self.device, 2, received_at="2025-11-26T10:05:00Z", gateways=("gw-3",))],
+        ]
+
+        results = ingest_groups(groups, notify=False)
+
+        self.assertEqual([result.stored for result in results], [1, 1, 1])
+        self.assertEqual(SensorReading.objects.count(), 3)
+        self.assertEqual(NetworkMetadata.objects.count(), 4)
+        self.assertEqual(set(Gateway.objects.values_list("gateway_id", flat=True)), {"gw-1", "gw-2", "gw-3"})
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_fcnt, 2)
+        self.assertEqual(self.device.last_gateway_id, "gw-3")
+
+    def test_repeat_in_a_later_group_is_that_groups_duplicate(self):
+        groups = [[webhook(self.device, 1)], [webhook(self.device, 1)], []]
+
+        results = ingest_groups(groups, notify=False)
+
+        self.assertEqual([(result.stored, result.duplicates) for result in results], [(1, 0), (0, 1), (0, 0)])
+        self.assertEqual(SensorReading.objects.count(), 1)
+
+    def test_unknown_device_is_counted_on_its_group(self):
+        stranger = Device(device_id="ghost", dev_eui="70B3D57ED00000FF", application_id="app")
+
+        results = ingest_groups([[webhook(self.device, 1)], [webhook(stranger, 1)]], notify=False)
+
+        self.assertEqual([(result.stored, result.unknown) for result in results], [(1, 0), (0, 1)])
+
+
+class ConcurrentDuplicateTests(IngestTestCase):
+    def test_uplink_stored_concurrently_is_a_duplicate(self):
+        ingest_groups([[webhook(self.device, 1)]], notify=False)
+        recent_uplinks.clear()
+
+        checks = []
+
+        def racing_check(readings):
+            # The other writer commits after the first dedup check has looked.
+            checks.append(readings)
+            return set() if len(checks) == 1 else stored_keys(readings)
+
+        with mock.patch("devices.ingest.stored_keys", side_effect=racing_check):
+            result = ingest_groups([[webhook(self.device, 1), webhook(self.device, 2)]], notify=False)[0]
+
+        self.assertEqual(len(checks), 2)
+        self.assertEqual((result.stored, result.duplicates), (1, 1))
+        self.assertEqual(SensorReading.objects.count(), 2)
+
+    def test_other_integrity_errors_are_raised(self):
+        error = IntegrityError("NOT NULL constraint failed: devices_device.last_seen")
+        # Raised once only: a retry would succeed and hide it.
+        with mock.patch("devices.ingest.update_devices", side_effect=[error, None]), \
+                self.assertRaises(IntegrityError):
+            ingest_groups([[webhook(self.device, 1)]], notify=False)
+
+        self.assertFalse(SensorReading.objects.exists())
+
+class DeviceCacheTests(IngestTestCase):
+    def test_stale_entry_does_not_revert_registry_fields(self):
+        device_cache.get(self.device.device_id, self.device.dev_eui)
+        # An edit from another process: no signal reaches this cache.
+        Device.objects.filter(pk=self.device.pk).update(application_id="moved", dev_addr="260B0001")
+
+        ingest_groups([[webhook(self.device, 1)]], notify=False)
+
+        self.device.refresh_from_db()
+        self.assertEqual((self.device.application_id, self.device.dev_addr), ("moved", "260B0001"))
+        self.assertEqual(self.device.last_fcnt, 1)
+
+    def test_known_devices_expire(self):
+        devices = DeviceCache(ttl=60.0)
+        key = (self.device.device_id, self.device.dev_eui)
+        devices.get(*key)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(devices.get(*key), self.device)
+        with mock.patch("devices.cache.time.monotonic", return_value=time.monotonic() + 61), \
+                self.assertNumQueries(1):
+            self.assertEqual(devices.get(*key), self.device)
+
+
+
+class FanoutTests(TestCase):
+    def run_fanout(self, fanout, script):
+        sent = []
+
+        class Layer:
+            async def group_send(self, group, message):
+                sent.append((asyncio.get_running_loop().time(), group, message))
+
+        async def main():
+            fanout.bind(asyncio.get_running_loop())
+            await script(fanout)
+            await asyncio.sleep(0.5)
+
+        with mock.patch("devices.fanout.get_channel_layer", return_value=Layer()):
+            asyncio.run(main())
+        return sent
+
+    def test_readings_within_the_window_are_coalesced(self):
+        async def script(fanout):
+            for f_cnt in range(5):
+                fanout.publish("device_a", {"f_cnt": f_cnt})
+            fanout.publish("device_b", {"f_cnt": 9})
+
+        fanout = Fanout(window=0.05, max_rate=0, max_batch=3)
+        sent = self.run_fanout(fanout, script)
+
+        messages = {group: message for _, group, message in sent}
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(messages["device_a"], {"type": "device_batch",
+                                                "readings": [{"f_cnt": 2}, {"f_cnt": 3}, {"f_cnt": 4}]})
+        self.assertEqual(messages["device_b"], {"type": "device_update", "data": {"f_cnt": 9}})
+        self.assertEqual((fanout.published, fanout.messages_sent, fanout.dropped), (6, 2, 2))
+
+    def test_groups_are_rate_limited(self):
+        async def script(fanout):
+            for f_cnt in range(3):
+                fanout.publish("device_a", {"f_cnt": f_cnt})
+                await asyncio.sleep(0.03)
+
+        sent = self.run_fanout(Fanout(window=0.01, max_rate=5.0), script)
+
+        # Readings 0.03 s apart, but messages at least 0.2 s apart; the rest is merged.
+        self.assertEqual([message.get("data") or message["readings"] for _, _, message in sent],
+                         [{"f_cnt": 0}, [{"f_cnt": 1}, {"f_cnt": 2}]])
+        self.assertGreaterEqual(sent[1][0] - sent[0][0], 0.2 - 0.01)
+
+class HeatmapCacheTests(IngestTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_cells_are_binned_per_gateway_position(self):
+        ingest_groups([[webhook(self.device, 1, gateways=("gw-1", "gw-2"))],
+                       [webhook(self.device, 2, received_at="2025-11-26T10:05:00Z")]], notify=False)
+        Gateway.objects.filter(gateway_id="gw-2").update(latitude=54.3512, longitude=18.6004)
+
+        coarse = cached_heatmap_cells(self.device, 2)
+        fine = cached_heatmap_cells(self.device, 3)
+
+        self.assertEqual([(cell["lat"], cell["lon"], cell["count"]) for cell in coarse], [(54.35, 18.6, 3)])
+        self.assertEqual([(cell["lat"], cell["count"]) for cell in fine], [(54.35, 2), (54.351, 1)])
+        self.assertEqual((coarse[0]["rssi_mean"], coarse[0]["rssi_max"]), (-80.0, -80.0))
+
+    def test_cache_survives_an_uplink(self):
+        ingest_groups([[webhook(self.device, 1)]], notify=False)
+        cells = cached_heatmap_cells(self.device, 3)
+
+        ingest_groups([[webhook(self.device, 2, received_at="2025-11-26T10:05:00Z")]], notify=False)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_heatmap_cells(self.device, 3), cells)
+        self.assertEqual(cells[0]["count"], 1)
+
+class IngestQueueTests(IngestTestCase):
+    def test_failed_batch_is_retried_item_by_item(self):
+        good, bad, other = webhook(self.device, 1), webhook(self.device, 2), webhook(self.device, 3)
+
+        def ingest_unless_bad(batch, **kwargs):
+            if bad in batch:
+                raise RuntimeError("bad uplink")
+            return ingest_uplinks(batch, **kwargs)
+
+        with mock.patch("devices.ingest_queue.ingest_uplinks", side_effect=ingest_unless_bad), \
+                self.assertLogs("devices.ingest_queue", "ERROR"):
+            IngestQueue()._flush([good, bad, other])
+
+        self.assertEqual(sorted(SensorReading.objects.values_list("f_cnt", flat=True)), [1, 3])
+
+
+@skipUnless(connection.vendor == "sqlite", "reads SQLite query plans")
+class TimeSeriesIndexTests(TestCase):
+    def assertUsesIndex(self, queryset, model):
+        plan = queryset.explain()
+        index = next(index.name for index in model._meta.indexes if index.fields == ["device", "timestamp"])
+        self.assertIn(f"USING INDEX {index}", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_per_device_scans_use_the_time_series_index(self):
+        week_ago = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+        self.assertUsesIndex(SensorReading.objects.filter(device_id=1).order_by("timestamp"), SensorReading)
+        self.assertUsesIndex(SensorReading.objects.filter(device_id=1).order_by("-timestamp")[:50], SensorReading)
+        self.assertUsesIndex(NetworkMetadata.objects.filter(device_id=1, timestamp__gte=week_ago).values("rssi"),
+                             NetworkMetadata)
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.device = Device.objects.create(device_id="dev-1", dev_eui="70B3D57ED0000001", application_id="app")
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        f_cnts = [1, 2, None, 5, 6, 1, 2, 9, None, 3]
+        temperatures = [20.0, 20.5, None, 27.0, 26.5, None, 19.0, 19.5, 30.0, 30.0]
+        SensorReading.objects.bulk_create([
+            SensorReading(device=self.device, timestamp=start + timedelta(minutes=i), f_cnt=f_cnt,
+                          temperature=temperature, humidity=50.0, pressure=1013.0)
+            for i, (f_cnt, temperature) in enumerate(zip(f_cnts, temperatures))
+        ])
+
+    def per_metric(self):
+        """The loops the detail page ran before, one query each."""
+        readings = list(SensorReading.objects.filter(device=self.device).order_by("timestamp"))
+        lost, restarts, anomalies = 0, [], []
+        prev_fcnt = prev_temp = None
+        for r in readings:
+            if r.f_cnt is not None:
+                if prev_fcnt is not None and r.f_cnt - prev_fcnt - 1 > 0:
+                    lost += r.f_cnt - prev_fcnt - 1
+                if prev_fcnt is not None and r.f_cnt < prev_fcnt:
+                    restarts.append({"timestamp": r.timestamp, "prev_fcnt": prev_fcnt, "new_fcnt": r.f_cnt})
+                prev_fcnt = r.f_cnt
+        for r in readings:
+            if r.temperature is not None:
+                if prev_temp is not None and abs(r.temperature - prev_temp) > 5.0:
+                    anomalies.append({"timestamp": r.timestamp, "prev_temp": prev_temp,
+                                      "current_temp": r.temperature})
+                prev_temp = r.temperature
+        return readings, lost, restarts, anomalies
+
+    def test_single_pass_matches_the_per_metric_loops(self):
+        readings, lost, restarts, anomalies = self.per_metric()
+
+        with self.assertNumQueries(1):
+            analytics = analyze_device(self.device)
+
+        self.assertEqual((analytics.packet_loss, analytics.restarts, analytics.anomalies),
+                         (lost, restarts, anomalies))
+        self.assertEqual((analytics.reading_count, analytics.last_f_cnt), (10, 3))
+        self.assertEqual(analytics.timestamps, [r.timestamp.isoformat() for r in readings])
+        self.assertEqual(analytics.temperatures, [r.temperature for r in readings])
+
+    def test_helpers_keep_their_results(self):
+        _, lost, restarts, anomalies = self.per_metric()
+
+        self.assertEqual(get_packet_loss("dev-1"), lost)
+        self.assertEqual(detect_device_restarts("dev-1"), restarts)
+        self.assertEqual(detect_temperature_anomalies("dev-1"), anomalies)
+
+class DeviceStatsTests(IngestTestCase):
+    def stats(self):
+        stats = DeviceStats.objects.get(device=self.device)
+        return {field: getattr(stats, field) for field in compute_device_stats(self.device)}
+
+    def test_incremental_stats_match_a_rebuild(self):
+        # A gap (lost packets) and a counter reset (restart), over several batches.
+        f_cnts = [1, 2, 5, 6, 1, 2, 3, 9]
+        for i, f_cnt in enumerate(f_cnts):
+            received_at = (datetime(2025, 1, 1, tzinfo=dt_timezone.utc) + timedelta(minutes=i)).isoformat()
+            gateways = ("gw-1", "gw-2") if i % 2 else ("gw-1",)
+            ingest_groups([[webhook(self.device, f_cnt, received_at=received_at, gateways=gateways)]], notify=False)
+
+        stats = self.stats()
+        self.assertEqual(stats, compute_device_stats(self.device))
+        self.assertEqual((stats["lost_packets"], stats["restart_count"], stats["uplink_count"]), (7, 1, 12))
+
+    def test_first_stats_row_is_seeded_from_history(self):
+        SensorReading.objects.bulk_create([
+            SensorReading(device=self.device, timestamp=datetime(2024, 1, 1, tzinfo=dt_timezone.utc) + timedelta(hours=i),
+                          f_cnt=f_cnt)
+            for i, f_cnt in enumerate([10, 11, 14])
+        ])
+
+        ingest_groups([[webhook(self.device, 15)]], notify=False)
+
+        stats = self.stats()
+        self.assertEqual(stats, compute_device_stats(self.device))
+        self.assertEqual((stats["reading_count"], stats["lost_packets"], stats["last_f_cnt"]), (4, 2, 15))
+
+
+    def test_detail_lists_recent_restarts_and_counts_all(self):
+        now = datetime.now(dt_timezone.utc)
+        # A restart thirty days ago, and one yesterday.
+        for f_cnt, age in [(5, 31), (1, 30), (2, 2), (3, 1.5), (1, 1)]:
+            received_at = (now - timedelta(days=age)).isoformat()
+            ingest_groups([[webhook(self.device, f_cnt, received_at=received_at)]], notify=False)
+            # Live uplinks are stamped on arrival.
+            SensorReading.objects.filter(received_at=received_at).update(timestamp=received_at)
+        self.client.force_login(get_user_model().objects.create_user("user@example.com", "secret"))
+
+        response = self.client.get(reverse("devices:detail", args=[self.device.pk]))
+
+        self.assertEqual(response.context["restart_count"], 2)
+        self.assertEqual([(r["prev_fcnt"], r["new_fcnt"]) for r in response.context["restarts"]], [(3, 1)])
+        self.assertContains(response, "f_cnt spadło z 3 → 1")
+
+class RebuildDeviceStatsCommandTests(IngestTestCase):
+    def test_check_reports_drift_and_rebuild_fixes_it(self):
+        ingest_groups([[webhook(self.device, f_cnt, received_at=f"2025-01-01T10:0{f_cnt}:00Z")]
+                       for f_cnt in (1, 2, 4)], notify=False)
+        DeviceStats.objects.filter(device=self.device).update(lost_packets=0)
+
+        out = io.StringIO()
+        call_command("rebuild_device_stats", "--check", stdout=out)
+        self.assertIn("dev-1: lost_packets: 0 != 1", out.getvalue())
+        self.assertEqual(DeviceStats.objects.get(device=self.device).lost_packets, 0)
+
+        call_command("rebuild_device_stats", stdout=io.StringIO())
+        out = io.StringIO()
+        call_command("rebuild_device_stats", "--check", stdout=out)
+        self.assertIn("0 device(s) with stats out of sync", out.getvalue())
+
+    def test_check_reports_a_missing_stats_row(self):
+        out = io.StringIO()
+        call_command("rebuild_device_stats", "--check", stdout=out)
+
+        self.assertIn("dev-1: no stats row", out.getvalue())
+        self.assertFalse(DeviceStats.objects.exists())
+
+class GeocodingTests(TestCase):
+    def setUp(self):
+        self.geocoder = mock.Mock(wraps=GazetteerGeocoder({"Długa 1, Gdańsk": (54.349, 18.653)}))
+        patcher = mock.patch("devices.geocoding._geocoder", self.geocoder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_answers_and_misses_are_cached(self):
+        self.assertEqual(geocode_address("Długa 1, Gdańsk"), (54.349, 18.653))
+        self.assertEqual(geocode_address("  długa 1,   GDAŃSK "), (54.349, 18.653))
+        self.assertEqual(geocode_address("Nowhere 7"), (None, None))
+        self.assertEqual(geocode_address("Nowhere 7"), (None, None))
+
+        self.assertEqual(self.geocoder.geocode.call_count, 2)
+        self.assertEqual(GeocodeCache.objects.count(), 2)
+
+    def test_command_locates_devices_through_the_cache(self):
+        for i, address in enumerate(["Długa 1, Gdańsk", "długa 1, gdańsk", "Nowhere 7"]):
+            Device.objects.create(device_id=f"dev-{i}", dev_eui=f"70B3D57ED000000{i}", application_id="app",
+                                  address=address)
+        out = io.StringIO()
+
+        call_command("geocode_devices", stdout=out)
+
+        self.assertEqual(self.geocoder.geocode.call_count, 2)
+        self.assertEqual(list(Device.objects.order_by("pk").values_list("location_lat", flat=True)),
+                         [54.349, 54.349, None])
+        self.assertIn("Located 2 device(s), 1 without a location", out.getvalue())
+
+class DeviceListTests(TestCase):
+    def setUp(self):
+        now = datetime.now(dt_timezone.utc)
+        # Seen 1 min, 29 min, 31 min and 2 days ago, never, and 5 min ago on another application.
+        for i, (application, age) in enumerate([("a", 1), ("a", 29), ("a", 31), ("a", 2880), ("a", None), ("b", 5)]):
+            Device.objects.create(device_id=f"dev-{i}", dev_eui=f"70B3D57ED000000{i}", application_id=application,
+                                  last_seen=now - timedelta(minutes=age) if age is not None else None,
+                                  last_gateway_id="gw-1" if i % 2 else "gw-2")
+        self.client.force_login(get_user_model().objects.create_user("user@example.com", "secret"))
+
+    def get(self, **params):
+        return self.client.get(reverse("devices:list"), params)
+
+    def test_pages_cover_every_device_once(self):
+        seen = []
+        for number in (1, 2, 3):
+            page = self.get(per_page=2, page=number).context["page"]
+            self.assertEqual(page.number, number)
+            seen += [device.device_id for device in page.object_list]
+
+        self.assertEqual(seen, [f"dev-{i}" for i in range(6)])
+        self.assertEqual(self.get(per_page=2, page=9).context["page"].number, 3)
+        self.assertEqual(self.get(per_page=1000).context["page"].paginator.per_page, 200)
+        self.assertEqual(self.get(per_page="many").context["page"].paginator.per_page, 50)
+
+    def test_online_status_is_computed_in_sql(self):
+        response = self.get(sort="-last_seen")
+
+        devices = response.context["devices"]
+        self.assertEqual([device.online for device in devices], [device.is_online() for device in devices])
+        self.assertEqual((response.context["fleet_total"], response.context["fleet_online"]), (6, 3))
+        self.assertEqual(response.context["fleet"], [
+            {"application_id": "a", "total": 5, "online": 2, "offline": 3},
+            {"application_id": "b", "total": 1, "online": 1, "offline": 0},
+        ])
+        self.assertEqual([device.device_id for device in self.get(status="online").context["devices"]],
+                         ["dev-0", "dev-1", "dev-5"])
+        self.assertEqual([device.device_id for device in self.get(status="offline", gateway="gw-1").context["devices"]],
+                         ["dev-3"])
+
+    def test_query_count_does_not_grow_with_the_fleet(self):
+        with self.assertNumQueries(5):
+            self.get(per_page=2)
+        Device.objects.bulk_create([
+            Device(device_id=f"extra-{i}", dev_eui=f"70B3D57ED00001{i:02X}", application_id="c") for i in range(50)
+        ])
+        with self.assertNumQueries(5):
+            self.get(per_page=50)
+
+class AnomalyWindowTests(TestCase):
+    def setUp(self):
+        self.device = Device.objects.create(device_id="dev-1", dev_eui="70B3D57ED0000001", application_id="app")
+        self.start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        temperatures = [20.0 + (i % 3) * 0.1 for i in range(60)]
+        temperatures[30] = 35.0  # a spike right at the window start
+        temperatures[40:52] = [25.0] * 12  # a flatline spanning nothing before the window
+        SensorReading.objects.bulk_create([
+            SensorReading(device=self.device, timestamp=self.start + timedelta(minutes=i), temperature=temperature,
+                          humidity=None if i % 5 else 50.0)
+            for i, temperature in enumerate(temperatures)
+        ])
+        self.detectors = build_detectors([
+            {"metric": "temperature", "detector": "rate_of_change", "max_delta": 5.0},
+            {"metric": "temperature", "detector": "hampel", "window": 7, "n_sigmas": 3.0},
+            {"metric": "temperature", "detector": "zscore", "window": 10, "threshold": 3.0},
+            {"metric": "temperature", "detector": "flatline", "min_run": 5},
+        ])
+
+    def test_window_matches_a_full_history_scan(self):
+        window_start = self.start + timedelta(minutes=30)
+
+        full = detect_anomalies(self.device, detectors=self.detectors)
+        windowed = detect_anomalies(self.device, start=window_start, detectors=self.detectors)
+
+        self.assertEqual(windowed, [anomaly for anomaly in full if anomaly["timestamp"] >= window_start])
+        self.assertEqual(windowed[0]["timestamp"], window_start)
+
+    def test_series_loads_the_warmup_before_start(self):
+        # Humidity is only reported every fifth reading: two values reach back ten readings.
+        series = load_series(self.device, start=self.start + timedelta(minutes=30),
+                             warmup={"temperature": 3, "humidity": 2})
+
+        self.assertEqual((len(series), series.warmup), (40, 10))
+        self.assertEqual(series.values["humidity"][10], 50.0)
+        self.assertTrue(np.isnan(series.values["humidity"][11]))
+
+    def window_flags(self, values, metric, config, window_start):
+        device = Device.objects.create(device_id="dev-2", dev_eui="70B3D57ED0000002", application_id="app")
+        SensorReading.objects.bulk_create([
+            SensorReading(device=device, timestamp=self.start + timedelta(minutes=i), **{metric: value})
+            for i, value in enumerate(values)
+        ])
+        detectors = build_detectors([{"metric": metric, **config}])
+
+        def minutes(start):
+            return [(anomaly["timestamp"] - self.start) // timedelta(minutes=1)
+                    for anomaly in detect_anomalies(device, start=start, detectors=detectors)]
+
+        return minutes(None), minutes(self.start + timedelta(minutes=window_start))
+
+    def test_flat_run_before_the_warmup_is_not_flagged_again(self):
+        values = [20.0, 21.0, 22.0] + [25.0] * 20
+        full, windowed = self.window_flags(values, "temperature", {"detector": "flatline", "min_run": 5}, 12)
+
+        self.assertEqual(full, [7])
+        self.assertEqual(windowed, [])
+
+    def test_warmup_counts_values_of_a_sparse_metric(self):
+        values = [50.0 + (i % 3) if i % 2 == 0 else None for i in range(40)]
+        values[16] = 90.0
+        full, windowed = self.window_flags(values, "humidity", {"detector": "hampel", "window": 7}, 16)
+
+        self.assertEqual(full, [16])
+        self.assertEqual(windowed, [16])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.device = Device.objects.create(device_id="dev-1", dev_eui="70B3D57ED0000001", application_id="app")
+        other = Device.objects.create(device_id="dev-2", dev_eui="70B3D57ED0000002", application_id="app")
+        gateways = [Gateway.objects.create(gateway_id=f"gw-{i}", latitude=54.35, longitude=18.6) for i in (1, 2)]
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        # Created newest first: the export orders by time, not by insertion.
+        for f_cnt in (3, 2, 1):
+            timestamp = start + timedelta(minutes=f_cnt)
+            for device in (other, self.device):
+                SensorReading.objects.create(device=device, timestamp=timestamp, f_cnt=f_cnt, temperature=21.5)
+                NetworkMetadata.objects.bulk_create([
+                    NetworkMetadata(device=device, gateway=gateway, timestamp=timestamp, rssi=-80.0, snr=7.5)
+                    for gateway in gateways
+                ])
+
+    def test_csv_is_streamed_in_blocks(self):
+        blocks = list(stream_export("readings", "csv", chunk_size=2))
+
+        self.assertEqual(len(blocks), 3)
+        rows = list(csv.reader(io.StringIO(b"".join(blocks).decode())))
+        self.assertEqual(rows[0], ["device_id", "timestamp", "f_cnt", "temperature", "humidity", "pressure",
+                                   "received_at", "raw_payload"])
+        self.assertEqual([(row[0], row[2]) for row in rows[1:]],
+                         [(device_id, str(f_cnt)) for device_id in ("dev-1", "dev-2") for f_cnt in (1, 2, 3)])
+        self.assertEqual(rows[1][1], "2025-01-01T00:01:00+00:00")
+
+    def test_ndjson_filters_by_device_and_range(self):
+        start = datetime(2025, 1, 1, 0, 2, tzinfo=dt_timezone.utc)
+        blocks = stream_export("metadata", "ndjson", devices=[self.device.pk], start=start)
+
+        lines = [json.loads(line) for line in b"".join(blocks).decode().splitlines()]
+
+        self.assertEqual(len(lines), 4)  # two uplinks, two gateways each
+        self.assertEqual({line["device_id"] for line in lines}, {"dev-1"})
+        self.assertEqual(sorted({line["gateway_id"] for line in lines}), ["gw-1", "gw-2"])
+        self.assertEqual((lines[0]["rssi"], lines[0]["gateway_lat"]), (-80.0, 54.35))
+
+    def test_view_streams_the_same_content(self):
+        self.client.force_login(get_user_model().objects.create_user("user@example.com", "secret"))
+
+        response = self.client.get(reverse("devices:export", args=["readings"]),
+                                   {"format": "ndjson", "device": "dev-2", "to": "2025-01-01T00:03:00Z"})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        content = b"".join(response.streaming_content)
+        other = Device.objects.get(device_id="dev-2")
+        self.assertEqual(content, b"".join(stream_export("readings", "ndjson", devices=[other.pk],
+                                                         end=datetime(2025, 1, 1, 0, 3, tzinfo=dt_timezone.utc))))
+        self.assertEqual([json.loads(line)["f_cnt"] for line in content.splitlines()], [1, 2])
+
+class ReplayTests(IngestTestCase):
+    def test_out_of_order_backfill_leaves_consistent_stats(self):
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        # Archives are rarely in f_cnt order; none of this is a restart.
+        order = [4, 1, 3, 2, 6, 5]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "uplinks.ndjson")
+            with open(path, "w", encoding="utf-8") as f:
+                for f_cnt in order:
+                    received_at = (start + timedelta(minutes=f_cnt)).isoformat()
+                    f.write(webhook(self.device, f_cnt, received_at=received_at).model_dump_json() + "\n")
+
+            stats = replay([path], batch_size=2)
+
+        self.assertEqual((stats.stored, stats.devices), (6, {"dev-1"}))
+        device_stats = DeviceStats.objects.get(device=self.device)
+        self.assertEqual((device_stats.restart_count, device_stats.lost_packets, device_stats.last_f_cnt), (0, 0, 6))
+        self.assertEqual(device_stats.reading_count, 6)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        overrides = override_settings(ARCHIVE_DIR=self.archive_dir.name, RETENTION_POLICIES={"sensor_readings": 30})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.device = Device.objects.create(device_id="dev-1", dev_eui="70B3D57ED0000001", application_id="app")
+        self.now = datetime(2025, 6, 1, tzinfo=dt_timezone.utc)
+        SensorReading.objects.bulk_create([
+            SensorReading(device=self.device, timestamp=self.now - timedelta(days=day, microseconds=123),
+                          f_cnt=day, temperature=20.0 + day, decoded_payload_json={"day": day})
+            for day in range(60)
+        ])
+
+    def test_round_trip(self):
+        expected = list(SensorReading.objects.filter(timestamp__lt=self.now - timedelta(days=30))
+                        .order_by("pk").values())
+
+        moved = archive_expired("sensor_readings", now=self.now, batch_size=7, rows_per_file=10)
+
+        self.assertEqual(moved, 30)
+        self.assertEqual(SensorReading.objects.count(), 30)
+        self.assertEqual(sorted(read_archive("sensor_readings"), key=lambda row: row["id"]), expected)
+        in_range = list(read_archive("sensor_readings", start=self.now - timedelta(days=40),
+                                     end=self.now - timedelta(days=35), device=self.device))
+        self.assertEqual(sorted(row["f_cnt"] for row in in_range), [35, 36, 37, 38, 39])
+
+    @override_settings(TIME_ZONE="Europe/Warsaw")
+    def test_naive_bounds_are_local_time(self):
+        archive_expired("sensor_readings", now=self.now)
+        stdout = io.StringIO()
+
+        # UTC+2: 2025-04-19 22:00 to 2025-04-21 22:00 UTC
+        call_command("query_archive", "sensor_readings", "--from", "2025-04-20T00:00", "--to", "2025-04-22T00:00",
+                     stdout=stdout)
+
+        self.assertEqual(sorted(json.loads(line)["f_cnt"] for line in stdout.getvalue().splitlines()), [41, 42])
+
+
+class ShardedMetricTests(TestCase):
+    def run_threads(self, target, count=20):
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_exited_threads_are_folded_into_the_total(self):
+        counter = Counter("test_total", "Test counter.", ("result",))
+
+        self.run_threads(lambda: counter.inc("ok", amount=2))
+
+        self.assertEqual(counter._shards, [])
+        self.assertEqual(counter.value("ok"), 40)
+        counter.inc("ok")
+        self.assertEqual(len(counter._shards), 1)
+        self.assertEqual(counter.value("ok"), 41)
+
+    def test_histogram_series_survive_their_thread(self):
+        histogram = Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1.0))
+
+        self.run_threads(lambda: histogram.observe(0.5), count=5)
+        histogram.observe(2.0)
+
+        rendered = list(histogram.render())
+        self.assertEqual(histogram._shards[0], {(): [0, 0, 1, 2.0]})
+        self.assertIn('test_seconds_bucket{le="1.0"} 5', rendered)
+        self.assertIn('test_seconds_count 6', rendered)
+
+
+@skipUnless(connection.vendor == "sqlite", "SQLite profile")
+class SQLiteProfileTests(TestCase):
+    def profile(self, name):
+        with mock.patch.dict(os.environ, {"LORA_DB_PROFILE": name}):
+            return runpy.run_path(importlib.util.find_spec(settings.SETTINGS_MODULE).origin)
+
+    def pragmas(self, configured):
+        """PRAGMA values of a new connection to a fresh database file under ``configured``."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        default = connections["default"]
+        wrapper = type(default)({**default.settings_dict, "NAME": os.path.join(directory.name, "db.sqlite3")},
+                                alias="profile")
+        with override_settings(SQLITE_PRAGMAS=configured), wrapper.cursor() as cursor:
+            values = {}
+            for name in ("journal_mode", "synchronous", "mmap_size", "busy_timeout", "temp_store"):
+                cursor.execute(f"PRAGMA {name}")
+                values[name] = cursor.fetchone()[0]
+        wrapper.close()
+        return values
+
+    def test_high_write_profile_applies_its_pragmas(self):
+        profile = self.profile("high_write")
+
+        self.assertEqual(self.pragmas(profile["SQLITE_PRAGMAS"]), {
+            "journal_mode": "wal", "synchronous": 1, "mmap_size": 256 * 1024 * 1024,
+            "busy_timeout": 20000, "temp_store": 2,
+        })
+        self.assertEqual(profile["DATABASES"]["default"]["CONN_MAX_AGE"], 600)
+        self.assertEqual(profile["INGEST_MODE"], "writer")
+
+    def test_default_profile_leaves_sqlite_defaults(self):
+        profile = self.profile("default")
+
+        self.assertEqual(profile["SQLITE_PRAGMAS"], {})
+        self.assertEqual(self.pragmas(profile["SQLITE_PRAGMAS"])["journal_mode"], "delete")
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.device = Device.objects.create(device_id="dev-1", dev_eui="70B3D57ED0000001", application_id="app")
+        self.other = Device.objects.create(device_id="dev-2", dev_eui="70B3D57ED0000002", application_id="app")
+
+    def rollups(self):
+        return {
+            (r.device_id, r.granularity, r.bucket): (r.count, r.temperature_min, r.temperature_max,
+                                                     r.temperature_sum, r.temperature_count, r.humidity_count)
+            for r in SensorRollup.objects.all()
+        }
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        start = datetime(2025, 1, 1, 23, 58, tzinfo=dt_timezone.utc)
+        batches = [[], [], []]
+        for i in range(12):
+            device = self.device if i % 3 else self.other
+            reading = SensorReading(device=device, timestamp=start + timedelta(seconds=40 * i),
+                                    temperature=20.0 + i, humidity=None if i % 4 else 50.0)
+            batches[i % 3].append(reading)
+        for batch in batches:
+            SensorReading.objects.bulk_create(batch)
+            update_rollups(batch)
+        incremental = self.rollups()
+
+        SensorRollup.objects.all().delete()
+        for granularity in (SensorRollup.MINUTE, SensorRollup.HOUR, SensorRollup.DAY):
+            compact_rollups(granularity)
+
+        self.assertEqual(incremental, self.rollups())
+        self.assertEqual(incremental[(self.device.pk, SensorRollup.DAY, start.replace(hour=0, minute=0))][0], 2)
+
+    def test_lookup_reads_only_the_touched_buckets(self):
+        old = SensorReading.objects.create(device=self.device, timestamp=datetime(2024, 6, 1, tzinfo=dt_timezone.utc),
+                                           temperature=10.0)
+        update_rollups([old])
+        new = SensorReading.objects.create(device=self.device, timestamp=datetime(2025, 1, 1, tzinfo=dt_timezone.utc),
+                                           temperature=30.0)
+
+        with self.assertNumQueries(2):  # lookup and upsert
+            update_rollups([new])
+
+        self.assertEqual(SensorRollup.objects.filter(device=self.device).count(), 6)
+        self.assertEqual(SensorRollup.objects.get(device=self.device, granularity=SensorRollup.DAY,
+                                                  bucket=new.timestamp).temperature_max, 30.0)
+
+
+class DownsamplingTests(TestCase):
+    def test_lttb_keeps_the_ends_and_the_threshold(self):
+        x = np.arange(1000, dtype=float)
+        y = np.sin(x / 50)
+        y[500] = 10.0
+
+        sx, sy = lttb(x, y, 50)
+
+        self.assertEqual(len(sx), 50)
+        self.assertEqual((sx[0], sx[-1]), (0.0, 999.0))
+        self.assertTrue(np.all(np.diff(sx) > 0))
+        self.assertIn(10.0, sy)  # the spike is the largest triangle in its bucket
+
+    def test_short_series_is_returned_unchanged(self):
+        sx, sy = lttb([1, 2, 3], [4, 5, 6], 10)
+        self.assertEqual(sx.tolist(), [1.0, 2.0, 3.0])
+        self.assertEqual(sy.tolist(), [4.0, 5.0, 6.0])
+
+    def test_missing_values_are_skipped(self):
+        points = downsample_series([1, 2, 3, 4], [1.0, None, 3.0, np.nan], 10)
+        self.assertEqual(points, [[1.0, 1.0], [3.0, 3.0]])
+
+
+class ReadingsPageTests(TestCase):
+    def setUp(self):
+        self.device = Device.objects.create(device_id="dev-1", dev_eui="70B3D57ED0000001", application_id="app")
+        user = get_user_model().objects.create_user("user@example.com", "secret")
+        self.client.force_login(user)
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        # Pairs of readings share a timestamp, so a page can end in the middle of one.
+        SensorReading.objects.bulk_create([
+            SensorReading(device=self.device, timestamp=start + timedelta(minutes=i // 2), f_cnt=i)
+            for i in range(7)
+        ])
+
+    def page(self, **params):
+        response = self.client.get(reverse("devices:readings_page"), {"device": "dev-1", **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_round_trip(self):
+        timestamp = datetime(2025, 1, 1, 12, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(decode_reading_cursor(encode_reading_cursor(timestamp, 42)), (timestamp, 42))
+
+    def test_pages_cover_every_reading_once(self):
+        expected = list(SensorReading.objects.order_by("-timestamp", "-pk").values_list("f_cnt", flat=True))
+        seen, cursor = [], None
+        while True:
+            page = self.page(limit=2, **({"cursor": cursor} if cursor else {}))
+            self.assertLessEqual(len(page["readings"]), 2)
+            seen += [reading["f_cnt"] for reading in page["readings"]]
+            cursor = page["next"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, expected)
+
+    def test_last_page_has_no_cursor(self):
+        page = self.page(limit=7)
+        self.assertEqual(len(page["readings"]), 7)
+        self.assertIsNone(page["next"])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse("devices:readings_page"), {"device": "dev-1", "cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+
+class CodecTests(TestCase):
+    def test_struct_batch_matches_single_decode(self):
+        codec = get_codec("thp_be16")
+        payloads = [base64.b64encode(struct.pack(">hHH", t, 555, 10132)).decode() for t in (-55, 0, 215)]
+        payloads += [base64.b64encode(b"\x00\x01").decode(), None]
+
+        batch = decode_batch(payloads, codec)
+
+        self.assertEqual(batch["valid"].tolist(), [True, True, True, False, False])
+        for row, payload in zip(batch[:3], payloads):
+            decoded = codec.decode(b64decode(payload))
+            self.assertEqual([row[name] for name in ("temperature", "humidity", "pressure")],
+                             [decoded["temperature"], decoded["humidity"], decoded["pressure"]])
+        self.assertTrue(np.isnan(batch["temperature"][3:]).all())
+
+        batch, decoded = decode_batch(payloads, codec, with_payloads=True)
+        self.assertEqual(decoded, [codec.decode(b64decode(payload)) if payload else None for payload in payloads])
+
+    def test_cayenne_lpp(self):
+        codec = get_codec("cayenne_lpp")
+        data = bytes([0x01, 0x67, 0x00, 0xFF, 0x02, 0x68, 0x64, 0x03, 0x67, 0xFF, 0xF6])
+
+        decoded = codec.decode(data)
+
+        self.assertEqual((decoded["temperature_1"], decoded["relative_humidity_2"], decoded["temperature_3"]),
+                         (25.5, 50.0, -1.0))
+        self.assertEqual((decoded["temperature"], decoded["humidity"]), (25.5, 50.0))
+        self.assertIsNone(codec.decode(data[:-1]))
+        batch = decode_batch([base64.b64encode(data).decode()], codec)
+        self.assertEqual((batch["temperature"][0], batch["humidity"][0]), (25.5, 50.0))
+
+
+class UnknownCodecTests(IngestTestCase):
+    def test_misconfigured_device_falls_back_to_the_default_codec(self):
+        other = Device.objects.create(device_id="dev-2", dev_eui="70B3D57ED0000002", application_id="app",
+                                      payload_codec="removed_codec")
+
+        with self.assertLogs("devices.codecs", "WARNING"):
+            result = ingest_groups([[webhook(self.device, 1), webhook(other, 1)]], notify=False)[0]
+
+        self.assertEqual(result.stored, 2)
+        self.assertEqual(SensorReading.objects.get(device=other).temperature, 21.5)
+
+class RedecodeReadingsTests(TestCase):
+    def setUp(self):
+        self.device = Device.objects.create(device_id="dev-1", dev_eui="70B3D57ED0000001", application_id="app",
+                                            payload_codec="thp_be32_pa")
+        payload = base64.b64encode(struct.pack(">hHI", 215, 555, 101325)).decode()
+        SensorReading.objects.bulk_create([
+            SensorReading(device=self.device, timestamp=datetime(2025, 1, day, 12, tzinfo=dt_timezone.utc),
+                          raw_payload=payload, decoded_payload_json={"stale": True})
+            for day in (1, 2)
+        ])
+
+    def test_readings_get_the_codecs_values_and_json(self):
+        call_command("redecode_readings", "dev-1", stdout=io.StringIO())
+
+        reading = SensorReading.objects.filter(device=self.device).first()
+        expected = get_codec("thp_be32_pa").decode(b64decode(reading.raw_payload))
+        self.assertEqual((reading.temperature, reading.humidity, reading.pressure), (21.5, 55.5, 1013.25))
+        self.assertEqual(reading.decoded_payload_json, str(expected))  # stored as ingestion stores it
+
+    @override_settings(TIME_ZONE="Europe/Warsaw")
+    def test_naive_since_is_local_time(self):
+        out = io.StringIO()
+        # 2025-01-02 12:00 UTC is 13:00 in Warsaw.
+        call_command("redecode_readings", "dev-1", "--since", "2025-01-02T13:00", stdout=out)
+
+        self.assertIn("dev-1: 1 reading(s) re-decoded", out.getvalue())
+        self.assertEqual(sorted(SensorReading.objects.values_list("temperature", flat=True), key=str), [21.5, None])
+
+class RecentKeysTests(TestCase):
+    def test_oldest_keys_are_evicted(self):
+        keys = RecentKeys(maxsize=2)
+        keys.add_many([(1, 1, "a"), (1, 2, "b")])
+        self.assertIn((1, 1, "a"), keys)  # refreshes the key
+        keys.add_many([(1, 3, "c")])
+
+        self.assertEqual(len(keys), 2)
+        self.assertNotIn((1, 2, "b"), keys)
+        self.assertIn((1, 3, "c"), keys)
+        self.assertEqual(keys.hits, 2)
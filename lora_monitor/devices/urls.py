@@ -1,6 +1,6 @@
 from django.urls import path
 from . import views
-from .api import TTNWebhookView
+from .api import TTNAsyncWebhookView, TTNWebhookView, TTNBatchWebhookView, metrics_view
 
 app_name = 'devices'
 
@@ -10,5 +10,13 @@ urlpatterns = [
     path('create/', views.device_create, name='create'),
     path('<int:pk>/update/', views.device_update, name='update'),
     path('<int:pk>/delete/', views.device_delete, name='delete'),
+    path('gateways/', views.gateway_list, name='gateway_list'),
+    path('api/chart/', views.chart_data, name='chart_data'),
+    path('api/readings/', views.readings_page, name='readings_page'),
+    path('api/heatmap/', views.heatmap_data, name='heatmap_data'),
+    path('api/export/<str:kind>/', views.export_data, name='export'),
     path("api/ttn/webhook/", TTNWebhookView.as_view(), name="ttn_webhook"),
+    path("api/ttn/webhook/async/", TTNAsyncWebhookView.as_view(), name="ttn_webhook_async"),
+    path("api/ttn/webhook/batch/", TTNBatchWebhookView.as_view(), name="ttn_webhook_batch"),
+    path("api/metrics/", metrics_view, name="metrics"),
 ]
@@ -1,77 +1,367 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .models import Device, SensorReading, NetworkMetadata
+from .models import Device, DeviceStats, Gateway, SensorReading, NetworkMetadata
+from .analytics import analyze_device, recent_restarts
+from .anomaly import detect_anomalies
+from .downsampling import downsample_series
+from .export import EXPORTS, FORMATS, astream_export, stream_export
+from .rollups import METRICS, chart_series
 from .forms import DeviceForm
+from .heatmap import DEFAULT_ZOOM as HEATMAP_DEFAULT_ZOOM, cached_heatmap_cells, heat_points, precision_for_zoom
+from .geocoding import get_geocode_worker, locate_device
+from .metrics import stage
 from django.utils import timezone
-from geopy.geocoders import Nominatim
-from django.db.models import Avg
-
-def geocode_address(address):
-    geolocator = Nominatim(user_agent="lora_monitor")
-    try:
-        location = geolocator.geocode(address)
-        if location:
-            return location.latitude, location.longitude
-    except Exception as e:
-        print(f"Geocoding error: {e}")
-    return None, None
+from django.utils.dateparse import parse_date, parse_datetime
+from django.core.paginator import Paginator
+from django.db.models import Avg, Count, F, Max, Q
+from datetime import datetime, time, timedelta
 
+CHART_RANGES = {
+    '24h': timedelta(days=1),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+    '365d': timedelta(days=365),
+    'all': None,
+}
+CHART_MAX_POINTS = 1000
+CHART_MAX_POINTS_LIMIT = 5000
+# Rows loaded before LTTB; longer ranges are read from rollups instead.
+CHART_SOURCE_MAX_ROWS = 50000
+READINGS_PAGE_SIZE = 50
+ANOMALIES_SHOWN = 100
+RESTARTS_SHOWN = 100
+# Window scanned for anomalies when the chart shows the whole history.
+ANOMALY_DEFAULT_RANGE = timedelta(days=7)
+READINGS_PAGE_SIZE_LIMIT = 500
+DEVICE_LIST_PAGE_SIZE = 50
+DEVICE_LIST_PAGE_SIZE_LIMIT = 200
+# ?sort= value -> order_by; pk breaks ties so pages are stable.
+DEVICE_LIST_SORTS = {
+    'device_id': ('device_id',),
+    '-device_id': ('-device_id',),
+    'application': ('application_id', 'device_id'),
+    '-application': ('-application_id', '-device_id'),
+    'last_seen': (F('last_seen').asc(nulls_first=True), 'pk'),
+    '-last_seen': (F('last_seen').desc(nulls_last=True), '-pk'),
+    'gateway': ('last_gateway_id', 'pk'),
+    '-gateway': ('-last_gateway_id', '-pk'),
+}
+DEVICE_LIST_DEFAULT_SORT = 'device_id'
+GATEWAY_STATS_RANGES = {
+    '24h': timedelta(days=1),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+}
+GATEWAY_STATS_DEFAULT_RANGE = '24h'
 
 def get_uplink_count(device_id):
-    device = Device.objects.get(device_id=device_id)
-    return NetworkMetadata.objects.filter(device=device).count()
+    return NetworkMetadata.objects.filter(device__device_id=device_id).count()
 
 
 def get_packet_loss(device_id):
-    readings = SensorReading.objects.filter(device__device_id=device_id).order_by('timestamp')
-    lost = 0
-    prev_fcnt = None
-    for r in readings:
-        if r.f_cnt is not None:
-            if prev_fcnt is not None:
-                diff = r.f_cnt - prev_fcnt - 1
-                if diff > 0:
-                    lost += diff
-            prev_fcnt = r.f_cnt
-    return lost
+    device = Device.objects.get(device_id=device_id)
+    return analyze_device(device, include_series=False).packet_loss
+
+
+def fleet_counts(now=None):
+    """Online/offline device counts per application in a single aggregate query."""
+    cutoff = Device.objects.online_cutoff(now)
+    rows = (Device.objects
+            .values('application_id')
+            .annotate(total=Count('id'), online=Count('id', filter=Q(last_seen__gte=cutoff)))
+            .order_by('application_id'))
+    return [{**row, 'offline': row['total'] - row['online']} for row in rows]
+
 
 @login_required
 def device_list(request):
-    devices = Device.objects.all()
-    for device in devices:
-        device.online = device.is_online()
-    return render(request, 'devices/device_list.html', {'devices': devices})
+    now = timezone.now()
+    devices = Device.objects.with_online_status(now).only(
+        'device_id', 'dev_eui', 'application_id', 'last_seen', 'last_gateway_id', 'last_rssi', 'last_snr',
+    )
+
+    application = request.GET.get('application') or ''
+    status = request.GET.get('status') or ''
+    gateway = request.GET.get('gateway') or ''
+    if application:
+        devices = devices.filter(application_id=application)
+    if status == 'online':
+        devices = devices.online(now)
+    elif status == 'offline':
+        devices = devices.offline(now)
+    if gateway:
+        devices = devices.filter(last_gateway_id=gateway)
+
+    sort = request.GET.get('sort')
+    if sort not in DEVICE_LIST_SORTS:
+        sort = DEVICE_LIST_DEFAULT_SORT
+    devices = devices.order_by(*DEVICE_LIST_SORTS[sort])
+
+    try:
+        per_page = min(max(int(request.GET.get('per_page', DEVICE_LIST_PAGE_SIZE)), 1), DEVICE_LIST_PAGE_SIZE_LIMIT)
+    except ValueError:
+        per_page = DEVICE_LIST_PAGE_SIZE
+    page = Paginator(devices, per_page).get_page(request.GET.get('page'))
+
+    fleet = fleet_counts(now)
+    filters = request.GET.copy()
+    filters.pop('page', None)
+    sort_filters = filters.copy()
+    sort_filters.pop('sort', None)
+    return render(request, 'devices/device_list.html', {
+        'devices': page.object_list,
+        'page': page,
+        'fleet': fleet,
+        'fleet_total': sum(row['total'] for row in fleet),
+        'fleet_online': sum(row['online'] for row in fleet),
+        'application': application,
+        'status': status,
+        'gateway': gateway,
+        'sort': sort,
+        'query': filters.urlencode(),
+        'sort_query': sort_filters.urlencode(),
+    })
+
+
+def gateway_stats(since):
+    """Every gateway with its uplinks, unique devices, mean RSSI/SNR and last uplink since ``since``.
+
+    One aggregate over the ``(gateway, timestamp)`` index; gateways not
+    heard in the range are listed with zero uplinks.
+    """
+    heard = {
+        row['gateway']: row for row in (NetworkMetadata.objects
+                                        .filter(timestamp__gte=since)
+                                        .values('gateway')
+                                        .annotate(uplinks=Count('id'), devices=Count('device', distinct=True),
+                                                  avg_rssi=Avg('rssi'), avg_snr=Avg('snr'),
+                                                  last_heard=Max('timestamp'))
+                                        .order_by())
+    }
+    rows = []
+    for gateway in Gateway.objects.order_by('gateway_id'):
+        row = heard.get(gateway.pk, {})
+        rows.append({
+            'gateway': gateway,
+            'uplinks': row.get('uplinks', 0),
+            'devices': row.get('devices', 0),
+            'avg_rssi': row.get('avg_rssi'),
+            'avg_snr': row.get('avg_snr'),
+            'last_heard': row.get('last_heard'),
+        })
+    rows.sort(key=lambda row: -row['uplinks'])
+    return rows
+
+
+@login_required
+def gateway_list(request):
+    range_key = request.GET.get('range')
+    if range_key not in GATEWAY_STATS_RANGES:
+        range_key = GATEWAY_STATS_DEFAULT_RANGE
+    return render(request, 'devices/gateway_list.html', {
+        'gateways': gateway_stats(timezone.now() - GATEWAY_STATS_RANGES[range_key]),
+        'range': range_key,
+        'ranges': list(GATEWAY_STATS_RANGES),
+    })
 
 
 @login_required
 def device_detail(request, pk):
-    device = get_object_or_404(Device, pk=pk)
+    with stage('device_detail', 'device'):
+        device = get_object_or_404(Device, pk=pk)
     device_id = device.device_id
     device.online = device.is_online()
-    readings = SensorReading.objects.filter(device=device).order_by('timestamp')
-    timestamps = [r.timestamp.isoformat() for r in readings]
-    temperatures = [r.temperature for r in readings]
-    humidities = [r.humidity for r in readings]
-    pressures = [r.pressure for r in readings]
-    avg = get_device_avg_rssi_snr(device_id)
-    heatmap = get_heatmap_data(device_id)
-    restarts = detect_device_restarts(device_id)
-    anomalies = detect_temperature_anomalies(device_id)
-    packet_loss = get_packet_loss(device_id)
-    uplink_count = get_uplink_count(device_id)
-    return render(request, 'devices/device_detail.html', {
-        'device': device,
-        'readings': readings,
-        'avg': avg,
-        'heatmap': heatmap,
-        'restarts': restarts,
-        'anomalies': anomalies,
-        'timestamps': timestamps,
-        'temperatures': temperatures,
-        'humidities': humidities,
-        'pressures': pressures,
-        'packet_loss': packet_loss,
-        'uplink_count': uplink_count,
+    chart_range = request.GET.get('range', 'all')
+    if chart_range not in CHART_RANGES:
+        chart_range = 'all'
+    span = CHART_RANGES[chart_range]
+    start = timezone.now() - span if span else None
+    chart_from = start.isoformat() if start else ''
+    with stage('device_detail', 'anomalies'):
+        anomaly_from = start or timezone.now() - ANOMALY_DEFAULT_RANGE
+        anomalies = detect_anomalies(device, start=anomaly_from)
+    with stage('device_detail', 'heatmap'):
+        heatmap = heat_points(cached_heatmap_cells(device, precision_for_zoom(HEATMAP_DEFAULT_ZOOM)))
+    with stage('device_detail', 'stats'):
+        stats = DeviceStats.objects.filter(device=device).first()
+        if stats:
+            avg = {'avg_rssi': stats.avg_rssi, 'avg_snr': stats.avg_snr}
+            uplink_count = stats.uplink_count
+            packet_loss = stats.lost_packets
+            restart_count = stats.restart_count
+        else:
+            # No uplink since DeviceStats was introduced: one full scan.
+            analytics = analyze_device(device, include_series=False)
+            avg = get_device_avg_rssi_snr(device_id)
+            uplink_count = get_uplink_count(device_id)
+            packet_loss = analytics.packet_loss
+            restart_count = len(analytics.restarts)
+        restarts = recent_restarts(device, anomaly_from)
+    with stage('device_detail', 'render'):
+        return render(request, 'devices/device_detail.html', {
+            'device': device,
+            'avg': avg,
+            'heatmap': heatmap,
+            'heatmap_zoom': HEATMAP_DEFAULT_ZOOM,
+            'restart_count': restart_count,
+            'restarts': restarts[::-1][:RESTARTS_SHOWN],
+            'anomalies': anomalies[::-1][:ANOMALIES_SHOWN],
+            'anomaly_count': len(anomalies),
+            'anomaly_from': anomaly_from,
+            'chart_range': chart_range,
+            'chart_ranges': list(CHART_RANGES),
+            'chart_from': chart_from,
+            'chart_max_points': CHART_MAX_POINTS,
+            'packet_loss': packet_loss,
+            'uplink_count': uplink_count,
+        })
+
+
+def parse_range_param(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+@login_required
+def chart_data(request):
+    device = get_object_or_404(Device, device_id=request.GET.get('device'))
+    try:
+        start = parse_range_param(request.GET.get('from'))
+        end = parse_range_param(request.GET.get('to'))
+        max_points = int(request.GET.get('max_points', CHART_MAX_POINTS))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    max_points = max(3, min(max_points, CHART_MAX_POINTS_LIMIT))
+
+    granularity, series = chart_series(device, start=start, end=end, max_points=CHART_SOURCE_MAX_ROWS)
+    return JsonResponse({
+        'device': device.device_id,
+        'granularity': granularity,
+        'series': {
+            metric: downsample_series(series['timestamp'], series[metric], max_points)
+            for metric in METRICS
+        },
+    })
+
+
+@login_required
+def heatmap_data(request):
+    device = get_object_or_404(Device, device_id=request.GET.get('device'))
+    try:
+        zoom = int(request.GET.get('zoom', HEATMAP_DEFAULT_ZOOM))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid zoom'}, status=400)
+    precision = precision_for_zoom(zoom)
+    cells = cached_heatmap_cells(device, precision)
+    return JsonResponse({
+        'device': device.device_id,
+        'precision': precision,
+        'cells': cells,
+        'points': heat_points(cells),
+    })
+
+
+@login_required
+def export_data(request, kind):
+    """Stream readings or gateway metadata as CSV or NDJSON.
+
+    ``?device=`` (repeatable) limits the export to some devices, ``?from`` /
+    ``?to`` to a time range; ``?format=`` is ``csv`` (default) or ``ndjson``.
+    """
+    if kind not in EXPORTS:
+        return JsonResponse({'error': f'Unknown export: {kind}'}, status=404)
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        return JsonResponse({'error': f'Unknown format: {fmt}'}, status=400)
+    try:
+        start = parse_range_param(request.GET.get('from'))
+        end = parse_range_param(request.GET.get('to'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    devices = None
+    device_ids = request.GET.getlist('device')
+    if device_ids:
+        devices = list(Device.objects.filter(device_id__in=device_ids).values_list('pk', flat=True))
+
+    stream = astream_export if isinstance(request, ASGIRequest) else stream_export
+    response = StreamingHttpResponse(stream(kind, fmt, devices=devices, start=start, end=end),
+                                     content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+def encode_reading_cursor(timestamp, pk):
+    return f"{timestamp.isoformat()},{pk}"
+
+
+def decode_reading_cursor(cursor):
+    timestamp, _, pk = cursor.rpartition(',')
+    parsed = parse_datetime(timestamp)
+    if parsed is None or not pk.isdigit():
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return parsed, int(pk)
+
+
+@login_required
+def readings_page(request):
+    """Newest-first readings of one device, paginated by a (timestamp, id) cursor.
+
+    The cursor seeks on the (device, timestamp) index, so every page costs the
+    same no matter how deep it is.
+    """
+    device = get_object_or_404(Device, device_id=request.GET.get('device'))
+    try:
+        start = parse_range_param(request.GET.get('from'))
+        end = parse_range_param(request.GET.get('to'))
+        limit = int(request.GET.get('limit', READINGS_PAGE_SIZE))
+        cursor = request.GET.get('cursor')
+        after = decode_reading_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    limit = max(1, min(limit, READINGS_PAGE_SIZE_LIMIT))
+
+    readings = SensorReading.objects.filter(device=device)
+    if start is not None:
+        readings = readings.filter(timestamp__gte=start)
+    if end is not None:
+        readings = readings.filter(timestamp__lte=end)
+    if after is not None:
+        timestamp, pk = after
+        readings = readings.filter(timestamp__lte=timestamp).filter(
+            Q(timestamp__lt=timestamp) | Q(pk__lt=pk)
+        )
+
+    rows = list(
+        readings.order_by('-timestamp', '-pk')
+        .values_list('pk', 'timestamp', 'temperature', 'humidity', 'pressure', 'f_cnt')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return JsonResponse({
+        'readings': [
+            {
+                'timestamp': timestamp.isoformat(),
+                'temperature': temperature,
+                'humidity': humidity,
+                'pressure': pressure,
+                'f_cnt': f_cnt,
+            }
+            for pk, timestamp, temperature, humidity, pressure, f_cnt in rows
+        ],
+        'next': encode_reading_cursor(rows[-1][1], rows[-1][0]) if has_more else None,
     })
 
 
@@ -81,12 +371,11 @@ def device_create(request):
         form = DeviceForm(request.POST)
         if form.is_valid():
             device = form.save(commit=False)
-            if device.address:
-                lat, lon = geocode_address(device.address)
-                device.location_lat = lat
-                device.location_lon = lon
+            located = locate_device(device)
             device.last_seen = timezone.now()
             device.save()
+            if not located:
+                get_geocode_worker().submit(device.pk, device.address)
             return redirect('devices:list')
     else:
         form = DeviceForm()
@@ -101,11 +390,12 @@ def device_update(request, pk):
         form = DeviceForm(request.POST, instance=device)
         if form.is_valid():
             device = form.save(commit=False)
-            if device.address:
-                lat, lon = geocode_address(device.address)
-                device.location_lat = lat
-                device.location_lon = lon
+            located = True
+            if 'address' in form.changed_data:
+                located = locate_device(device)
             device.save()
+            if not located:
+                get_geocode_worker().submit(device.pk, device.address)
             return redirect('devices:detail', pk=device.pk)
     else:
         form = DeviceForm(instance=device)
@@ -122,63 +412,22 @@ def device_delete(request, pk):
 
 
 def get_device_avg_rssi_snr(device_id):
-    device = Device.objects.get(device_id=device_id)
-    agg = NetworkMetadata.objects.filter(device=device).aggregate(
+    agg = NetworkMetadata.objects.filter(device__device_id=device_id).aggregate(
         avg_rssi=Avg('rssi'),
         avg_snr=Avg('snr')
     )
     return agg
 
 
-def get_heatmap_data(device_id):
-    from .models import NetworkMetadata, Device
+def get_heatmap_data(device_id, zoom=HEATMAP_DEFAULT_ZOOM):
     device = Device.objects.get(device_id=device_id)
-
-    metadata = NetworkMetadata.objects.filter(device=device).exclude(
-        gateway_lat__isnull=True,
-        gateway_lon__isnull=True
-    ).values('gateway_lat', 'gateway_lon', 'rssi')
-
-    heatmap = [
-        [m['gateway_lat'], m['gateway_lon'], abs(m['rssi'])]
-        for m in metadata
-    ]
-    return heatmap
+    return heat_points(cached_heatmap_cells(device, precision_for_zoom(zoom)))
 
 def detect_device_restarts(device_id):
     device = Device.objects.get(device_id=device_id)
-    readings = SensorReading.objects.filter(device=device).order_by('timestamp')
-    restarts = []
-
-    prev_fcnt = None
-    for r in readings:
-        if r.f_cnt is not None:
-            if prev_fcnt is not None and r.f_cnt < prev_fcnt:
-                restarts.append({
-                    'timestamp': r.timestamp,
-                    'prev_fcnt': prev_fcnt,
-                    'new_fcnt': r.f_cnt
-                })
-            prev_fcnt = r.f_cnt
-
-    return restarts
+    return analyze_device(device, include_series=False).restarts
+
 
 def detect_temperature_anomalies(device_id, threshold=5.0):
     device = Device.objects.get(device_id=device_id)
-    readings = SensorReading.objects.filter(device=device).order_by('timestamp')
-    anomalies = []
-
-    prev_temp = None
-    for r in readings:
-        temp = r.temperature
-        if temp is not None and prev_temp is not None:
-            if abs(temp - prev_temp) > threshold:
-                anomalies.append({
-                    'timestamp': r.timestamp,
-                    'prev_temp': prev_temp,
-                    'current_temp': temp
-                })
-        if temp is not None:
-            prev_temp = temp
-
-    return anomalies
\ No newline at end of file
+    return analyze_device(device, anomaly_threshold=threshold, include_series=False).anomalies
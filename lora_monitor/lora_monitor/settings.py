@@ -55,8 +55,88 @@ CHANNEL_LAYERS = {
     }
 }
 
+# WebSocket fan-out (devices.fanout): readings for a device are coalesced for
+# WS_FANOUT_WINDOW seconds and each device group gets at most
+# WS_FANOUT_MAX_RATE messages per second, each carrying up to
+# WS_FANOUT_MAX_BATCH readings.
+WS_FANOUT_WINDOW = 0.25
+WS_FANOUT_MAX_RATE = 2.0
+WS_FANOUT_MAX_BATCH = 50
+
 ASGI_APPLICATION = 'lora_monitor.asgi.application'
 
+# Deployment profile of the SQLite database, see DATABASES below:
+# "default" or "high_write" (WAL, persistent connections, single writer).
+DB_PROFILE = os.environ.get('LORA_DB_PROFILE', 'default')
+
+# TTN webhook ingestion
+# "sync" writes every uplink before answering, "queue" answers right after
+# validation and lets a background flusher write uplinks in batches,
+# "writer" hands uplinks to one writer thread that commits whatever is
+# waiting in a single transaction and answers once it is committed.
+INGEST_MODE = os.environ.get('LORA_INGEST_MODE', 'writer' if DB_PROFILE == 'high_write' else 'sync')
+INGEST_QUEUE_SIZE = 10000
+INGEST_BATCH_SIZE = 500
+INGEST_FLUSH_INTERVAL = 1.0  # seconds
+INGEST_ENQUEUE_TIMEOUT = 0.5  # seconds to wait for room before answering 503
+INGEST_WRITER_BATCH_SIZE = 1000  # uplinks committed together at most
+INGEST_WRITER_TIMEOUT = 10.0  # seconds a webhook waits for its commit
+
+# In-process (device_id, dev_eui) -> Device cache used by ingestion
+DEVICE_CACHE_SIZE = 10000
+DEVICE_CACHE_TTL = 300.0  # seconds before a device is reloaded, picking up edits from other processes
+DEVICE_CACHE_NEGATIVE_TTL = 60.0  # seconds an unknown device stays cached
+
+# Uplink keys (device, f_cnt, received_at) remembered in-process so webhook
+# retries are dropped without touching the database.
+DEDUP_RECENT_KEYS = 100000
+
+# Prometheus text metrics at /api/metrics/ (devices.metrics). When set,
+# scrapers must send "Authorization: Bearer <token>".
+METRICS_TOKEN = os.environ.get('LORA_METRICS_TOKEN', '')
+
+# Seconds a binned device heatmap (devices.heatmap) stays in the default
+# cache, i.e. how far it may lag behind new uplinks.
+HEATMAP_CACHE_TIMEOUT = 300
+
+# Keep TTN's uplink_token on gateway metadata rows. Nothing reads it; it is
+# the largest column of the table, so it is dropped unless asked for.
+STORE_UPLINK_TOKENS = os.environ.get('LORA_STORE_UPLINK_TOKENS', '').lower() in ('1', 'true', 'yes')
+
+# Payload codecs (devices.codecs) used when TTN sends no decoded_payload.
+# Device.payload_codec wins over the f_port mapping, which wins over the default.
+DEFAULT_PAYLOAD_CODEC = 'thp_be16'
+PAYLOAD_CODECS_BY_FPORT = {}
+
+# Days raw rows are kept before `manage.py apply_retention` moves them to
+# gzip NDJSON files under ARCHIVE_DIR (devices.retention). Tables without an
+# entry are kept forever.
+RETENTION_POLICIES = {
+    'network_metadata': 30,
+    'sensor_readings': 365,
+}
+ARCHIVE_DIR = BASE_DIR / 'archive'
+
+# Geocoding of Device.address (devices.geocoding). The backend is a dotted
+# path to a class with geocode(address) -> (lat, lon) | None; use
+# devices.geocoding.GazetteerGeocoder with GEOCODER_OPTIONS={"places": {...}}
+# for an offline lookup table.
+GEOCODER_BACKEND = 'devices.geocoding.NominatimGeocoder'
+GEOCODER_OPTIONS = {'user_agent': 'lora_monitor', 'timeout': 10, 'min_delay': 1.0}
+# Geocode in a background thread after saving; False geocodes during the request.
+GEOCODE_IN_BACKGROUND = True
+GEOCODE_QUEUE_SIZE = 1000
+
+# Default anomaly detectors (devices.anomaly), overridable per device
+ANOMALY_DETECTORS = [
+    {"metric": "temperature", "detector": "rate_of_change", "max_delta": 5.0},
+    {"metric": "temperature", "detector": "hampel", "window": 7, "n_sigmas": 4.0},
+    {"metric": "humidity", "detector": "hampel", "window": 7, "n_sigmas": 4.0},
+    {"metric": "pressure", "detector": "hampel", "window": 7, "n_sigmas": 4.0},
+    {"metric": "temperature", "detector": "flatline", "min_run": 24},
+    {"metric": "humidity", "detector": "flatline", "min_run": 24},
+]
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -98,6 +178,24 @@ DATABASES = {
     }
 }
 
+# PRAGMAs run on every new SQLite connection (devices.sqlite). The
+# high_write profile lets readers run alongside the writer (WAL), syncs
+# only at checkpoints, reads through mmap and waits for locks instead of
+# failing with "database is locked". Connections are kept for
+# CONN_MAX_AGE seconds; under ASGI every request gets a fresh thread, so
+# reuse mostly benefits WSGI workers and the ingest writer thread.
+SQLITE_PRAGMAS = {}
+if DB_PROFILE == 'high_write':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('LORA_CONN_MAX_AGE', 600))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'busy_timeout': 20000,  # ms
+        'temp_store': 'MEMORY',
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators